@@ -1,6 +1,8 @@
 const express = require('express');
 const { spawn } = require('child_process');
+const fs = require('fs');
 const path = require('path');
+const readline = require('readline');
 const { auth } = require('../middleware/auth');
 const { body, validationResult } = require('express-validator');
 const mongoose = require('mongoose');
@@ -15,6 +17,269 @@ const Analysis = mongoose.model('Analysis', analysisSchema, 'ai_analysis');
 const mapConfigSchema = new mongoose.Schema({}, { strict: false, timestamps: true });
 const MapConfig = mongoose.model('MapConfig', mapConfigSchema, 'map_configurations');
 
+// Live per-location progress written by the pipeline (one document per location)
+const analysisStatusSchema = new mongoose.Schema({}, { strict: false });
+const AnalysisStatus = mongoose.model('AnalysisStatus', analysisStatusSchema, 'analysis_status');
+
+// Compact latest analysis per location ({_id: location}), maintained by the pipeline
+// as reports land; report_id points at the full report in ai_analysis
+const analysisSummarySchema = new mongoose.Schema({ _id: String }, { strict: false });
+const AnalysisSummary = mongoose.model('AnalysisSummary', analysisSummarySchema, 'analysis_summary');
+
+// Long-lived Python worker (coastal-monitoring-backend/analysis_worker.py).
+// When unset, each request spawns the analysis script instead.
+const ANALYSIS_WORKER_URL = process.env.ANALYSIS_WORKER_URL;
+const ANALYSIS_TIMEOUT_MS = 5 * 60 * 1000;
+const ANALYSIS_POLL_INTERVAL_MS = 1000;
+
+// Monitored regions come from the registry file shared with the Python pipeline
+const REGION_REGISTRY_PATH = process.env.REGION_REGISTRY_PATH ||
+  path.join(__dirname, '../../coastal-monitoring-backend/regions.geojson');
+
+const loadRegionNames = () => {
+  try {
+    const registry = JSON.parse(fs.readFileSync(REGION_REGISTRY_PATH, 'utf8'));
+    return registry.features.map(feature => feature.properties.name);
+  } catch (error) {
+    console.error('Failed to load region registry:', error.message);
+    return ['Sunderbans', 'Pulicat Lake', 'Goa Coast', 'Kochi'];
+  }
+};
+
+const validLocations = loadRegionNames();
+
+// Fetch the latest stored analysis and map configuration for each location
+const fetchLatestResults = async (requestedLocations) => {
+  // The summaries name each location's latest report, so the reports are fetched by id
+  const summaries = await AnalysisSummary.find({ _id: { $in: requestedLocations } }, { report_id: 1 }).lean();
+  const reportIds = summaries.map(summary => summary.report_id).filter(Boolean);
+  const reports = reportIds.length > 0 ? await Analysis.find({ _id: { $in: reportIds } }) : [];
+  const reportsByLocation = new Map(reports.map(report => [report.get('location'), report]));
+
+  const latestAnalysis = [];
+  for (const location of requestedLocations) {
+    // Locations analysed before summaries existed fall back to the newest report
+    const locationAnalysis = reportsByLocation.get(location) ||
+      await Analysis.findOne({ location: location }).sort({ timestamp: -1 });
+    if (locationAnalysis) {
+      latestAnalysis.push(locationAnalysis);
+    }
+  }
+
+  // The pipeline keeps one map configuration per location
+  const mapConfigs = await MapConfig.find({ location: { $in: requestedLocations } });
+
+  return { latestAnalysis, mapConfigs };
+};
+
+// Clients ask for progress with ?stream=true or Accept: application/x-ndjson
+const wantsStream = (req) =>
+  req.query.stream === 'true' || (req.get('Accept') || '').includes('application/x-ndjson');
+
+const startStream = (res) => {
+  res.status(200);
+  res.set({
+    'Content-Type': 'application/x-ndjson',
+    'Cache-Control': 'no-cache',
+    'X-Accel-Buffering': 'no'
+  });
+  res.flushHeaders();
+};
+
+const writeStreamLine = (res, payload) => {
+  res.write(`${JSON.stringify(payload)}\n`);
+  // compression() buffers output until flushed
+  if (typeof res.flush === 'function') {
+    res.flush();
+  }
+};
+
+// Final response: a JSON body, or the closing line of an NDJSON stream
+const sendAnalysisResponse = (res, streaming, statusCode, body) => {
+  if (res.writableEnded) {
+    return;
+  }
+  if (streaming) {
+    writeStreamLine(res, { type: 'result', status_code: statusCode, ...body });
+    return res.end();
+  }
+  res.status(statusCode).json(body);
+};
+
+// Collects pipeline progress events for one request and relays them when streaming
+const createProgressTracker = (requestedLocations, res, streaming) => {
+  const completedLocations = new Set();
+  return {
+    completedLocations,
+    handle(event) {
+      if (event.type === 'region_completed') {
+        completedLocations.add(event.location);
+      }
+      if (streaming && !res.writableEnded) {
+        writeStreamLine(res, { type: 'progress', event });
+      }
+    },
+    pendingLocations() {
+      return requestedLocations.filter(location => !completedLocations.has(location));
+    }
+  };
+};
+
+// Respond with the regions that finished before the run stopped
+const sendPartialResults = async (res, streaming, tracker, requestedLocations, statusCode, message, extra = {}) => {
+  const completed = [...tracker.completedLocations];
+  const { latestAnalysis, mapConfigs } = completed.length > 0
+    ? await fetchLatestResults(completed)
+    : { latestAnalysis: [], mapConfigs: [] };
+
+  sendAnalysisResponse(res, streaming, statusCode, {
+    success: false,
+    partial: true,
+    message: `${message}; ${completed.length} of ${requestedLocations.length} locations completed`,
+    data: {
+      analysis_results: latestAnalysis,
+      map_configurations: mapConfigs,
+      processed_locations: completed,
+      pending_locations: tracker.pendingLocations(),
+      total_analyses: latestAnalysis.length,
+      ...extra
+    }
+  });
+};
+
+// Call the analysis worker over its local HTTP API
+const callAnalysisWorker = async (path, options = {}, timeoutMs = 10000) => {
+  const controller = new AbortController();
+  const timer = setTimeout(() => controller.abort(), timeoutMs);
+  try {
+    const response = await fetch(`${ANALYSIS_WORKER_URL}${path}`, {
+      ...options,
+      headers: { 'Content-Type': 'application/json', ...(options.headers || {}) },
+      signal: controller.signal
+    });
+    const payload = await response.json();
+    return { status: response.status, ok: response.ok, payload };
+  } finally {
+    clearTimeout(timer);
+  }
+};
+
+// Run the analysis on the warm worker; ?async=true returns the job id immediately.
+// Otherwise the job's progress events are polled until it finishes or times out.
+const runWorkerAnalysis = async (req, res, requestedLocations) => {
+  const streaming = wantsStream(req);
+  let job;
+
+  try {
+    const { status, ok, payload } = await callAnalysisWorker('/jobs', {
+      method: 'POST',
+      body: JSON.stringify({
+        locations: requestedLocations,
+        priority: Number(req.body.priority) || 0,
+        wait: false
+      })
+    });
+
+    if (!ok) {
+      return res.status(status).json({
+        success: false,
+        message: payload.error || 'Analysis worker rejected the request'
+      });
+    }
+    job = payload;
+  } catch (error) {
+    console.error('Analysis worker error:', error);
+    return res.status(502).json({
+      success: false,
+      message: 'Analysis worker unavailable',
+      error: error.message
+    });
+  }
+
+  if (req.query.async === 'true') {
+    return res.status(202).json({
+      success: true,
+      message: 'GEE analysis queued',
+      data: {
+        job_id: job.job_id,
+        status: job.status,
+        processed_locations: requestedLocations
+      }
+    });
+  }
+
+  const tracker = createProgressTracker(requestedLocations, res, streaming);
+  if (streaming) {
+    startStream(res);
+    writeStreamLine(res, { type: 'job', job_id: job.job_id, status: job.status });
+  }
+
+  let clientClosed = false;
+  res.on('close', () => { clientClosed = true; });
+
+  const deadline = Date.now() + ANALYSIS_TIMEOUT_MS;
+  let lastSeq = 0;
+  let jobStatus = job.status;
+
+  try {
+    while (jobStatus !== 'completed' && jobStatus !== 'failed') {
+      if (clientClosed) {
+        // The job keeps running on the worker; its results still land in MongoDB
+        return;
+      }
+      if (Date.now() >= deadline) {
+        return sendPartialResults(res, streaming, tracker, requestedLocations, 408,
+          'Python analysis timed out (5 minutes limit)', { job_id: job.job_id });
+      }
+      await new Promise(resolve => setTimeout(resolve, ANALYSIS_POLL_INTERVAL_MS));
+
+      const { payload } = await callAnalysisWorker(`/jobs/${encodeURIComponent(job.job_id)}/events?after=${lastSeq}`);
+      payload.events.forEach(event => tracker.handle(event));
+      lastSeq = payload.last_seq;
+      jobStatus = payload.status;
+    }
+
+    const { payload: finishedJob } = await callAnalysisWorker(`/jobs/${encodeURIComponent(job.job_id)}`);
+    if (finishedJob.status === 'failed') {
+      return sendAnalysisResponse(res, streaming, 500, {
+        success: false,
+        message: 'Python analysis failed',
+        error: finishedJob.error
+      });
+    }
+
+    const { latestAnalysis, mapConfigs } = await fetchLatestResults(requestedLocations);
+
+    sendAnalysisResponse(res, streaming, 200, {
+      success: true,
+      message: 'GEE analysis completed successfully',
+      data: {
+        analysis_results: latestAnalysis,
+        map_configurations: mapConfigs,
+        processed_locations: requestedLocations,
+        failed_locations: finishedJob.failed_locations,
+        skipped_locations: finishedJob.skipped_locations,
+        total_analyses: latestAnalysis.length,
+        job_id: job.job_id,
+        duration_seconds: finishedJob.duration_seconds
+      }
+    });
+
+  } catch (error) {
+    console.error('Analysis worker error:', error);
+    try {
+      await sendPartialResults(res, streaming, tracker, requestedLocations, 502,
+        `Analysis worker unavailable: ${error.message}`, { job_id: job.job_id });
+    } catch (dbError) {
+      sendAnalysisResponse(res, streaming, 502, {
+        success: false,
+        message: 'Analysis worker unavailable',
+        error: error.message
+      });
+    }
+  }
+};
+
 // @desc    Run Python GEE analysis
 // @route   POST /api/gee/analyze
 // @access  Private (Authority only)
@@ -33,7 +298,6 @@ const runGeeAnalysis = async (req, res) => {
     const { locations } = req.body;
     
     // Validate locations
-    const validLocations = ['Sunderbans', 'Pulicat Lake', 'Goa Coast', 'Kochi'];
     const requestedLocations = locations || validLocations;
     
     const invalidLocations = requestedLocations.filter(loc => !validLocations.includes(loc));
@@ -44,23 +308,46 @@ const runGeeAnalysis = async (req, res) => {
       });
     }
 
+    if (ANALYSIS_WORKER_URL) {
+      return runWorkerAnalysis(req, res, requestedLocations);
+    }
+
     // Path to Python script
     const pythonScriptPath = path.join(__dirname, '../../coastal-monitoring-backend/coastal_ai_analyst_fixed_1.py');
     
     console.log('Starting Python GEE analysis...');
+
+    const streaming = wantsStream(req);
+    const tracker = createProgressTracker(requestedLocations, res, streaming);
     
-    // Run Python script as child process
-    const pythonProcess = spawn('python', [pythonScriptPath], {
+    // Run Python script as child process for the requested locations only.
+    // fd 3 carries its progress events as newline-delimited JSON.
+    const pythonProcess = spawn('python', [pythonScriptPath, ...requestedLocations], {
       env: {
         ...process.env,
         MONGODB_URI: process.env.MONGODB_URI,
-        GROQ_API_KEY: process.env.GROQ_API_KEY
+        GROQ_API_KEY: process.env.GROQ_API_KEY,
+        ANALYSIS_PROGRESS_FD: '3'
       },
-      cwd: path.dirname(pythonScriptPath)
+      cwd: path.dirname(pythonScriptPath),
+      stdio: ['ignore', 'pipe', 'pipe', 'pipe']
+    });
+
+    if (streaming) {
+      startStream(res);
+    }
+
+    readline.createInterface({ input: pythonProcess.stdio[3] }).on('line', (line) => {
+      try {
+        tracker.handle(JSON.parse(line));
+      } catch (error) {
+        console.error('Invalid progress event from Python:', line);
+      }
     });
 
     let outputData = '';
     let errorData = '';
+    let timedOut = false;
 
     pythonProcess.stdout.on('data', (data) => {
       const output = data.toString();
@@ -76,11 +363,19 @@ const runGeeAnalysis = async (req, res) => {
 
     pythonProcess.on('close', async (code) => {
       clearTimeout(timeout); // Clear timeout first
+      if (timedOut) {
+        return;
+      }
       
       if (code !== 0) {
         console.error(`Python process exited with code ${code}`);
         console.error('Python stderr:', errorData);
-        return res.status(500).json({
+        if (tracker.completedLocations.size > 0) {
+          return sendPartialResults(res, streaming, tracker, requestedLocations, 500,
+            'Python analysis failed', { error: errorData, output: outputData })
+            .catch(dbError => console.error('Database error after Python failure:', dbError));
+        }
+        return sendAnalysisResponse(res, streaming, 500, {
           success: false,
           message: 'Python analysis failed',
           error: errorData,
@@ -94,32 +389,13 @@ const runGeeAnalysis = async (req, res) => {
         // Wait a moment for any final DB writes to complete
         await new Promise(resolve => setTimeout(resolve, 2000));
         
-        // Fetch the latest analysis results from MongoDB for each location
-        const latestAnalysis = [];
-        for (const location of requestedLocations) {
-          const locationAnalysis = await Analysis.findOne({
-            location: location
-          }).sort({ createdAt: -1 });
-          if (locationAnalysis) {
-            latestAnalysis.push(locationAnalysis);
-          }
-        }
-
-        // Fetch the latest map configurations for each location
-        const mapConfigs = [];
-        for (const location of requestedLocations) {
-          const locationMapConfig = await MapConfig.findOne({
-            location: location
-          }).sort({ createdAt: -1 });
-          if (locationMapConfig) {
-            mapConfigs.push(locationMapConfig);
-          }
-        }
+        // Fetch the latest analysis results and map configurations from MongoDB
+        const { latestAnalysis, mapConfigs } = await fetchLatestResults(requestedLocations);
 
         console.log(`Found ${latestAnalysis.length} analysis results for locations:`, requestedLocations);
         console.log(`Found ${mapConfigs.length} map configurations`);
 
-        res.json({
+        sendAnalysisResponse(res, streaming, 200, {
           success: true,
           message: 'GEE analysis completed successfully',
           data: {
@@ -133,7 +409,7 @@ const runGeeAnalysis = async (req, res) => {
 
       } catch (dbError) {
         console.error('Database error after Python execution:', dbError);
-        res.status(500).json({
+        sendAnalysisResponse(res, streaming, 500, {
           success: false,
           message: 'Python analysis completed but failed to retrieve results from database',
           error: dbError.message
@@ -144,22 +420,29 @@ const runGeeAnalysis = async (req, res) => {
     pythonProcess.on('error', (error) => {
       clearTimeout(timeout);
       console.error('Failed to start Python process:', error);
-      res.status(500).json({
+      sendAnalysisResponse(res, streaming, 500, {
         success: false,
         message: 'Failed to start Python analysis',
         error: error.message
       });
     });
 
-    // Set timeout for long-running process (5 minutes)
+    // Set timeout for long-running process (5 minutes); regions that already
+    // finished are saved, so return them alongside the ones still pending
     const timeout = setTimeout(() => {
+      timedOut = true;
       pythonProcess.kill('SIGTERM');
-      res.status(408).json({
-        success: false,
-        message: 'Python analysis timed out (5 minutes limit)',
-        partial_output: outputData
-      });
-    }, 5 * 60 * 1000);
+      sendPartialResults(res, streaming, tracker, requestedLocations, 408,
+        'Python analysis timed out (5 minutes limit)', { partial_output: outputData })
+        .catch((dbError) => {
+          console.error('Database error after Python timeout:', dbError);
+          sendAnalysisResponse(res, streaming, 408, {
+            success: false,
+            message: 'Python analysis timed out (5 minutes limit)',
+            partial_output: outputData
+          });
+        });
+    }, ANALYSIS_TIMEOUT_MS);
 
   } catch (error) {
     console.error('GEE analysis error:', error);
@@ -171,18 +454,27 @@ const runGeeAnalysis = async (req, res) => {
   }
 };
 
-// @desc    Get latest analysis results
+// @desc    Get latest analysis results (one summary per location; `?full=true` for the full reports)
 // @route   GET /api/gee/results
 // @access  Private
 const getAnalysisResults = async (req, res) => {
   try {
-    const { location, limit = 10 } = req.query;
+    const { location, limit = 10, full } = req.query;
     
     const query = location ? { location } : {};
     
-    const results = await Analysis.find(query)
-      .sort({ createdAt: -1 })
-      .limit(parseInt(limit));
+    const summaries = await AnalysisSummary.find(location ? { _id: location } : {})
+      .sort({ timestamp: -1 })
+      .limit(parseInt(limit))
+      .lean();
+
+    let results = summaries;
+    if (full === 'true') {
+      const reportIds = summaries.map(summary => summary.report_id).filter(Boolean);
+      results = reportIds.length > 0
+        ? await Analysis.find({ _id: { $in: reportIds } }).sort({ timestamp: -1 })
+        : [];
+    }
 
     const mapConfigs = await MapConfig.find(query)
       .sort({ createdAt: -1 })
@@ -212,26 +504,33 @@ const getAnalysisResults = async (req, res) => {
 // @access  Private
 const getAnalysisStatus = async (req, res) => {
   try {
-    const latestAnalyses = await Analysis.aggregate([
-      {
-        $group: {
-          _id: '$location',
-          latest_analysis: { $last: '$$ROOT' },
-          count: { $sum: 1 }
-        }
-      }
-    ]);
+    const summaries = await AnalysisSummary.find({}, {
+      threat_level: 1, timestamp: 1, anomaly_count: 1, analysis_count: 1
+    }).lean();
+
+    const liveStatus = await AnalysisStatus.find({}).sort({ updated_at: -1 });
 
     const status = {
-      locations_analyzed: latestAnalyses.length,
-      total_analyses: latestAnalyses.reduce((sum, item) => sum + item.count, 0),
-      last_updated: latestAnalyses.length > 0 ? 
-        Math.max(...latestAnalyses.map(item => new Date(item.latest_analysis.createdAt))) : null,
-      locations: latestAnalyses.map(item => ({
+      locations_analyzed: summaries.length,
+      total_analyses: summaries.reduce((sum, item) => sum + (item.analysis_count || 0), 0),
+      last_updated: summaries.length > 0 ? 
+        Math.max(...summaries.map(item => new Date(item.timestamp))) : null,
+      locations: summaries.map(item => ({
         location: item._id,
-        threat_level: item.latest_analysis.threat_level,
-        last_analysis: item.latest_analysis.createdAt,
-        anomaly_count: item.latest_analysis.anomaly_count || 0
+        threat_level: item.threat_level,
+        last_analysis: item.timestamp,
+        anomaly_count: item.anomaly_count || 0
+      })),
+      running: liveStatus.filter(doc => doc.get('status') === 'running').map(doc => doc.get('location')),
+      live_status: liveStatus.map(doc => ({
+        location: doc.get('location'),
+        status: doc.get('status'),
+        stage: doc.get('stage'),
+        job_id: doc.get('job_id'),
+        started_at: doc.get('started_at'),
+        updated_at: doc.get('updated_at'),
+        finished_at: doc.get('finished_at'),
+        error: doc.get('error')
       }))
     };
 
@@ -250,6 +549,127 @@ const getAnalysisStatus = async (req, res) => {
   }
 };
 
+// @desc    Get analysis job status from the worker
+// @route   GET /api/gee/jobs/:jobId
+// @access  Private
+const getAnalysisJob = async (req, res) => {
+  if (!ANALYSIS_WORKER_URL) {
+    return res.status(404).json({
+      success: false,
+      message: 'Analysis worker is not configured'
+    });
+  }
+
+  try {
+    const { status, ok, payload } = await callAnalysisWorker(`/jobs/${encodeURIComponent(req.params.jobId)}`);
+    if (!ok) {
+      return res.status(status).json({
+        success: false,
+        message: payload.error || 'Failed to get analysis job'
+      });
+    }
+
+    res.json({
+      success: true,
+      data: payload
+    });
+
+  } catch (error) {
+    console.error('Get analysis job error:', error);
+    res.status(502).json({
+      success: false,
+      message: 'Analysis worker unavailable',
+      error: error.message
+    });
+  }
+};
+
+// @desc    Get progress events of an analysis job newer than ?after=<seq>
+// @route   GET /api/gee/jobs/:jobId/events
+// @access  Private
+const getAnalysisJobEvents = async (req, res) => {
+  if (!ANALYSIS_WORKER_URL) {
+    return res.status(404).json({
+      success: false,
+      message: 'Analysis worker is not configured'
+    });
+  }
+
+  try {
+    const after = Number.parseInt(req.query.after, 10) || 0;
+    const { status, ok, payload } = await callAnalysisWorker(
+      `/jobs/${encodeURIComponent(req.params.jobId)}/events?after=${after}`
+    );
+    if (!ok) {
+      return res.status(status).json({
+        success: false,
+        message: payload.error || 'Failed to get analysis job events'
+      });
+    }
+
+    res.json({
+      success: true,
+      data: payload
+    });
+
+  } catch (error) {
+    console.error('Get analysis job events error:', error);
+    res.status(502).json({
+      success: false,
+      message: 'Analysis worker unavailable',
+      error: error.message
+    });
+  }
+};
+
+// @desc    List monitored regions, or find the regions containing a point / bbox
+// @route   GET /api/gee/regions?lat=..&lon=.. or ?bbox=west,south,east,north
+// @access  Public
+const getRegions = async (req, res) => {
+  const { lat, lon, bbox } = req.query;
+  const isLookup = (lat !== undefined && lon !== undefined) || bbox !== undefined;
+
+  if (!isLookup) {
+    return res.json({
+      success: true,
+      data: { regions: validLocations }
+    });
+  }
+
+  if (!ANALYSIS_WORKER_URL) {
+    return res.status(404).json({
+      success: false,
+      message: 'Region lookup needs the analysis worker'
+    });
+  }
+
+  try {
+    const query = bbox !== undefined
+      ? `bbox=${encodeURIComponent(bbox)}`
+      : `lat=${encodeURIComponent(lat)}&lon=${encodeURIComponent(lon)}`;
+    const { status, ok, payload } = await callAnalysisWorker(`/regions?${query}`);
+    if (!ok) {
+      return res.status(status).json({
+        success: false,
+        message: payload.error || 'Region lookup failed'
+      });
+    }
+
+    res.json({
+      success: true,
+      data: payload
+    });
+
+  } catch (error) {
+    console.error('Region lookup error:', error);
+    res.status(502).json({
+      success: false,
+      message: 'Analysis worker unavailable',
+      error: error.message
+    });
+  }
+};
+
 // Validation middleware for analysis request
 const validateAnalysisRequest = [
   body('locations')
@@ -258,7 +678,7 @@ const validateAnalysisRequest = [
     .withMessage('Locations must be an array'),
   body('locations.*')
     .optional()
-    .isIn(['Sunderbans', 'Pulicat Lake', 'Goa Coast', 'Kochi'])
+    .isIn(validLocations)
     .withMessage('Invalid location specified')
 ];
 
@@ -266,5 +686,8 @@ const validateAnalysisRequest = [
 router.post('/analyze', validateAnalysisRequest, runGeeAnalysis); // Temporarily removing auth for testing
 router.get('/results', getAnalysisResults); // Temporarily removing auth for testing
 router.get('/status', getAnalysisStatus); // Temporarily removing auth for testing
+router.get('/jobs/:jobId', getAnalysisJob);
+router.get('/jobs/:jobId/events', getAnalysisJobEvents);
+router.get('/regions', getRegions);
 
 module.exports = router;
@@ -68,6 +68,12 @@ if (process.env.NODE_ENV === 'development') {
 // Static file serving for uploads
 app.use('/uploads', express.static(path.join(__dirname, 'uploads')));
 
+// Map layer tiles pre-rendered by the analysis pipeline. Paths are content
+// hashes, so a file never changes and browsers can cache it indefinitely.
+const TILE_STORE_DIR = process.env.TILE_STORE_DIR ||
+  path.join(__dirname, '../coastal-monitoring-backend/tiles');
+app.use('/tiles', express.static(TILE_STORE_DIR, { immutable: true, maxAge: '365d' }));
+
 // Health check endpoint
 app.get('/api/health', (req, res) => {
   res.json({
@@ -0,0 +1,383 @@
+# analysis_worker.py
+"""Long-lived analysis worker
+
+Keeps one CoastalAIAnalyst warm (Earth Engine session, MongoDB pool,
+caches) and accepts jobs over a small local HTTP API:
+
+    POST /jobs        {"locations": [...], "incremental": false, "priority": 0, "wait": false}
+    GET  /jobs/<id>   job status and structured results
+    GET  /jobs/<id>/events?after=<seq>
+                      progress events (month extracted, anomalies scored,
+                      insight ready, saved, ...) newer than seq
+    GET  /jobs        recent jobs
+    GET  /health      worker status, known regions and queue counts
+    GET  /regions     monitored regions; ?lon=&lat= or ?bbox=w,s,e,n to look up
+
+Each request fans out into one queued job per location (job_scheduler.py).
+Identical location/parameter jobs already queued or running are shared,
+so concurrent requests for the same region run the pipeline once.
+
+    python analysis_worker.py --port 8787
+"""
+import argparse
+import json
+import os
+import threading
+import uuid
+from collections import deque
+from datetime import datetime
+from urllib.parse import parse_qs
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import instrumentation
+from coastal_ai_analyst_fixed_1 import CoastalAIAnalyst
+from job_scheduler import JobScheduler, SQLiteJobBroker
+from mongo_sink import to_bson
+from progress import add_listener, remove_listener
+
+JOB_OPTIONS = ('incremental', 'tile_size', 'batched', 'years', 'start_month', 'end_month')
+FINISHED = ('completed', 'failed')
+
+
+def is_number(value):
+    return isinstance(value, (int, float)) and not isinstance(value, bool)
+
+
+def validate_month(value):
+    if (not isinstance(value, (list, tuple)) or len(value) != 2
+            or not all(isinstance(part, int) and not isinstance(part, bool) for part in value)
+            or not 1 <= value[1] <= 12):
+        raise ValueError("months must be [year, month] pairs")
+    return list(value)
+
+
+def parse_job_request(body, default_locations):
+    """Validate a POST /jobs body; returns (locations, priority, options, wait, timeout)
+
+    Raises ValueError for anything the pipeline would only reject once the
+    job is running.
+    """
+    if not isinstance(body, dict):
+        raise ValueError("Request body must be a JSON object")
+
+    locations = body.get('locations') or default_locations
+    if not isinstance(locations, list) or not all(isinstance(location, str) for location in locations):
+        raise ValueError("locations must be a list of region names")
+
+    priority = body.get('priority', 0)
+    if not isinstance(priority, int) or isinstance(priority, bool):
+        raise ValueError("priority must be an integer")
+
+    options = {key: body[key] for key in JOB_OPTIONS if key in body and body[key] is not None}
+    for key in ('incremental', 'batched'):
+        if key in options and not isinstance(options[key], bool):
+            raise ValueError(f"{key} must be true or false")
+    if 'years' in options and not (isinstance(options['years'], int) and not isinstance(options['years'], bool)
+                                   and options['years'] > 0):
+        raise ValueError("years must be a positive integer")
+    if 'tile_size' in options and not (is_number(options['tile_size']) and options['tile_size'] > 0):
+        raise ValueError("tile_size must be a positive number of degrees")
+    for key in ('start_month', 'end_month'):
+        if key in options:
+            options[key] = validate_month(options[key])
+    if 'start_month' in options and 'end_month' in options and options['start_month'] > options['end_month']:
+        raise ValueError("start_month must not be after end_month")
+
+    wait = body.get('wait', False)
+    if not isinstance(wait, bool):
+        raise ValueError("wait must be true or false")
+    timeout = body.get('timeout')
+    if timeout is not None and not (is_number(timeout) and timeout >= 0):
+        raise ValueError("timeout must be a non-negative number of seconds")
+    return locations, priority, options, wait, timeout
+
+
+class AnalysisWorker:
+    """Runs analysis jobs on a shared, warm CoastalAIAnalyst
+
+    max_jobs caps how many locations run against Earth Engine at once.
+    """
+
+    def __init__(self, analyst=None, max_jobs=2, max_history=200, broker=None, max_events=500):
+        self.analyst = analyst or CoastalAIAnalyst()
+        self.scheduler = JobScheduler(self.run_location, broker or SQLiteJobBroker(
+            max_attempts=int(os.getenv('JOB_MAX_ATTEMPTS', '3')),
+            base_retry_delay=float(os.getenv('JOB_RETRY_DELAY_SECONDS', '30'))
+        ), max_concurrent=max_jobs)
+        self.jobs = {}
+        self.max_history = max_history
+        self.lock = threading.Lock()
+        # Recent progress events per scheduled location job
+        self.events = {}
+        self.max_events = max_events
+        add_listener(self.record_event)
+        self.started_at = datetime.now()
+        self.scheduler.start()
+
+    def warm_up(self):
+        """Initialize Earth Engine and MongoDB before the first job arrives"""
+        try:
+            self.analyst.regions
+            self.analyst.client
+            print("Worker warm: Earth Engine and MongoDB ready")
+        except Exception as e:
+            print(f"Warm-up incomplete, will retry on first job: {e}")
+
+    def submit(self, locations, priority=0, **options):
+        unknown = [location for location in locations if location not in self.analyst.region_bounds]
+        if unknown:
+            raise ValueError(f"Invalid locations: {', '.join(unknown)}")
+
+        job = {
+            'job_id': uuid.uuid4().hex,
+            'locations': list(locations),
+            'options': options,
+            'priority': priority,
+            'submitted_at': datetime.now().isoformat(),
+            'location_jobs': {
+                location: self.scheduler.submit(location, options, priority) for location in locations
+            }
+        }
+        with self.lock:
+            self.jobs[job['job_id']] = job
+            self.trim_history()
+        return job
+
+    def run_location(self, location, **options):
+        """Scheduler callback: one pipeline run, with errors raised so they are retried"""
+        result = self.analyst.run_complete_analysis_pipeline(location, raise_errors=True, **options)
+        self.analyst.flush_results()
+        return self.summarize(result) if result else None
+
+    @staticmethod
+    def summarize(result):
+        """JSON-ready copy of a pipeline result"""
+        return json.loads(json.dumps(to_bson(result), default=str))
+
+    def record_event(self, event):
+        """Progress listener: keep events published inside scheduled jobs"""
+        job_id = event.get('job_id')
+        if job_id is None:
+            return
+        with self.lock:
+            if job_id not in self.events:
+                self.events[job_id] = deque(maxlen=self.max_events)
+                # Forget the oldest jobs' events along with their history
+                for stale in list(self.events)[:max(0, len(self.events) - self.max_history * 4)]:
+                    del self.events[stale]
+            self.events[job_id].append(event)
+
+    def job_events(self, job, after=0):
+        """Events of a request's location jobs with seq > after, oldest first"""
+        with self.lock:
+            events = [event for job_id in job['location_jobs'].values()
+                      for event in self.events.get(job_id, ()) if event['seq'] > after]
+        return sorted(events, key=lambda event: event['seq'])
+
+    def get(self, job_id):
+        with self.lock:
+            return self.jobs.get(job_id)
+
+    def wait(self, job, timeout=None):
+        self.scheduler.wait(list(job['location_jobs'].values()), timeout=timeout)
+        return job
+
+    def trim_history(self):
+        for job_id in list(self.jobs)[:max(0, len(self.jobs) - self.max_history)]:
+            del self.jobs[job_id]
+
+    def public(self, job):
+        """Job status aggregated from the scheduled per-location jobs"""
+        scheduled = {location: self.scheduler.broker.get(job_id)
+                     for location, job_id in job['location_jobs'].items()}
+        statuses = [entry['status'] if entry else 'failed' for entry in scheduled.values()]
+
+        if all(status in FINISHED for status in statuses):
+            status = 'failed' if all(s == 'failed' for s in statuses) else 'completed'
+        elif any(status != 'queued' for status in statuses):
+            status = 'running'
+        else:
+            status = 'queued'
+
+        results = {location: entry['result'] for location, entry in scheduled.items()
+                   if entry and entry['status'] == 'completed' and entry['result']}
+        # Pipeline errors are raised and retried, so a completed job without a
+        # result is a location the pipeline skipped (e.g. no new months)
+        skipped = {location: self.skip_reason(job['location_jobs'][location])
+                   for location, entry in scheduled.items()
+                   if entry and entry['status'] == 'completed' and not entry['result']}
+        errors = {location: entry['error'] for location, entry in scheduled.items()
+                  if entry and entry['status'] == 'failed'}
+        started = [entry['started_at'] for entry in scheduled.values() if entry and entry['started_at']]
+        finished = [entry['finished_at'] for entry in scheduled.values() if entry and entry['finished_at']]
+        done = status in FINISHED and finished
+
+        return {
+            'job_id': job['job_id'],
+            'status': status,
+            'locations': job['locations'],
+            'options': job['options'],
+            'priority': job['priority'],
+            'submitted_at': job['submitted_at'],
+            'started_at': datetime.fromtimestamp(min(started)).isoformat() if started else None,
+            'finished_at': datetime.fromtimestamp(max(finished)).isoformat() if done else None,
+            'duration_seconds': round(max(finished) - min(started), 2) if done and started else None,
+            'results': results,
+            'failed_locations': [location for location in job['locations']
+                                 if status in FINISHED and location not in results and location not in skipped],
+            'skipped_locations': skipped,
+            'error': '; '.join(f'{location}: {error}' for location, error in errors.items()) or None,
+            'location_jobs': {
+                location: {
+                    'job_id': job['location_jobs'][location],
+                    'status': 'skipped' if location in skipped else entry['status'] if entry else 'missing',
+                    'attempts': entry['attempts'] if entry else 0,
+                    'stage': self.latest_stage(job['location_jobs'][location])
+                }
+                for location, entry in scheduled.items()
+            }
+        }
+
+    def skip_reason(self, location_job_id):
+        """Reason of the location job's region_skipped event, if it is still held"""
+        with self.lock:
+            for event in reversed(self.events.get(location_job_id, ())):
+                if event['type'] == 'region_skipped':
+                    return event.get('reason')
+        return None
+
+    def latest_stage(self, location_job_id):
+        with self.lock:
+            events = self.events.get(location_job_id)
+            return events[-1]['type'] if events else None
+
+    def find_regions(self, query):
+        """Regions containing a point or intersecting a bbox; all regions without a query"""
+        registry = self.analyst.registry
+        if 'lon' in query and 'lat' in query:
+            names = registry.query_point(float(query['lon'][0]), float(query['lat'][0]))
+        elif 'bbox' in query:
+            bbox = [float(value) for value in query['bbox'][0].split(',')]
+            if len(bbox) != 4:
+                raise ValueError("bbox must be west,south,east,north")
+            names = registry.query_bbox(bbox)
+        else:
+            names = registry.names
+        return [registry.summary(name) for name in names]
+
+    def health(self):
+        return {
+            'status': 'ok',
+            'started_at': self.started_at.isoformat(),
+            'regions': sorted(self.analyst.region_bounds),
+            'max_concurrent_jobs': self.scheduler.max_concurrent,
+            'jobs': self.scheduler.broker.counts(),
+            'metrics': instrumentation.snapshot()
+        }
+
+    def close(self):
+        remove_listener(self.record_event)
+        self.scheduler.stop()
+        self.analyst.close()
+
+
+def make_handler(worker):
+    class WorkerRequestHandler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            path, _, query = self.path.partition('?')
+            path = path.rstrip('/')
+            if path == '/health':
+                self.send_json(200, worker.health())
+            elif path == '/regions':
+                try:
+                    self.send_json(200, {'regions': worker.find_regions(parse_qs(query))})
+                except ValueError as e:
+                    self.send_json(400, {'error': str(e)})
+            elif path == '/jobs':
+                with worker.lock:
+                    jobs = list(worker.jobs.values())[-50:]
+                self.send_json(200, {'jobs': [worker.public(job) for job in jobs]})
+            elif path.startswith('/jobs/') and path.endswith('/events'):
+                job = worker.get(path.split('/')[-2])
+                if job is None:
+                    self.send_json(404, {'error': 'Job not found'})
+                    return
+                try:
+                    after = int(parse_qs(query).get('after', ['0'])[0])
+                except ValueError:
+                    self.send_json(400, {'error': 'after must be an integer'})
+                    return
+                # Status first, so a finished job's final events are always included
+                status = worker.public(job)['status']
+                events = worker.job_events(job, after)
+                self.send_json(200, {
+                    'job_id': job['job_id'],
+                    'status': status,
+                    'events': events,
+                    'last_seq': events[-1]['seq'] if events else after
+                })
+            elif path.startswith('/jobs/'):
+                job = worker.get(path.split('/')[-1])
+                if job is None:
+                    self.send_json(404, {'error': 'Job not found'})
+                else:
+                    self.send_json(200, worker.public(job))
+            else:
+                self.send_json(404, {'error': 'Not found'})
+
+        def do_POST(self):
+            if self.path.split('?')[0].rstrip('/') != '/jobs':
+                self.send_json(404, {'error': 'Not found'})
+                return
+            try:
+                length = int(self.headers.get('Content-Length', 0))
+                body = json.loads(self.rfile.read(length) or b'{}')
+                locations, priority, options, wait, timeout = parse_job_request(
+                    body, sorted(worker.analyst.region_bounds)
+                )
+                job = worker.submit(locations, priority=priority, **options)
+            except (ValueError, TypeError) as e:
+                self.send_json(400, {'error': str(e)})
+                return
+
+            if wait:
+                worker.wait(job, timeout=timeout)
+                self.send_json(200, worker.public(job))
+            else:
+                self.send_json(202, worker.public(job))
+
+        def send_json(self, status, payload):
+            data = json.dumps(payload, default=str).encode('utf-8')
+            self.send_response(status)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def log_message(self, format, *args):
+            print(f"[worker] {self.address_string()} {format % args}")
+
+    return WorkerRequestHandler
+
+
+def serve(host='127.0.0.1', port=8787, max_jobs=2):
+    worker = AnalysisWorker(max_jobs=max_jobs)
+    threading.Thread(target=worker.warm_up, daemon=True).start()
+    server = ThreadingHTTPServer((host, port), make_handler(worker))
+    print(f"Analysis worker listening on http://{host}:{port}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        worker.close()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Coastal analysis worker service')
+    parser.add_argument('--host', default=os.getenv('ANALYSIS_WORKER_HOST', '127.0.0.1'))
+    parser.add_argument('--port', type=int, default=int(os.getenv('ANALYSIS_WORKER_PORT', '8787')))
+    parser.add_argument('--max-jobs', type=int, default=int(os.getenv('ANALYSIS_WORKER_JOBS', '2')))
+    args = parser.parse_args()
+    serve(args.host, args.port, args.max_jobs)
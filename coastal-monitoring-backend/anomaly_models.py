@@ -0,0 +1,224 @@
+# anomaly_models.py
+"""Persisted anomaly models: fit once per location, then score without refitting
+
+An AnomalyModel bundles the fitted StandardScaler and IsolationForest
+with what they were trained on. Stores keep numbered versions per
+location:
+
+    AnomalyModelStore         pickles on disk, <dir>/<Location_Name>/v0001.pkl
+    MongoAnomalyModelStore    pickled bytes in a MongoDB collection, signed
+                              with ANOMALY_MODEL_SIGNING_KEY
+
+Unpickling runs code, so the MongoDB store only loads models whose
+HMAC-SHA256 matches the signing key; the collection is shared, the model
+directory is the worker's own disk.
+
+Scoring a series with a stored model leaves the scores of months it has
+already seen unchanged, so a new month never relabels old ones. A
+RetrainPolicy decides when a new version is fitted: no model yet,
+different features or settings, the model is older than max_age_days, or
+the months after its training window have drifted from the training
+distribution.
+"""
+import hashlib
+import hmac
+import os
+import pickle
+import threading
+import time
+from datetime import datetime
+
+import numpy as np
+
+
+class AnomalyModel:
+    """Scaler and IsolationForest fitted on one location's monthly history"""
+
+    def __init__(self, features, scaler, detector, contamination, random_state,
+                 trained_rows, trained_through, trained_at=None, version=None, reason=None):
+        self.features = list(features)
+        self.scaler = scaler
+        self.detector = detector
+        self.contamination = contamination
+        self.random_state = random_state
+        self.trained_rows = trained_rows
+        self.trained_through = trained_through
+        self.trained_at = trained_at or time.time()
+        self.version = version
+        self.reason = reason
+
+    @classmethod
+    def fit(cls, df, features, contamination=0.1, random_state=42):
+        from sklearn.ensemble import IsolationForest
+        from sklearn.preprocessing import StandardScaler
+
+        X = df[features].fillna(0).values
+        scaler = StandardScaler()
+        detector = IsolationForest(contamination=contamination, random_state=random_state)
+        detector.fit(scaler.fit_transform(X))
+        trained_through = df['date'].max() if 'date' in df.columns else None
+        return cls(features, scaler, detector, contamination, random_state, len(df), trained_through)
+
+    def score(self, df):
+        """(decision scores, anomaly flags) for every row; lower scores are more anomalous"""
+        X_scaled = self.scaler.transform(df[self.features].fillna(0).values)
+        scores = self.detector.decision_function(X_scaled)
+        return scores, scores < 0
+
+    def unseen_rows(self, df):
+        """Rows after the training window"""
+        if self.trained_through is None or 'date' not in df.columns:
+            return df.iloc[0:0]
+        return df[df['date'] > self.trained_through]
+
+    def drift(self, df):
+        """Largest shift of an unseen feature mean from the training mean, in training SDs"""
+        unseen = self.unseen_rows(df)
+        if unseen.empty:
+            return 0.0
+        means = unseen[self.features].fillna(0).values.mean(axis=0)
+        scale = np.where(self.scaler.scale_ > 0, self.scaler.scale_, 1.0)
+        return float(np.max(np.abs(means - self.scaler.mean_) / scale))
+
+    def info(self):
+        """JSON-ready summary stored alongside analysis results"""
+        return {
+            'version': self.version,
+            'features': self.features,
+            'trained_rows': self.trained_rows,
+            'trained_through': self.trained_through,
+            'trained_at': datetime.fromtimestamp(self.trained_at).isoformat(),
+            'reason': self.reason
+        }
+
+
+class RetrainPolicy:
+    """When to fit a new model version instead of scoring with the stored one"""
+
+    def __init__(self, max_age_days=90, drift_threshold=1.5, min_drift_rows=3):
+        self.max_age_days = max_age_days
+        self.drift_threshold = drift_threshold
+        self.min_drift_rows = min_drift_rows
+
+    def reason(self, model, df, features, contamination, random_state):
+        """Why the model must be refitted, or None to reuse it"""
+        if model is None:
+            return 'no model'
+        if model.features != list(features):
+            return 'features changed'
+        if model.contamination != contamination or model.random_state != random_state:
+            return 'settings changed'
+        if self.max_age_days and time.time() - model.trained_at > self.max_age_days * 86400:
+            return 'scheduled'
+        if len(model.unseen_rows(df)) >= self.min_drift_rows:
+            drift = model.drift(df)
+            if drift > self.drift_threshold:
+                return f'drift {drift:.2f}'
+        return None
+
+
+class AnomalyModelStore:
+    """Versioned model pickles on disk; the latest version per location is kept in memory"""
+
+    def __init__(self, path=None, keep_versions=5):
+        self.path = path or os.getenv('ANOMALY_MODEL_DIR', 'cache/anomaly_models')
+        self.keep_versions = keep_versions
+        self.loaded = {}
+        self.lock = threading.Lock()
+        os.makedirs(self.path, exist_ok=True)
+
+    def location_dir(self, location):
+        return os.path.join(self.path, location.replace(' ', '_'))
+
+    def versions(self, location):
+        directory = self.location_dir(location)
+        if not os.path.isdir(directory):
+            return []
+        return sorted(int(name[1:-4]) for name in os.listdir(directory)
+                      if name.startswith('v') and name.endswith('.pkl') and name[1:-4].isdigit())
+
+    def version_path(self, location, version):
+        return os.path.join(self.location_dir(location), f'v{version:04d}.pkl')
+
+    def latest(self, location):
+        """Newest model for a location, or None"""
+        with self.lock:
+            if location not in self.loaded:
+                versions = self.versions(location)
+                model = None
+                if versions:
+                    with open(self.version_path(location, versions[-1]), 'rb') as handle:
+                        model = pickle.load(handle)
+                self.loaded[location] = model
+            return self.loaded[location]
+
+    def save(self, location, model):
+        """Store model as the next version; older versions beyond keep_versions are deleted"""
+        with self.lock:
+            versions = self.versions(location)
+            model.version = (versions[-1] if versions else 0) + 1
+            os.makedirs(self.location_dir(location), exist_ok=True)
+            path = self.version_path(location, model.version)
+            # Write then rename, so readers never see a partial pickle
+            with open(path + '.tmp', 'wb') as handle:
+                pickle.dump(model, handle, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(path + '.tmp', path)
+            for stale in (versions + [model.version])[:-self.keep_versions]:
+                os.remove(self.version_path(location, stale))
+            self.loaded[location] = model
+            return model.version
+
+
+class MongoAnomalyModelStore:
+    """Versioned model pickles in a MongoDB collection
+
+    Every pickle is stored with an HMAC-SHA256 of its bytes. A document
+    whose signature does not match is never unpickled; latest() treats it
+    as missing, so the location is refitted and a signed version saved.
+    """
+
+    def __init__(self, collection, keep_versions=5, signing_key=None):
+        signing_key = signing_key or os.getenv('ANOMALY_MODEL_SIGNING_KEY')
+        if not signing_key:
+            raise ValueError("ANOMALY_MODEL_SIGNING_KEY is required to store anomaly models in MongoDB")
+        self.signing_key = signing_key.encode('utf-8') if isinstance(signing_key, str) else signing_key
+        self.collection = collection
+        self.keep_versions = keep_versions
+        self.loaded = {}
+        self.lock = threading.Lock()
+        self.collection.create_index([('location', 1), ('version', -1)], unique=True)
+
+    def sign(self, data):
+        return hmac.new(self.signing_key, data, hashlib.sha256).hexdigest()
+
+    def latest(self, location):
+        with self.lock:
+            if location not in self.loaded:
+                document = self.collection.find_one({'location': location}, sort=[('version', -1)])
+                model = None
+                if document:
+                    data = bytes(document['model'])
+                    if hmac.compare_digest(self.sign(data), str(document.get('signature', ''))):
+                        model = pickle.loads(data)
+                    else:
+                        print(f"Ignoring anomaly model v{document.get('version')} for {location}: bad signature")
+                self.loaded[location] = model
+            return self.loaded[location]
+
+    def save(self, location, model):
+        with self.lock:
+            latest = self.collection.find_one({'location': location}, {'version': 1}, sort=[('version', -1)])
+            model.version = (latest['version'] if latest else 0) + 1
+            data = pickle.dumps(model, protocol=pickle.HIGHEST_PROTOCOL)
+            self.collection.insert_one(dict(
+                model.info(),
+                location=location,
+                model=data,
+                signature=self.sign(data)
+            ))
+            self.collection.delete_many({
+                'location': location,
+                'version': {'$lte': model.version - self.keep_versions}
+            })
+            self.loaded[location] = model
+            return model.version
@@ -0,0 +1,134 @@
+# batch_analytics.py
+import numpy as np
+import pandas as pd
+
+DEFAULT_FEATURES = ('NDWI', 'NDCI')
+
+
+def add_time_index(df):
+    """Fractional year used as the regression axis"""
+    return df['year'] + (df['month'] - 1) / 12
+
+
+def batch_trends(df, features=DEFAULT_FEATURES, group_col='location'):
+    """Least-squares slope of every feature for every group in one pass
+
+    Returns a tidy table with one row per (group, feature) that has more
+    than two observations, matching analyze_environmental_trends.
+    """
+    columns = [group_col, 'feature', 'n_points', 'trend', 'annual_change', 'intercept']
+    if df.empty:
+        return pd.DataFrame(columns=columns)
+
+    codes, groups = pd.factorize(df[group_col], sort=True)
+    time_index = add_time_index(df).to_numpy(dtype=float)
+    tables = []
+
+    for feature in features:
+        if feature not in df.columns:
+            continue
+        y = df[feature].to_numpy(dtype=float)
+        valid = ~np.isnan(y) & ~np.isnan(time_index) & (codes >= 0)
+        group_codes, t, y = codes[valid], time_index[valid], y[valid]
+
+        n = np.bincount(group_codes, minlength=len(groups)).astype(float)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            mean_t = np.bincount(group_codes, t, len(groups)) / n
+            mean_y = np.bincount(group_codes, y, len(groups)) / n
+            # Centre per group before the cross products to keep precision
+            dt = t - mean_t[group_codes]
+            dy = y - mean_y[group_codes]
+            s_tt = np.bincount(group_codes, dt * dt, len(groups))
+            s_ty = np.bincount(group_codes, dt * dy, len(groups))
+            slope = np.where(s_tt > 0, s_ty / s_tt, 0.0)
+
+        keep = n > 2
+        tables.append(pd.DataFrame({
+            group_col: groups[keep],
+            'feature': feature,
+            'n_points': n[keep].astype(int),
+            'trend': slope[keep],
+            'annual_change': slope[keep] * 12,
+            'intercept': (mean_y - slope * mean_t)[keep]
+        }))
+
+    if not tables:
+        return pd.DataFrame(columns=columns)
+    return pd.concat(tables, ignore_index=True)[columns]
+
+
+def trends_to_dict(trend_table, group, group_col='location'):
+    """Convert one group's rows back to the {'NDWI_trend': ..} mapping"""
+    trends = {}
+    for row in trend_table[trend_table[group_col] == group].itertuples(index=False):
+        trends[f'{row.feature}_trend'] = float(row.trend)
+        trends[f'{row.feature}_annual_change'] = float(row.annual_change)
+    return trends
+
+
+def batch_anomalies(df, features=DEFAULT_FEATURES, group_col='location',
+                    contamination=0.1, min_points=5):
+    """Score anomalies per group with vectorized standardized distances
+
+    Each group is standardized on its own (as StandardScaler would) and the
+    score is the negated distance from the group centre, so lower means more
+    anomalous like IsolationForest.decision_function. The lowest
+    `contamination` share of each group is flagged.
+
+    This is a fast approximation for many small groups (grid tiles), not the
+    model the pipeline scores a region with: per-region scores come from the
+    location's stored IsolationForest (anomaly_models.py), so flags and
+    scores here are not comparable with a region's is_anomaly/anomaly_score.
+    Months far from the group mean in any direction are flagged, while the
+    forest also isolates unusual combinations of the features.
+    """
+    scored = df.copy()
+    valid_features = [f for f in features if f in scored.columns and not scored[f].isnull().all()]
+    if scored.empty or not valid_features:
+        scored['anomaly_score'] = 0.0
+        scored['is_anomaly'] = False
+        return scored
+
+    values = scored[valid_features].fillna(0)
+    by_group = values.groupby(scored[group_col], sort=False)
+    mean = by_group.transform('mean')
+    std = by_group.transform('std', ddof=0)
+    z = ((values - mean) / std.replace(0, np.nan)).fillna(0).to_numpy()
+
+    score = -np.sqrt((z ** 2).sum(axis=1))
+    scored['anomaly_score'] = score
+    by_group = scored.groupby(group_col, sort=False)['anomaly_score']
+    threshold = by_group.transform('quantile', contamination)
+    scored['is_anomaly'] = scored['anomaly_score'] < threshold
+
+    small = by_group.transform('size') < min_points
+    scored.loc[small, 'anomaly_score'] = 0.0
+    scored.loc[small, 'is_anomaly'] = False
+    return scored
+
+
+def analyze_groups(df, features=DEFAULT_FEATURES, group_col='location', contamination=0.1):
+    """Trend and anomaly summary for many groups
+
+    Anomalies use the z-score approximation of batch_anomalies. Returns
+    (scored rows, summary table with one row per group).
+    """
+    scored = batch_anomalies(df, features, group_col, contamination)
+    trend_table = batch_trends(scored, features, group_col)
+
+    ordered = scored.sort_values([group_col, 'year', 'month'])
+    latest_cols = [f for f in features if f in ordered.columns]
+    summary = ordered.groupby(group_col).agg(
+        data_points=('year', 'size'),
+        anomaly_count=('is_anomaly', 'sum'),
+        last_date=('date', 'last') if 'date' in ordered.columns else ('year', 'last')
+    )
+    if latest_cols:
+        summary = summary.join(ordered.groupby(group_col)[latest_cols].last())
+
+    if not trend_table.empty:
+        wide = trend_table.pivot(index=group_col, columns='feature', values=['trend', 'annual_change'])
+        wide.columns = [f'{feature}_{kind}' for kind, feature in wide.columns]
+        summary = summary.join(wide)
+
+    return scored, summary.reset_index()
@@ -0,0 +1,108 @@
+# composite_benchmark.py
+"""Monthly median compositing benchmark for local scenes
+
+Writes a synthetic month of Sentinel-2 scenes (uint16 B3/B4/B5/B8 plus an
+SCL band) and composites it in a fresh interpreter per mode:
+
+    in-memory   load every scene whole, stack and nanmedian (the naive path)
+    streaming   StreamingCompositor, one process, bounded block size
+    pool        StreamingCompositor across a process pool
+
+Reports wall time, throughput in scene pixels per second and peak RSS of
+the compositing process and of its largest worker.
+
+    python benchmarks/composite_benchmark.py --size 2000 --scenes 6
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+
+import numpy as np
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+
+from data_sources import write_scene
+
+SNIPPET = r'''
+import json, resource, sys, time
+import numpy as np
+from data_sources import LocalRasterDataSource, cloud_mask, compute_indices
+from compositing import StreamingCompositor
+
+root, mode, workers, budget = sys.argv[1], sys.argv[2], int(sys.argv[3]), int(sys.argv[4])
+names = ['NDWI', 'NDCI']
+start = time.perf_counter()
+if mode == 'in-memory':
+    source = LocalRasterDataSource(root, index_names=names, compositor=StreamingCompositor(max_workers=1))
+    stacks = {name: [] for name in names}
+    for scene in source.list_scenes('Benchmark', '2023-01-01', '2023-02-01'):
+        bands = {band: np.load(path) for band, path in source.scene_band_paths(scene).items()}
+        mask = cloud_mask(bands.pop('SCL'))
+        for name, values in compute_indices(bands, names, mask).items():
+            stacks[name].append(values)
+    result = {name: float(np.nanmean(np.nanmedian(np.stack(layers), axis=0))) for name, layers in stacks.items()}
+else:
+    compositor = StreamingCompositor(memory_budget_mb=budget, max_workers=1 if mode == 'streaming' else workers)
+    source = LocalRasterDataSource(root, index_names=names, compositor=compositor)
+    result = source.fetch_months('Benchmark', [(2023, 1, '2023-01-01', '2023-02-01')])['2023-01-01']
+    compositor.shutdown()
+elapsed = time.perf_counter() - start
+print(json.dumps({
+    'seconds': elapsed,
+    'result': result,
+    'rss_mb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+    'worker_rss_mb': resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss / 1024,
+}))
+'''
+
+
+def write_month(root, size, scenes, seed=0):
+    rng = np.random.default_rng(seed)
+    for day in range(scenes):
+        bands = {band: rng.integers(300, 4000, (size, size), dtype=np.uint16)
+                 for band in ('B3', 'B4', 'B5', 'B8')}
+        bands['SCL'] = np.where(rng.random((size, size)) < 0.15, 9, 4).astype(np.uint8)
+        write_scene(root, 'Benchmark', f'2023-01-{day + 1:02d}', bands)
+
+
+def run_mode(root, mode, workers, budget):
+    output = subprocess.run(
+        [sys.executable, '-c', SNIPPET, root, mode, str(workers), str(budget)],
+        cwd=BACKEND_DIR, capture_output=True, text=True, timeout=1800
+    )
+    lines = [line for line in output.stdout.splitlines() if line.startswith('{')]
+    if output.returncode != 0 or not lines:
+        raise RuntimeError(output.stderr.strip() or output.stdout.strip())
+    return json.loads(lines[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Local median compositing benchmark')
+    parser.add_argument('--size', type=int, default=2000, help='scene edge in pixels')
+    parser.add_argument('--scenes', type=int, default=6)
+    parser.add_argument('--workers', type=int, default=os.cpu_count())
+    parser.add_argument('--budget-mb', type=int, default=64)
+    parser.add_argument('--modes', nargs='+', default=['in-memory', 'streaming', 'pool'],
+                        choices=['in-memory', 'streaming', 'pool'])
+    args = parser.parse_args()
+
+    pixels = args.size * args.size * args.scenes
+    with tempfile.TemporaryDirectory() as root:
+        write_month(root, args.size, args.scenes)
+        print(f"{args.scenes} scenes of {args.size}x{args.size} px, "
+              f"budget {args.budget_mb} MB, {args.workers} workers\n")
+        print(f"{'mode':10} | {'time':>8} | {'Mpx/s':>7} | {'peak RSS':>9} | {'worker RSS':>10} | NDWI")
+        print("-" * 68)
+        for mode in args.modes:
+            run = run_mode(root, mode, args.workers, args.budget_mb)
+            worker_rss = f"{run['worker_rss_mb']:7.0f} MB" if mode == 'pool' else f"{'-':>10}"
+            print(f"{mode:10} | {run['seconds']:7.2f}s | {pixels / run['seconds'] / 1e6:7.1f} | "
+                  f"{run['rss_mb']:6.0f} MB | {worker_rss} | {run['result'].get('NDWI', float('nan')):.5f}")
+
+
+if __name__ == '__main__':
+    main()
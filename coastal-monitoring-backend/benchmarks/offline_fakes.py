@@ -0,0 +1,337 @@
+# offline_fakes.py
+"""Local stand-ins for Earth Engine and MongoDB used by the pipeline benchmark
+
+    ReplayEarthEngineSource   serves recorded reduceRegion responses, one
+                              simulated round trip per getInfo()
+    FakeMongoClient           in-memory collections with per-operation latency
+
+Groq completions are served by llm_stub_server.py. Recorded responses live
+in benchmarks/fixtures/. Synthetic regions are clones of the recorded ones:
+each replays its template's monthly series with a small seeded jitter, so
+every region still gets its own anomalies and trends.
+"""
+import copy
+import json
+import os
+import random
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from types import SimpleNamespace
+
+import numpy as np
+
+BENCHMARK_DIR = os.path.dirname(os.path.abspath(__file__))
+BACKEND_DIR = os.path.dirname(BENCHMARK_DIR)
+FIXTURE_DIR = os.path.join(BENCHMARK_DIR, 'fixtures')
+sys.path.insert(0, BACKEND_DIR)
+
+from data_sources import SatelliteDataSource
+from instrumentation import attached_run, current_run, ee_get_info
+from request_retry import classify_error
+from region_registry import rectangle_geometry
+
+
+def load_fixture(name, fixture_dir=None):
+    with open(os.path.join(fixture_dir or FIXTURE_DIR, name)) as handle:
+        return json.load(handle)
+
+
+def synthetic_regions(registry, count, spacing=0.001):
+    """count regions cloned from the registry; the first ones are the real regions
+
+    Returns a list of {name, geometry, properties} with properties.template
+    naming the recorded region whose responses the clone replays.
+    """
+    templates = registry.names
+    regions = []
+    for index in range(count):
+        template = templates[index % len(templates)]
+        if index < len(templates):
+            regions.append({'name': template, 'geometry': registry.geometry(template),
+                            'properties': {'template': template}})
+            continue
+        west, south, east, north = registry.bounds(template)
+        shift = spacing * (index // len(templates))
+        regions.append({
+            'name': f'{template} {index:04d}',
+            'geometry': rectangle_geometry((west + shift, south, east + shift, north)),
+            'properties': {'template': template}
+        })
+    return regions
+
+
+def write_region_file(path, regions):
+    """GeoJSON FeatureCollection readable by RegionRegistry.from_geojson"""
+    with open(path, 'w') as handle:
+        json.dump({
+            'type': 'FeatureCollection',
+            'features': [
+                {'type': 'Feature', 'properties': dict(region.get('properties', {}), name=region['name']),
+                 'geometry': region['geometry']}
+                for region in regions
+            ]
+        }, handle)
+
+
+class RecordedResponse:
+    """Replays one recorded value through getInfo() after a simulated round trip"""
+
+    def __init__(self, value, seconds, server=None):
+        self.value = value
+        self.seconds = seconds
+        self.server = server
+
+    def getInfo(self):
+        if self.server:
+            self.server.begin()
+        try:
+            if self.seconds:
+                time.sleep(self.seconds)
+        finally:
+            if self.server:
+                self.server.end()
+        return copy.deepcopy(self.value)
+
+
+class SimulatedQuota:
+    """Server-side limits: rejects requests beyond `max_concurrent` and fails a share at random"""
+
+    def __init__(self, max_concurrent=None, error_rate=0.0, seed=0):
+        self.max_concurrent = max_concurrent
+        self.error_rate = error_rate
+        self.random = random.Random(seed)
+        self.active = 0
+        self.rejected = 0
+        self.lock = threading.Lock()
+
+    def begin(self):
+        with self.lock:
+            if self.max_concurrent and self.active >= self.max_concurrent:
+                self.rejected += 1
+                raise Exception('Too many concurrent aggregations.')
+            if self.error_rate and self.random.random() < self.error_rate:
+                self.rejected += 1
+                raise Exception('Computation timed out.')
+            self.active += 1
+
+    def end(self):
+        with self.lock:
+            self.active -= 1
+
+
+class ReplayEarthEngineSource(SatelliteDataSource):
+    """Recorded monthly reductions served with Earth Engine's request pattern
+
+    Per-month extraction costs two round trips per month (collection size,
+    then reduceRegion), `month_workers` months at a time; batched
+    extraction costs one round trip for all months. Every round trip pays
+    `latency` seconds plus `month_seconds` of server time per month it
+    reduces and goes through `request` (ee_get_info by default, or the
+    analyst's ee_request to include its retries and concurrency cap).
+    A SimulatedQuota can reject requests the way Earth Engine throttles.
+    """
+
+    name = 'earthengine'
+
+    def __init__(self, fixture, templates, latency=0.02, month_seconds=0.005, jitter=0.05, seed=0,
+                 request=None, month_workers=1, quota=None):
+        # Recorded series by calendar month, so any year range can be replayed
+        self.recorded = {
+            region: {int(start_date[5:7]): stats for start_date, stats in months.items()}
+            for region, months in fixture['regions'].items()
+        }
+        self.templates = templates
+        self.latency = latency
+        self.month_seconds = month_seconds
+        self.jitter = jitter
+        self.seed = seed
+        self.request = request or ee_get_info
+        self.month_workers = month_workers
+        self.quota = quota
+        self.series_cache = {}
+        self.lock = threading.Lock()
+
+    def series(self, location):
+        """{month: stats} for a region, jittered deterministically per region"""
+        with self.lock:
+            if location not in self.series_cache:
+                template = self.templates.get(location, location)
+                rng = np.random.default_rng([self.seed, sum(map(ord, location))])
+                scale = 1 + rng.normal(0, self.jitter)
+                self.series_cache[location] = {
+                    month: {name: round(value * scale + rng.normal(0, self.jitter / 5), 6)
+                            for name, value in stats.items()}
+                    for month, stats in self.recorded[template].items()
+                }
+            return self.series_cache[location]
+
+    def fetch_month(self, stats):
+        if self.request(RecordedResponse(1 if stats else 0, self.latency, self.quota), 'collection_size') == 0:
+            return {}
+        seconds = self.latency + self.month_seconds
+        return self.request(RecordedResponse(stats, seconds, self.quota), 'reduce_region') or {}
+
+    def fetch_months(self, location, windows, batched=False, failures=None):
+        series = self.series(location)
+        failures = {} if failures is None else failures
+        if batched:
+            features = [
+                {'properties': dict(series.get(month, {}), start_date=start_date, end_date=end_date,
+                                    image_count=1 if series.get(month) else 0)}
+                for year, month, start_date, end_date in windows
+            ]
+            seconds = self.latency + self.month_seconds * len(windows)
+            try:
+                response = self.request(RecordedResponse({'features': features}, seconds, self.quota), 'batched_months')
+            except Exception as e:
+                for window in windows:
+                    failures[window[2]] = {'reason': str(e), 'kind': classify_error(e),
+                                           'attempts': getattr(e, 'attempts', 1)}
+                return {}
+            fetched = {}
+            for feature in response['features']:
+                stats = dict(feature['properties'])
+                start_date = stats.pop('start_date')
+                stats.pop('end_date', None)
+                fetched[start_date] = stats if stats.pop('image_count', 0) else {}
+            return fetched
+
+        fetched = {}
+        run = current_run()
+
+        def fetch(month):
+            with attached_run(run):
+                return self.fetch_month(series.get(month, {}))
+
+        with ThreadPoolExecutor(max_workers=max(1, min(self.month_workers, len(windows)))) as executor:
+            futures = {executor.submit(fetch, window[1]): window[2] for window in windows}
+            for future in as_completed(futures):
+                try:
+                    fetched[futures[future]] = future.result()
+                except Exception as e:
+                    failures[futures[future]] = {'reason': str(e), 'kind': classify_error(e),
+                                                 'attempts': getattr(e, 'attempts', 1)}
+        return fetched
+
+
+class FakeCollection:
+    """Just enough of pymongo's Collection for the analyst and the write-behind sink"""
+
+    def __init__(self, latency=0.0):
+        self.documents = []
+        self.latency = latency
+        self.operations = 0
+        self.lock = threading.Lock()
+
+    def round_trip(self):
+        with self.lock:
+            self.operations += 1
+        if self.latency:
+            time.sleep(self.latency)
+
+    @staticmethod
+    def matches(document, query):
+        for key, condition in (query or {}).items():
+            if isinstance(condition, dict) and '$in' in condition:
+                if document.get(key) not in condition['$in']:
+                    return False
+            elif document.get(key) != condition:
+                return False
+        return True
+
+    def insert_one(self, document):
+        self.round_trip()
+        with self.lock:
+            self.documents.append(document)
+            return SimpleNamespace(inserted_id=len(self.documents))
+
+    def insert_many(self, documents, ordered=True):
+        self.round_trip()
+        with self.lock:
+            start = len(self.documents)
+            self.documents.extend(documents)
+            return SimpleNamespace(inserted_ids=list(range(start + 1, len(self.documents) + 1)))
+
+    def update_one(self, query, update, upsert=False):
+        self.round_trip()
+        with self.lock:
+            for document in self.documents:
+                if self.matches(document, query):
+                    document.update(update.get('$set', {}))
+                    return SimpleNamespace(matched_count=1, modified_count=1, upserted_id=None)
+            if upsert:
+                self.documents.append(dict(query, **update.get('$set', {})))
+                return SimpleNamespace(matched_count=0, modified_count=0, upserted_id=len(self.documents))
+        return SimpleNamespace(matched_count=0, modified_count=0, upserted_id=None)
+
+    def bulk_write(self, requests, ordered=True):
+        # Operations are only counted; nothing reads the documents back
+        self.round_trip()
+        return SimpleNamespace(bulk_api_result={'nUpserted': len(requests)})
+
+    def delete_many(self, query):
+        self.round_trip()
+        with self.lock:
+            kept = [document for document in self.documents if not self.matches(document, query)]
+            deleted = len(self.documents) - len(kept)
+            self.documents = kept
+        return SimpleNamespace(deleted_count=deleted)
+
+    def find(self, query=None, projection=None, sort=None, skip=0, limit=0):
+        self.round_trip()
+        with self.lock:
+            found = [document for document in self.documents if self.matches(document, query)]
+        for key, direction in reversed(sort or []):
+            found.sort(key=lambda document: document.get(key) or '', reverse=direction < 0)
+        return found[skip:skip + limit] if limit else found[skip:]
+
+    def find_one(self, query=None, projection=None, sort=None):
+        found = self.find(query)
+        return found[-1] if found else None
+
+    def count_documents(self, query):
+        return len(self.find(query))
+
+    def create_index(self, keys, **options):
+        return str(keys)
+
+
+class FakeDatabase:
+    def __init__(self, latency=0.0):
+        self.latency = latency
+        self.collections = {}
+        self.lock = threading.Lock()
+
+    def __getitem__(self, name):
+        with self.lock:
+            if name not in self.collections:
+                self.collections[name] = FakeCollection(self.latency)
+            return self.collections[name]
+
+    def create_collection(self, name, **options):
+        return self[name]
+
+    def list_collection_names(self):
+        return list(self.collections)
+
+
+class FakeMongoClient:
+    """In-memory stand-in for MongoClient; every operation costs `latency` seconds"""
+
+    def __init__(self, latency=0.0):
+        self.latency = latency
+        self.databases = {}
+
+    def __getitem__(self, name):
+        if name not in self.databases:
+            self.databases[name] = FakeDatabase(self.latency)
+        return self.databases[name]
+
+    def operation_counts(self):
+        return {f'{db_name}.{name}': collection.operations
+                for db_name, db in self.databases.items() for name, collection in db.collections.items()}
+
+    def close(self):
+        pass
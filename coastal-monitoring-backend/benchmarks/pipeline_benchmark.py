@@ -0,0 +1,298 @@
+# pipeline_benchmark.py
+"""End-to-end benchmark of run_complete_analysis_pipeline on recorded responses
+
+Every (mode, size) pair runs in a fresh interpreter. It writes a registry of
+`size` synthetic regions cloned from the real ones, replays the recorded
+reduceRegion responses through offline_fakes.ReplayEarthEngineSource,
+serves the recorded Groq completions from llm_stub_server and writes to
+an in-memory FakeMongoClient. Each fake charges a configurable latency per
+request, so request patterns show up in the timings.
+
+Modes:
+    sequential   one region at a time, two Earth Engine requests per month
+                 one month at a time, direct MongoDB writes (the original
+                 pipeline)
+    batched      one region at a time, one request for all months,
+                 write-behind MongoDB
+    concurrent   batched, with --workers regions in flight
+
+--ee-quota and --ee-error-rate make the replayed Earth Engine reject
+requests beyond a concurrency quota or at random, to measure retries and
+throughput under throttling.
+
+Reports wall time, throughput, Earth Engine/Groq/MongoDB request counts,
+retries, months left missing and peak RSS per mode, then mean and p95
+latency per pipeline stage.
+
+    python benchmarks/pipeline_benchmark.py --sizes 4 100 1000
+    python benchmarks/pipeline_benchmark.py --sizes 100 --modes sequential concurrent --ee-latency 0.2
+    python benchmarks/pipeline_benchmark.py record    # refresh fixtures from live Earth Engine and Groq
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+import numpy as np
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+
+from offline_fakes import (FIXTURE_DIR, FakeMongoClient, ReplayEarthEngineSource, SimulatedQuota, load_fixture,
+                           synthetic_regions, write_region_file)
+from region_registry import DEFAULT_REGISTRY_PATH, RegionRegistry
+
+MODES = {
+    'sequential': {'workers': 1, 'batched': False, 'write_behind': False, 'month_workers': 1},
+    'batched': {'workers': 1, 'batched': True, 'write_behind': True, 'month_workers': None},
+    'concurrent': {'workers': None, 'batched': True, 'write_behind': True, 'month_workers': None},
+}
+
+RESULT_PREFIX = 'BENCHMARK_RESULT '
+MONGODB_URI = 'mongodb://benchmark'
+
+
+def percentile(values, q):
+    return float(np.percentile(values, q)) if values else 0.0
+
+
+def run_one(args):
+    """Run one mode over one region count in this process and print the result"""
+    import resource
+
+    config = MODES[args.mode]
+    with tempfile.TemporaryDirectory() as work_dir:
+        regions = synthetic_regions(RegionRegistry.from_geojson(DEFAULT_REGISTRY_PATH), args.size)
+        write_region_file(os.path.join(work_dir, 'regions.geojson'), regions)
+
+        from llm_stub_server import StubCompletionHandler, start_stub_server
+        completions = load_fixture('groq_completions.json', args.fixtures)['completions']
+        server, base_url = start_stub_server(delay=args.llm_latency, responses=completions)
+
+        metrics_path = os.path.join(work_dir, 'runs.jsonl')
+        os.environ.update({
+            'REGION_REGISTRY_PATH': os.path.join(work_dir, 'regions.geojson'),
+            'SATELLITE_CACHE_DISABLED': '1',
+            'LLM_CACHE_DISABLED': '1',
+            # Every mode starts without stored anomaly models, so each fits them once
+            'ANOMALY_MODEL_DIR': os.path.join(work_dir, 'anomaly_models'),
+            'TILE_STORE_DIR': os.path.join(work_dir, 'tiles'),
+            'GROQ_API_KEY': 'stub',
+            'GROQ_BASE_URL': base_url,
+            'MONGODB_URI': MONGODB_URI,
+            'MONGODB_WRITE_BEHIND': '1' if config['write_behind'] else '0',
+            'VISUALIZATION_DIR': os.path.join(work_dir, 'charts'),
+            'VISUALIZATION_FORMATS': args.formats,
+            'VISUALIZATION_WORKERS': str(args.render_workers),
+            'PIPELINE_METRICS_PATH': metrics_path,
+            'COASTAL_HEADLESS': '1',
+        })
+        if config['month_workers']:
+            os.environ['EE_MONTH_WORKERS'] = str(config['month_workers'])
+
+        import mongo_sink
+        mongo = FakeMongoClient(args.mongo_latency)
+        mongo_sink._clients[MONGODB_URI] = mongo
+
+        import instrumentation
+        from coastal_ai_analyst_fixed_1 import CoastalAIAnalyst
+
+        analyst = CoastalAIAnalyst(interactive=False, headless=True)
+        analyst.data_source = ReplayEarthEngineSource(
+            load_fixture('ee_reduce_region.json', args.fixtures),
+            {region['name']: region['properties']['template'] for region in regions},
+            latency=args.ee_latency,
+            month_seconds=args.ee_month_seconds,
+            request=analyst.ee_request,
+            month_workers=analyst.month_workers,
+            quota=SimulatedQuota(args.ee_quota or None, args.ee_error_rate)
+        )
+
+        start = time.perf_counter()
+        results = analyst.run_multi_region_analysis(
+            analyst.registry.names,
+            max_workers=config['workers'] or args.workers,
+            batched=config['batched'],
+            years=args.years
+        )
+        analyst.close()
+        elapsed = time.perf_counter() - start
+        server.shutdown()
+
+        with open(metrics_path) as handle:
+            runs = [json.loads(line) for line in handle]
+
+    stages = {}
+    for run in runs:
+        for stage, seconds in run['stages'].items():
+            stages.setdefault(stage, []).append(seconds)
+    counters = instrumentation.snapshot()['counters']
+    print(RESULT_PREFIX + json.dumps({
+        'mode': args.mode,
+        'size': args.size,
+        'seconds': elapsed,
+        'completed': len(results),
+        'failed': sum(1 for run in runs if run['status'] == 'failed'),
+        'ee_requests': counters.get('ee_calls', 0),
+        'ee_retries': counters.get('ee_retries', 0),
+        'months_failed': counters.get('months.failed', 0),
+        'groq_requests': StubCompletionHandler.request_count,
+        'mongo_operations': sum(mongo.operation_counts().values()),
+        'rss_mb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+        'worker_rss_mb': resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss / 1024,
+        'stages': {
+            stage: {'mean': float(np.mean(values)), 'p95': percentile(values, 95)}
+            for stage, values in stages.items()
+        },
+    }))
+
+
+def run_mode(args, mode, size):
+    command = [
+        sys.executable, os.path.abspath(__file__), 'run',
+        '--run-one', '--mode', mode, '--size', str(size),
+        '--workers', str(args.workers), '--years', str(args.years),
+        '--ee-latency', str(args.ee_latency), '--ee-month-seconds', str(args.ee_month_seconds),
+        '--ee-quota', str(args.ee_quota), '--ee-error-rate', str(args.ee_error_rate),
+        '--llm-latency', str(args.llm_latency), '--mongo-latency', str(args.mongo_latency),
+        '--formats', args.formats, '--render-workers', str(args.render_workers),
+        '--fixtures', args.fixtures,
+    ]
+    output = subprocess.run(command, cwd=BACKEND_DIR, capture_output=True, text=True, timeout=args.timeout)
+    lines = [line for line in output.stdout.splitlines() if line.startswith(RESULT_PREFIX)]
+    if output.returncode != 0 or not lines:
+        raise RuntimeError(output.stderr.strip()[-2000:] or output.stdout.strip()[-2000:])
+    return json.loads(lines[-1][len(RESULT_PREFIX):])
+
+
+def print_size_report(size, runs):
+    baseline = runs[0]['seconds']
+    print(f"\n{size} regions")
+    print(f"{'mode':11} | {'time':>8} | {'regions/s':>9} | {'done':>5} | {'EE req':>6} | {'retries':>7} | "
+          f"{'missing':>7} | {'LLM req':>7} | {'Mongo ops':>9} | {'peak RSS':>8} | {'render RSS':>10} | speedup")
+    print("-" * 126)
+    for run in runs:
+        print(f"{run['mode']:11} | {run['seconds']:7.2f}s | {run['completed'] / run['seconds']:9.2f} | "
+              f"{run['completed']:5d} | {run['ee_requests']:6d} | {run['ee_retries']:7d} | "
+              f"{run['months_failed']:7d} | {run['groq_requests']:7d} | "
+              f"{run['mongo_operations']:9d} | {run['rss_mb']:5.0f} MB | {run['worker_rss_mb']:7.0f} MB | "
+              f"{baseline / run['seconds']:6.2f}x")
+
+    stage_names = []
+    for run in runs:
+        stage_names.extend(name for name in run['stages'] if name not in stage_names)
+    print(f"\n{'stage (ms)':16} | " + " | ".join(f"{run['mode'] + ' mean/p95':>24}" for run in runs))
+    print("-" * (19 + 27 * len(runs)))
+    for stage in stage_names:
+        cells = []
+        for run in runs:
+            timing = run['stages'].get(stage)
+            cells.append(f"{timing['mean'] * 1000:11.1f} /{timing['p95'] * 1000:11.1f}" if timing else f"{'-':>24}")
+        print(f"{stage:16} | " + " | ".join(cells))
+
+
+def record_fixtures(args):
+    """Capture live reduceRegion responses and Groq completions as fixtures"""
+    from coastal_ai_analyst_fixed_1 import CoastalAIAnalyst
+
+    analyst = CoastalAIAnalyst(interactive=False)
+    windows = analyst.get_month_windows(args.years)
+    regions = {}
+    for location in analyst.registry:
+        fetched = analyst.data_source.fetch_months(location, windows, batched=True)
+        regions[location] = {
+            start_date: {name: stats[name] for name in analyst.index_names if name in stats}
+            for start_date, stats in fetched.items()
+        }
+        print(f"Recorded {len(fetched)} months for {location}")
+
+    completions = {}
+    for location in regions:
+        df = analyst.extract_time_series_data(location, batched=True, windows=windows)
+        if len(df) < 3:
+            continue
+        df = analyst.detect_environmental_anomalies(df)
+        trends = analyst.analyze_environmental_trends(df)
+        anomalies = df[df['is_anomaly']]
+        prompt = analyst.build_insight_prompt(location, df, trends, anomalies)
+        for model in analyst.groq_models:
+            response = analyst.insight_client.generate_with(prompt, model)
+            if response:
+                completions[model] = response
+        break
+
+    recorded_at = datetime.now().isoformat()
+    os.makedirs(args.fixtures, exist_ok=True)
+    with open(os.path.join(args.fixtures, 'ee_reduce_region.json'), 'w') as handle:
+        json.dump({
+            'description': 'Monthly reduceRegion means per region (batched extraction responses)',
+            'recorded': True, 'recorded_at': recorded_at,
+            'cloud_threshold': analyst.cloud_threshold, 'scale': analyst.reduce_scale,
+            'indices': analyst.index_names, 'regions': regions
+        }, handle, indent=2)
+    if completions:
+        with open(os.path.join(args.fixtures, 'groq_completions.json'), 'w') as handle:
+            json.dump({
+                'description': 'Groq chat completion content served per model by llm_stub_server',
+                'recorded': True, 'recorded_at': recorded_at, 'completions': completions
+            }, handle, indent=2)
+    else:
+        print("No Groq completions recorded; keeping the existing completion fixture")
+    analyst.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Offline end-to-end pipeline benchmark')
+    parser.add_argument('command', nargs='?', default='run', choices=['run', 'record'])
+    parser.add_argument('--sizes', type=int, nargs='+', default=[4, 100, 1000])
+    parser.add_argument('--modes', nargs='+', default=list(MODES), choices=list(MODES))
+    parser.add_argument('--workers', type=int, default=8, help='regions in flight for the concurrent mode')
+    parser.add_argument('--years', type=int, default=1)
+    parser.add_argument('--ee-latency', type=float, default=0.02, help='seconds per Earth Engine round trip')
+    parser.add_argument('--ee-month-seconds', type=float, default=0.005,
+                        help='Earth Engine server time per month reduced')
+    parser.add_argument('--ee-quota', type=int, default=0,
+                        help='concurrent Earth Engine requests allowed before throttling (0: unlimited)')
+    parser.add_argument('--ee-error-rate', type=float, default=0.0,
+                        help='share of Earth Engine requests that time out')
+    parser.add_argument('--llm-latency', type=float, default=0.3, help='seconds per Groq completion')
+    parser.add_argument('--mongo-latency', type=float, default=0.002, help='seconds per MongoDB operation')
+    parser.add_argument('--formats', default='json', help='chart formats rendered per region')
+    parser.add_argument('--render-workers', type=int, default=2)
+    parser.add_argument('--fixtures', default=FIXTURE_DIR)
+    parser.add_argument('--timeout', type=int, default=7200, help='seconds allowed per mode and size')
+    parser.add_argument('--output', help='also write the raw results as JSON')
+    parser.add_argument('--run-one', action='store_true', help=argparse.SUPPRESS)
+    parser.add_argument('--mode', default='sequential', choices=list(MODES), help=argparse.SUPPRESS)
+    parser.add_argument('--size', type=int, default=4, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.command == 'record':
+        record_fixtures(args)
+        return
+    if args.run_one:
+        run_one(args)
+        return
+
+    print(f"Earth Engine {args.ee_latency * 1000:.0f} ms/request + {args.ee_month_seconds * 1000:.0f} ms/month, "
+          f"Groq {args.llm_latency * 1000:.0f} ms, MongoDB {args.mongo_latency * 1000:.0f} ms/op, "
+          f"{args.years} year(s), concurrent mode {args.workers} workers")
+    report = []
+    for size in args.sizes:
+        runs = [run_mode(args, mode, size) for mode in args.modes]
+        print_size_report(size, runs)
+        report.extend(runs)
+
+    if args.output:
+        with open(args.output, 'w') as handle:
+            json.dump({'settings': {key: value for key, value in vars(args).items()
+                                    if key not in ('run_one', 'mode', 'size', 'command')},
+                       'runs': report}, handle, indent=2)
+
+
+if __name__ == '__main__':
+    main()
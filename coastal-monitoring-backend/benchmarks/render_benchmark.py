@@ -0,0 +1,91 @@
+# render_benchmark.py
+"""Rendering benchmark for the pipeline charts
+
+Renders synthetic 12-month series for N locations and reports wall time
+and output size for the original 300 dpi report PNG, the smaller presets,
+the process pool, and the JSON/SVG outputs used by the web frontend.
+
+    python benchmarks/render_benchmark.py --locations 8
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from visualization import RENDER_PRESETS, VisualizationRenderer, render_outputs, series_payload
+
+
+def synthetic_series(location, months=12, seed=0):
+    rng = np.random.default_rng(seed)
+    df = pd.DataFrame({
+        'date': [f'2023-{month:02d}' for month in range(1, months + 1)],
+        'NDWI': rng.normal(0.1, 0.05, months),
+        'NDCI': rng.normal(0.05, 0.03, months),
+    })
+    df['is_anomaly'] = rng.random(months) < 0.1
+    return df
+
+
+def directory_size(paths):
+    return sum(os.path.getsize(path) for path in paths)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Visualization rendering benchmark')
+    parser.add_argument('--locations', type=int, default=4)
+    parser.add_argument('--workers', type=int, default=os.cpu_count())
+    args = parser.parse_args()
+
+    frames = {f'Region {i}': synthetic_series(f'Region {i}', seed=i) for i in range(args.locations)}
+
+    with tempfile.TemporaryDirectory() as output_dir:
+        rows = []
+        warmup = series_payload(synthetic_series('warmup'), 'warmup')
+        # Pay the matplotlib import before timing anything
+        render_outputs(warmup, os.path.join(output_dir, 'warmup'), 'thumbnail', ('png',))
+
+        for preset in RENDER_PRESETS:
+            start = time.perf_counter()
+            paths = []
+            for location, df in frames.items():
+                basename = os.path.join(output_dir, f"{preset}_{location.replace(' ', '_')}")
+                paths.append(render_outputs(series_payload(df, location), basename, preset, ('png',))['png'])
+            rows.append((f'png {preset} (serial)', time.perf_counter() - start, directory_size(paths)))
+
+        renderer = VisualizationRenderer(os.path.join(output_dir, 'pool'), preset='web',
+                                         formats=('png',), max_workers=args.workers)
+        # Start the workers and import matplotlib in each outside the timing
+        warm = [renderer.get_executor().submit(render_outputs, warmup, os.path.join(output_dir, f'warm{i}'),
+                                               'thumbnail', ('png',)) for i in range(args.workers)]
+        for future in warm:
+            future.result()
+        start = time.perf_counter()
+        futures = [renderer.submit(df, location) for location, df in frames.items()]
+        paths = [future.result()['png'] for future in futures]
+        rows.append((f'png web (pool x{args.workers})', time.perf_counter() - start, directory_size(paths)))
+        renderer.shutdown()
+
+        for fmt in ('json', 'svg'):
+            start = time.perf_counter()
+            paths = []
+            for location, df in frames.items():
+                basename = os.path.join(output_dir, f"{fmt}_{location.replace(' ', '_')}")
+                paths.append(render_outputs(series_payload(df, location), basename, formats=(fmt,))[fmt])
+            rows.append((fmt, time.perf_counter() - start, directory_size(paths)))
+
+    baseline = rows[0][1]
+    print(f"{'output':26} | {'total':>8} | {'per chart':>9} | {'speedup':>7} | {'bytes/chart':>11}")
+    print("-" * 74)
+    for name, seconds, size in rows:
+        print(f"{name:26} | {seconds:7.3f}s | {seconds / args.locations:8.3f}s | "
+              f"{baseline / seconds:6.1f}x | {size // args.locations:11d}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,88 @@
+# startup_benchmark.py
+"""Cold-start benchmark for CoastalAIAnalyst
+
+Each run starts a fresh interpreter, imports the analyst module and builds
+a CoastalAIAnalyst. "lazy" stops there, which is what a worker or API
+server pays at startup. "eager" then touches every resource the old
+constructor and module import set up (Earth Engine, Groq, MongoDB,
+geemap, matplotlib, sklearn), which approximates the previous cold start.
+
+    python benchmarks/startup_benchmark.py --runs 5
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+SNIPPET = r'''
+import json, sys, time
+start = time.perf_counter()
+import coastal_ai_analyst_fixed_1 as module
+imported = time.perf_counter()
+analyst = module.CoastalAIAnalyst(interactive=False)
+constructed = time.perf_counter()
+if sys.argv[1] == "eager":
+    for step in (
+        lambda: analyst.regions,
+        lambda: analyst.insight_client.get_client(),
+        lambda: analyst.client,
+        lambda: __import__("geemap"),
+        lambda: __import__("matplotlib.pyplot"),
+        lambda: __import__("sklearn.ensemble"),
+    ):
+        try:
+            step()
+        except Exception:
+            pass
+finished = time.perf_counter()
+print(json.dumps({
+    "import": imported - start,
+    "construct": constructed - imported,
+    "first_use": finished - constructed,
+    "total": finished - start,
+}))
+'''
+
+
+def run_once(mode, env):
+    output = subprocess.run(
+        [sys.executable, '-c', SNIPPET, mode],
+        cwd=BACKEND_DIR, env=env, capture_output=True, text=True, timeout=300
+    )
+    lines = [line for line in output.stdout.splitlines() if line.startswith('{')]
+    if output.returncode != 0 or not lines:
+        raise RuntimeError(output.stderr.strip() or output.stdout.strip())
+    return json.loads(lines[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description='CoastalAIAnalyst cold-start benchmark')
+    parser.add_argument('--runs', type=int, default=5)
+    parser.add_argument('--modes', nargs='+', default=['lazy', 'eager'], choices=['lazy', 'eager'])
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as cache_dir:
+        env = dict(os.environ)
+        env.update({
+            'COASTAL_INTERACTIVE': '0',
+            'SATELLITE_CACHE_PATH': os.path.join(cache_dir, 'monthly_stats.sqlite'),
+            'LLM_CACHE_PATH': os.path.join(cache_dir, 'llm_responses.sqlite'),
+            'MONGODB_TIMEOUT_MS': '2000',
+        })
+
+        print(f"{'mode':6} | {'import':>8} | {'construct':>9} | {'first use':>9} | {'total':>8}")
+        print("-" * 52)
+        for mode in args.modes:
+            runs = [run_once(mode, env) for _ in range(args.runs)]
+            median = {key: statistics.median(run[key] for run in runs) for key in runs[0]}
+            print(f"{mode:6} | {median['import']:7.3f}s | {median['construct']:8.3f}s | "
+                  f"{median['first_use']:8.3f}s | {median['total']:7.3f}s")
+
+
+if __name__ == '__main__':
+    main()
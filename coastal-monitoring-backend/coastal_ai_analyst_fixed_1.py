@@ -1,104 +1,374 @@
 # coastal_ai_analyst_pro.py
 import ee
-import geemap
-import groq
 import pandas as pd
 import numpy as np
 from datetime import datetime, timedelta
-import matplotlib.pyplot as plt
-import matplotlib.colors as mcolors
-from sklearn.ensemble import IsolationForest
-from sklearn.preprocessing import StandardScaler
-from sklearn.linear_model import LinearRegression
-from sklearn.exceptions import NotFittedError
-import requests
-from pymongo import MongoClient
+from concurrent.futures import ThreadPoolExecutor, as_completed
+import threading
+import time
 import json
 import warnings
 import os
+import sys
 from dotenv import load_dotenv
+from satellite_cache import MonthlyStatsCache
+from batch_analytics import analyze_groups, batch_trends, trends_to_dict
+from tile_grid import build_tile_grid, chunked
+from llm_insights import AsyncInsightClient, PromptCache, CircuitBreaker
+from map_tiles import TileStore
+from mongo_sink import (MONTHLY_COLLECTION, ROLLUP_COLLECTION, SUMMARY_COLLECTION, MongoWriteBehindSink,
+                        ReportRetention, StatusDocumentWriter, bulk_upsert, ensure_analysis_indexes,
+                        get_mongo_client, monthly_metric_updates, summary_update, to_bson)
+from visualization import VisualizationRenderer
+from data_sources import EarthEngineDataSource, LocalRasterDataSource
+from region_registry import RegionRegistry, geometry_polygons, rectangle_geometry
+from instrumentation import attached_run, count, current_run, ee_call, ee_get_info, end_run, memoize, record, start_run, timed
+from request_retry import RetryPolicy, call_with_retry, classify_error, get_request_limiter
+from progress import publish
+from anomaly_models import AnomalyModel, AnomalyModelStore, MongoAnomalyModelStore, RetrainPolicy
+from shoreline import METRES_PER_DEGREE, ShorelineEngine, decimal_years
+from spectral_indices import get_indices, parse_index_names, source_bands
 warnings.filterwarnings('ignore')
 
 load_dotenv()
 
-# Initialize Earth Engine
-try:
-    print("1. Opening browser for authentication...")
-    ee.Authenticate(auth_mode="notebook")
+# geemap, matplotlib, sklearn and groq are imported on first use so that
+# workers and API servers do not pay for them at startup.
 
-    ee.Initialize(project='ee-hetrank08')
+_ee_lock = threading.Lock()
+_ee_initialized = False
+
+
+def ensure_earth_engine(project=None, interactive=False):
+    """Initialize Earth Engine once, on first use
+    
+    Uses a service account when EE_SERVICE_ACCOUNT and EE_PRIVATE_KEY_FILE
+    are set, otherwise stored user credentials. Browser authentication is
+    only attempted when interactive is True.
+    """
+    global _ee_initialized
+    if _ee_initialized:
+        return True
+    
+    with _ee_lock:
+        if _ee_initialized:
+            return True
+        
+        project = project or os.getenv('EE_PROJECT', 'ee-hetrank08')
+        service_account = os.getenv('EE_SERVICE_ACCOUNT')
+        key_file = os.getenv('EE_PRIVATE_KEY_FILE')
+        
+        try:
+            if service_account and key_file:
+                credentials = ee.ServiceAccountCredentials(service_account, key_file)
+                ee.Initialize(credentials, project=project)
+            else:
+                try:
+                    ee.Initialize(project=project)
+                except Exception:
+                    if not interactive:
+                        raise
+                    print("1. Opening browser for authentication...")
+                    ee.Authenticate(auth_mode="notebook")
+                    ee.Initialize(project=project)
+            _ee_initialized = True
+        except Exception as e:
+            print("Please authenticate Earth Engine first:")
+            print("Run: ee.Authenticate() and then ee.Initialize()")
+            raise
     
-except Exception as e:
-    print("Please authenticate Earth Engine first:")
-    print("Run: ee.Authenticate() and then ee.Initialize()")
+    return True
 
 class CoastalAIAnalyst:
-    def __init__(self, mongodb_uri=None):
-        self.mongodb_uri = os.getenv('MONGODB_URI')
+    def __init__(self, mongodb_uri=None, groq_api_key=None, ee_project=None, interactive=None, headless=None):
+        """Cheap constructor; Earth Engine, Groq, MongoDB and plotting start on first use
         
-        self.groq_api_key = os.getenv('GROQ_API_KEY')
-        if not self.groq_api_key:
+        interactive defaults to COASTAL_INTERACTIVE and controls whether a
+        missing Groq key or Earth Engine login may prompt the user.
+        headless (COASTAL_HEADLESS, default: not interactive) skips building
+        the interactive geemap map in the pipeline.
+        """
+        if interactive is None:
+            interactive = os.getenv('COASTAL_INTERACTIVE', '').lower() in ('1', 'true', 'yes')
+        self.interactive = interactive
+        if headless is None:
+            headless = os.getenv('COASTAL_HEADLESS', '0' if interactive else '1').lower() in ('1', 'true', 'yes')
+        self.headless = headless
+        self.ee_project = ee_project
+        self.mongodb_uri = mongodb_uri or os.getenv('MONGODB_URI')
+        
+        self.groq_api_key = groq_api_key or os.getenv('GROQ_API_KEY')
+        if not self.groq_api_key and self.interactive:
             self.groq_api_key = input("Please enter your Groq API key: ").strip()
             os.environ['GROQ_API_KEY'] = self.groq_api_key
         
-        # Initialize Groq client
-        try:
-            self.groq_client = groq.Groq(api_key=self.groq_api_key)
-        except Exception as e:
-            self.groq_client = None
+        # Groq client is created on first use (GROQ_BASE_URL can point at llm_stub_server.py)
+        self.groq_base_url = os.getenv('GROQ_BASE_URL') or None
         
-        self.regions = {
-            'Sunderbans': ee.Geometry.Rectangle(88.0, 21.5, 89.5, 22.5),
-            'Pulicat Lake': ee.Geometry.Rectangle(80.0, 13.3, 80.5, 13.8),
-            'Goa Coast': ee.Geometry.Rectangle(73.5, 15.0, 74.5, 16.0),
-            'Kochi': ee.Geometry.Rectangle(76.0, 9.8, 76.5, 10.2)
-        }
+        # Groq models tried in order for insights
+        self.groq_models = [
+            "llama3-8b-8192",      
+            "mixtral-8x7b-32768",  
+            "gemma-7b-it",         
+            "llama3-70b-8192"      
+        ]
+        
+        prompt_cache = None
+        if os.getenv('LLM_CACHE_DISABLED', '').lower() not in ('1', 'true', 'yes'):
+            try:
+                prompt_cache = PromptCache()
+            except Exception as e:
+                print(f"LLM response cache unavailable: {e}")
+        self.insight_client = AsyncInsightClient(
+            self.groq_api_key,
+            self.groq_models,
+            base_url=self.groq_base_url,
+            timeout_seconds=float(os.getenv('GROQ_TIMEOUT_SECONDS', '20')),
+            cache=prompt_cache,
+            breaker=CircuitBreaker(cooldown_seconds=float(os.getenv('GROQ_BREAKER_COOLDOWN_SECONDS', '300')))
+        )
+        
+        # Monitored regions with precomputed bounds (west, south, east, north) and
+        # centroids; Earth Engine geometries are built lazily
+        self.registry = self.load_region_registry()
+        self.region_bounds = self.registry.bounds_by_name()
+        self._regions = None
+        
+        # Extraction parameters (also part of the monthly cache key)
+        self.cloud_threshold = 30
+        self.reduce_scale = 500
+        # NDWI and NDCI drive the analysis; SPECTRAL_INDICES adds more (e.g. "MNDWI,FAI").
+        # Only the source bands of these indices are composited and reduced.
+        self.index_names = parse_index_names(os.getenv('SPECTRAL_INDICES'), required=('NDWI', 'NDCI'))
+        self.source_bands = source_bands(self.index_names)
+        
+        # Where monthly statistics come from: Earth Engine, or archived scenes on disk
+        self.data_source = self.build_data_source(os.getenv('SATELLITE_DATA_SOURCE', 'earthengine'))
+        
+        # Earth Engine requests are retried with backoff under a process-wide concurrency cap
+        self.ee_retry = RetryPolicy(
+            max_attempts=int(os.getenv('EE_MAX_ATTEMPTS', '5')),
+            base_delay=float(os.getenv('EE_RETRY_BASE_SECONDS', '1')),
+            rate_limit_delay=float(os.getenv('EE_RATE_LIMIT_BASE_SECONDS', '5')),
+            max_delay=float(os.getenv('EE_RETRY_MAX_SECONDS', '60'))
+        )
+        self.ee_limiter = get_request_limiter('earthengine', int(os.getenv('EE_MAX_CONCURRENT_REQUESTS', '8')))
+        # Months requested in parallel by per-month extraction
+        self.month_workers = int(os.getenv('EE_MONTH_WORKERS', '4'))
+        
+        # Shoreline change along shore-normal transects of monthly NDWI water masks
+        self.shoreline_enabled = os.getenv('SHORELINE_ANALYSIS', '1').lower() not in ('0', 'false', 'no')
+        water_threshold = os.getenv('SHORELINE_NDWI_THRESHOLD', '0')
+        self.shoreline = ShorelineEngine(
+            water_threshold=water_threshold if water_threshold == 'otsu' else float(water_threshold),
+            spacing_m=float(os.getenv('SHORELINE_TRANSECT_SPACING_M', '50')),
+            transect_length_m=float(os.getenv('SHORELINE_TRANSECT_LENGTH_M', '500')),
+            erosion_rate=float(os.getenv('SHORELINE_EROSION_RATE', '2')),
+            min_transect_pixels=int(os.getenv('SHORELINE_MIN_TRANSECT_PIXELS', '10')),
+            max_reliable_pixel_m=float(os.getenv('SHORELINE_MAX_RELIABLE_PIXEL_M', '60'))
+        )
+        self.shoreline_scale = float(os.getenv('SHORELINE_SCALE_M', '20'))
+        self.shoreline_max_pixels = int(os.getenv('SHORELINE_MAX_PIXELS', '250000'))
+        self.shoreline_max_months = int(os.getenv('SHORELINE_MAX_MONTHS', '24'))
+        
+        # NDWI, NDCI and threat layers are rendered once per analysis into a static tile store
+        self.tile_store = None
+        if os.getenv('MAP_LAYERS', '1').lower() not in ('0', 'false', 'no'):
+            try:
+                self.tile_store = TileStore(max_tiles=int(os.getenv('MAP_LAYER_MAX_TILES', '256')))
+            except Exception as e:
+                print(f"Tile store unavailable: {e}")
+        
+        # On-disk cache of monthly statistics
+        self.stats_cache = None
+        if os.getenv('SATELLITE_CACHE_DISABLED', '').lower() not in ('1', 'true', 'yes'):
+            try:
+                cache_ttl = os.getenv('SATELLITE_CACHE_TTL_SECONDS')
+                self.stats_cache = MonthlyStatsCache(
+                    ttl_seconds=int(cache_ttl) if cache_ttl else None
+                )
+            except Exception as e:
+                print(f"Satellite cache unavailable: {e}")
+        
+        # AI components are built per call from these settings
+        self.anomaly_contamination = 0.1
+        self.random_state = 42
+        
+        # Fitted anomaly models are stored per location and reused until retraining is due
+        self.anomaly_model_backend = os.getenv('ANOMALY_MODEL_STORE', 'file')
+        self.anomaly_retrain = RetrainPolicy(
+            max_age_days=float(os.getenv('ANOMALY_RETRAIN_DAYS', '90')),
+            drift_threshold=float(os.getenv('ANOMALY_DRIFT_THRESHOLD', '1.5'))
+        )
+        self._anomaly_models = None
+        if self.anomaly_model_backend == 'file':
+            try:
+                self._anomaly_models = AnomalyModelStore(
+                    keep_versions=int(os.getenv('ANOMALY_MODEL_KEEP_VERSIONS', '5'))
+                )
+            except Exception as e:
+                print(f"Anomaly model store unavailable: {e}")
         
-        # Initialize AI components
-        self.anomaly_detector = IsolationForest(contamination=0.1, random_state=42)
-        self.scaler = StandardScaler()
-        self.trend_model = LinearRegression()
+        # Pipeline charts are rendered headlessly in a process pool
+        self.renderer = VisualizationRenderer(
+            output_dir=os.getenv('VISUALIZATION_DIR', '.'),
+            preset=os.getenv('VISUALIZATION_PRESET', 'web'),
+            formats=[fmt.strip() for fmt in os.getenv('VISUALIZATION_FORMATS', 'png,json,svg').split(',') if fmt.strip()],
+            max_workers=int(os.getenv('VISUALIZATION_WORKERS', '2'))
+        )
         
-        # MongoDB connection
+        # MongoDB connects on first use
+        self.mongo_lock = threading.Lock()
+        self._mongo_connected = False
+        self._client = None
+        self.db = None
+        self.collection = None
+        self.map_collection = None
+        self.summary_collection = None
+        self.monthly_collection = None
+        self.retention = None
+        self.sink = None
+        self.status_writer = None
+        # Each finished region is flushed at once so it is readable while the rest still run
+        self.flush_each_region = os.getenv('MONGODB_FLUSH_EACH_REGION', '1').lower() not in ('0', 'false', 'no')
+    
+    def build_data_source(self, name):
+        if name == 'local':
+            return LocalRasterDataSource(
+                region_bounds=self.region_bounds,
+                index_names=self.index_names,
+                cloud_threshold=self.cloud_threshold
+            )
+        if name != 'earthengine':
+            raise ValueError(f"Unknown satellite data source: {name}")
+        return EarthEngineDataSource(self)
+    
+    def load_region_registry(self):
+        """Regions from regions.geojson, or from MongoDB with REGION_REGISTRY_SOURCE=mongo"""
+        if os.getenv('REGION_REGISTRY_SOURCE', 'file') == 'mongo':
+            try:
+                registry = RegionRegistry.from_mongo(get_mongo_client(self.mongodb_uri)['hackout25']['regions'])
+                if len(registry):
+                    return registry
+                print("No regions stored in MongoDB, using the region file")
+            except Exception as e:
+                print(f"Failed to load regions from MongoDB, using the region file: {e}")
+        return RegionRegistry.from_geojson()
+    
+    @property
+    def regions(self):
+        """Earth Engine geometries for each region (initializes Earth Engine)"""
+        if self._regions is None:
+            ensure_earth_engine(self.ee_project, self.interactive)
+            self._regions = {
+                name: ee.Geometry(self.registry.geometry(name), None, False) for name in self.registry
+            }
+        return self._regions
+    
+    @property
+    def anomaly_models(self):
+        """Store of fitted anomaly models (None when disabled or unavailable)"""
+        if self.anomaly_model_backend == 'mongo' and self._anomaly_models is None and self.client:
+            with self.mongo_lock:
+                if self._anomaly_models is None and self.anomaly_model_backend == 'mongo':
+                    try:
+                        self._anomaly_models = MongoAnomalyModelStore(
+                            self.db['anomaly_models'],
+                            keep_versions=int(os.getenv('ANOMALY_MODEL_KEEP_VERSIONS', '5'))
+                        )
+                    except Exception as e:
+                        print(f"Anomaly model store unavailable, fitting models per run: {e}")
+                        self.anomaly_model_backend = None
+        return self._anomaly_models
+    
+    @property
+    def client(self):
+        """MongoDB client (connects on first use, None if the connection failed)"""
+        if not self._mongo_connected:
+            self.connect_mongodb()
+        return self._client
+    
+    def connect_mongodb(self):
+        with self.mongo_lock:
+            if self._mongo_connected:
+                return self._client
+            self._mongo_connected = True
+            
+            # MongoDB connection (one pooled client per URI, shared across analysts)
+            try:
+                self._client = get_mongo_client(self.mongodb_uri)
+                self.db = self._client['hackout25']  # Changed to match backend database
+                self.collection = self.db['ai_analysis']
+                self.map_collection = self.db['map_configurations']
+                self.status_writer = StatusDocumentWriter(self.db['analysis_status'])
+                print("Connected to MongoDB successfully")
+                
+                # Latest report per location and per-month metrics, maintained as reports land
+                self.summary_collection = self.db[SUMMARY_COLLECTION]
+                self.monthly_collection = self.db[MONTHLY_COLLECTION]
+                try:
+                    ensure_analysis_indexes(self.db)
+                except Exception as e:
+                    print(f"Could not create analysis indexes: {e}")
+                
+                # Full reports past the retention are rolled up into monthly counts
+                self.retention = ReportRetention(
+                    self.collection,
+                    self.db[ROLLUP_COLLECTION],
+                    keep_reports=int(os.getenv('ANALYSIS_REPORT_KEEP', '10')),
+                    max_age_days=float(os.getenv('ANALYSIS_REPORT_RETENTION_DAYS', '90'))
+                )
+                
+                # Write-behind buffering of results, map configs and monthly metrics
+                if os.getenv('MONGODB_WRITE_BEHIND', '1').lower() not in ('0', 'false', 'no'):
+                    self.sink = MongoWriteBehindSink(
+                        self.db,
+                        flush_size=int(os.getenv('MONGODB_FLUSH_SIZE', '50')),
+                        flush_interval=float(os.getenv('MONGODB_FLUSH_INTERVAL', '5')),
+                        retention=self.retention
+                    )
+                    self.sink.start()
+            except Exception as e:
+                print(f"MongoDB connection failed: {e}")
+                self._client = None
+            return self._client
+
+    def report_progress(self, event_type, location=None, **fields):
+        """Publish a progress event and mirror it into the location's status document"""
+        event = publish(event_type, location, **fields)
+        if location and self.client and self.status_writer:
+            self.status_writer.update(event)
+        return event
+
+    def generate_ai_insights(self, location, df, trends, anomalies):
+        insight_future = self.request_ai_insights(location, df, trends, anomalies)
+        return self.resolve_ai_insights(insight_future, location, df, trends, anomalies)
+    
+    def request_ai_insights(self, location, df, trends, anomalies):
+        """Start LLM insight generation in the background and return its future"""
+        prompt = self.build_insight_prompt(location, df, trends, anomalies)
+        future = self.insight_client.submit(prompt)
+        # The request finishes on the LLM loop thread, so attribute its latency explicitly
+        run, start = current_run(), time.perf_counter()
+        future.add_done_callback(lambda done: record('groq.insight', time.perf_counter() - start, run))
+        return future
+    
+    def resolve_ai_insights(self, insight_future, location, df, trends, anomalies):
+        """Wait for a requested insight, falling back to the rule-based report"""
         try:
-            self.client = MongoClient(mongodb_uri)
-            self.db = self.client['hackout25']  # Changed to match backend database
-            self.collection = self.db['ai_analysis']
-            self.map_collection = self.db['map_configurations']
-            print("Connected to MongoDB successfully")
+            model, groq_response = insight_future.result()
         except Exception as e:
-            print(f"MongoDB connection failed: {e}")
-            self.client = None
-
-    def query_groq_api(self, prompt, model="llama3-8b-8192"):
-      """Use Groq's ultra-fast inference API"""
-      if not hasattr(self, 'groq_client') or not self.groq_client:
-          return None
-          
-      try:
-          print(f"Using Groq with {model}...")
-          
-          chat_completion = self.groq_client.chat.completions.create(
-              messages=[
-                  {
-                      "role": "user",
-                      "content": prompt,
-                  }
-              ],
-              model=model,
-              temperature=0.7,
-              max_tokens=1024,
-              top_p=0.8,
-              stream=False,
-          )
-          
-          return chat_completion.choices[0].message.content
-          
-      except Exception as e:
-          print(f"Groq API call failed: {e}")
-          return None
+            print(f"Groq insight generation failed: {e}")
+            model, groq_response = None, None
+        
+        if groq_response:
+            return f"GROQ AI ANALYSIS ({model}):\n{groq_response}"
+        
+        # Fallback to enhanced rule-based system
+        print("Using enhanced rule-based analysis (Groq unavailable)")
+        return self.generate_enhanced_insights(location, df, trends, anomalies)
     
-    def generate_ai_insights(self, location, df, trends, anomalies):
+    def build_insight_prompt(self, location, df, trends, anomalies):
         latest = df.iloc[-1] if len(df) > 0 else {}
         
         prompt = f"""
@@ -126,23 +396,7 @@ Please provide a comprehensive professional assessment including:
 
 Write in clear, actionable language suitable for government officials.
 """
-        
-        # Try Groq API with multiple model options
-        groq_models = [
-            "llama3-8b-8192",      
-            "mixtral-8x7b-32768",  
-            "gemma-7b-it",         
-            "llama3-70b-8192"      
-        ]
-        
-        for model in groq_models:
-            groq_response = self.query_groq_api(prompt, model)
-            if groq_response:
-                return f"GROQ AI ANALYSIS ({model}):\n{groq_response}"
-        
-        # Fallback to enhanced rule-based system
-        print("Using enhanced rule-based analysis (Groq unavailable)")
-        return self.generate_enhanced_insights(location, df, trends, anomalies)
+        return prompt
     
     def generate_enhanced_insights(self, location, df, trends, anomalies):
         latest = df.iloc[-1] if len(df) > 0 else {}
@@ -289,28 +543,44 @@ Anomalies Detected: {len(anomalies)}
         recommendations.extend(base_recommendations.get(threat_level, []))
         return "\n".join([f"• {rec}" for rec in recommendations])
     
+    def region_metadata(self, location):
+        """Centre, outline and bounds of a region, computed once per run without Earth Engine"""
+        def compute():
+            region = self.registry.summary(location)
+            return {
+                'center': region['center'],
+                'coordinates': geometry_polygons(self.registry.geometry(location))[0][0],
+                'bounds': rectangle_geometry(region['bounds'])
+            }
+        return memoize(('region_metadata', location), compute)
+    
     def save_map_configuration(self, location, map_settings):
         if not self.client:
             return False
         
         try:
-            region = self.regions[location]
-            coords = region.getInfo()['coordinates'][0]
+            region = self.region_metadata(location)
             
             map_config = {
                 'location': location,
                 'map_settings': map_settings,
-                'coordinates': coords,
-                'center': [sum(y for x, y in coords)/len(coords), sum(x for x, y in coords)/len(coords)],
-                'bounds': region.bounds().getInfo(),
+                'coordinates': region['coordinates'],
+                'center': region['center'],
+                'bounds': region['bounds'],
                 'created_at': datetime.now()
             }
             
-            result = self.map_collection.update_one(
-                {'location': location},
-                {'$set': map_config},
-                upsert=True
-            )
+            if self.sink:
+                self.sink.add_map_config(location, map_config)
+                print(f"Map configuration queued for {location}")
+                return True
+            
+            with timed('mongo.update_one'):
+                result = self.map_collection.update_one(
+                    {'location': location},
+                    {'$set': to_bson(map_config)},
+                    upsert=True
+                )
             
             print(f"Map configuration saved for {location}")
             return True
@@ -322,18 +592,19 @@ Anomalies Detected: {len(anomalies)}
     def generate_gee_map(self, location):
         """Generate a GEE map for the specified location"""
         try:
+            import geemap
+            
             region = self.regions[location]
             collection = self.get_sentinel_data(location, '2024-01-01', '2024-01-15')
             recent_image = collection.median()
             
-            Map = geemap.Map(
-                center=[region.centroid().coordinates().getInfo()[1], 
-                       region.centroid().coordinates().getInfo()[0]],
-                zoom=10
-            )
+            Map = geemap.Map(center=self.region_metadata(location)['center'], zoom=10)
             
+            # Each layer costs one map-id request
             Map.addLayer(recent_image, {'bands': ['B4', 'B3', 'B2'], 'min': 0, 'max': 3000}, 'Satellite View')
             Map.addLayer(region, {'color': 'red'}, 'Study Area')
+            count('ee_calls', 2)
+            count('ee_calls.map_layer', 2)
             
             print(f"GEE map generated for {location}")
             return Map
@@ -353,113 +624,698 @@ Anomalies Detected: {len(anomalies)}
         return collection
     
     def calculate_indices(self, image):
-        """Calculate environmental indices"""
-        ndwi = image.normalizedDifference(['B3', 'B8']).rename('NDWI')
-        ndci = image.normalizedDifference(['B5', 'B4']).rename('NDCI')
-        return image.addBands([ndwi, ndci])
+        """Calculate the configured environmental indices, one band each"""
+        return ee.Image.cat([index.ee_image(image) for index in get_indices(self.index_names)])
+    
+    def index_composite(self, collection):
+        """Median of the index bands, computed from only the source bands they read"""
+        return collection.select(self.source_bands).map(self.calculate_indices).median()
     
-    def extract_time_series_data(self, location, years=1):
+    def get_month_windows(self, years=1, start=None, end=None):
+        """List (year, month, start_date, end_date) for every month analysed
+        
+        start and end are inclusive (year, month) tuples; by default the
+        window covers the `years` calendar years before 2024.
+        """
+        year, month = start or (2024 - years, 1)
+        end_year, end_month = end or (2023, 12)
+        
+        windows = []
+        while (year, month) <= (end_year, end_month):
+            start_date = f'{year}-{month:02d}-01'
+            end_date = f'{year}-{month+1:02d}-01' if month < 12 else f'{year+1}-01-01'
+            windows.append((year, month, start_date, end_date))
+            year, month = (year, month + 1) if month < 12 else (year + 1, 1)
+        return windows
+    
+    def extract_time_series_data(self, location, years=1, batched=False, windows=None):
         """Extract multi-year time series data"""
-        all_data = []
         print(f"Starting data collection for {location}...")
+        if windows is None:
+            windows = self.get_month_windows(years)
+        return self.monthly_frame(location, windows, self.collect_monthly_stats(location, windows, batched))
+    
+    def collect_monthly_stats(self, location, windows, batched=False):
+        """{start_date: stats} from the cache or the data source; {} means no imagery, failed months are absent"""
+        monthly_stats = {}
+        missing = []
+        for window in windows:
+            stats = self.get_cached_month(location, window)
+            if stats is None:
+                missing.append(window)
+            else:
+                monthly_stats[window[2]] = stats
         
-        for year in range(2024 - years, 2024):
-            for month in range(1, 13):
-                start_date = f'{year}-{month:02d}-01'
-                end_date = f'{year}-{month+1:02d}-01' if month < 12 else f'{year+1}-01-01'
-                
+        count('months.cached', len(windows) - len(missing))
+        count('months.fetched', len(missing))
+        if missing:
+            monthly_stats.update(self.fetch_and_cache_months(location, missing, batched=batched))
+        count('months.no_imagery', sum(1 for window in windows if monthly_stats.get(window[2]) == {}))
+        print(f"{location}: Collected {sum(1 for stats in monthly_stats.values() if stats)} monthly data points "
+              f"({len(windows) - len(missing)} from cache)")
+        return monthly_stats
+    
+    def monthly_frame(self, location, windows, monthly_stats):
+        """One row per month with imagery"""
+        all_data = []
+        for year, month, start_date, end_date in windows:
+            stats = monthly_stats.get(start_date)
+            if stats:
+                stats = dict(stats)
+                stats['location'] = location
+                stats['year'] = year
+                stats['month'] = month
+                stats['date'] = f'{year}-{month:02d}'
+                all_data.append(stats)
+        return pd.DataFrame(all_data)
+    
+    def fetch_and_cache_months(self, location, windows, batched=False):
+        """Fetch months from the data source, caching successes and recording failures"""
+        failures = {}
+        fetched = self.data_source.fetch_months(location, windows, batched=batched, failures=failures)
+        
+        for window in windows:
+            start_date = window[2]
+            if start_date in fetched:
+                self.cache_month(location, window, fetched[start_date])
+                self.report_progress('month_extracted', location, month=start_date[:7],
+                                     has_imagery=bool(fetched[start_date]))
+                continue
+            count('months.failed')
+            failure = failures.get(start_date, {'reason': 'no result returned', 'kind': 'unknown', 'attempts': 1})
+            print(f"{location} {start_date}: extraction failed ({failure['kind']}: {failure['reason']})")
+            self.report_progress('month_failed', location, month=start_date[:7],
+                                 reason=failure['reason'], kind=failure['kind'])
+            if self.stats_cache:
+                try:
+                    self.stats_cache.record_failure(
+                        location, start_date, window[3], failure['reason'], failure['kind'], failure['attempts']
+                    )
+                except Exception as e:
+                    print(f"Could not record failed month {location} {start_date}: {e}")
+        return fetched
+    
+    def get_failed_months(self, location=None):
+        """Months still missing after earlier extraction failures"""
+        if not self.stats_cache:
+            return []
+        try:
+            return self.stats_cache.failed_months(location)
+        except Exception as e:
+            print(f"Could not read failed months: {e}")
+            return []
+    
+    def failed_month_windows(self, location):
+        windows = []
+        for failure in self.get_failed_months(location):
+            year, month = (int(part) for part in failure['start_date'].split('-')[:2])
+            windows.append((year, month, failure['start_date'], failure['end_date']))
+        return windows
+    
+    def backfill_failed_months(self, locations=None, batched=False):
+        """Re-fetch only the months that failed earlier; returns {location: [recovered start dates]}"""
+        locations = locations or sorted({failure['location'] for failure in self.get_failed_months()})
+        recovered = {}
+        for location in locations:
+            windows = self.failed_month_windows(location)
+            if not windows:
+                continue
+            print(f"{location}: backfilling {len(windows)} failed months")
+            fetched = self.fetch_and_cache_months(location, windows, batched=batched)
+            recovered[location] = [window[2] for window in windows if window[2] in fetched]
+            count('months.backfilled', len(recovered[location]))
+            print(f"{location}: recovered {len(recovered[location])} of {len(windows)} months")
+        return recovered
+    
+    def get_region_geojson(self, location):
+        """Client-side GeoJSON for a region, without touching Earth Engine"""
+        return self.registry.geometry(location)
+    
+    def get_cache_key(self, location, start_date):
+        region = self.get_region_geojson(location)
+        if self.data_source.name != 'earthengine':
+            # Local composites are not interchangeable with Earth Engine reductions
+            region = dict(region, source=self.data_source.name)
+        return MonthlyStatsCache.make_key(
+            region, start_date,
+            self.cloud_threshold, self.reduce_scale, self.index_names
+        )
+    
+    def get_cached_month(self, location, window):
+        """Return cached stats for a month window, or None if it must be fetched"""
+        if not self.stats_cache:
+            return None
+        try:
+            return self.stats_cache.get(self.get_cache_key(location, window[2]))
+        except Exception as e:
+            print(f"Cache read failed for {location} {window[2]}: {e}")
+            return None
+    
+    def cache_month(self, location, window, stats):
+        if not self.stats_cache:
+            return
+        year, month, start_date, end_date = window
+        try:
+            self.stats_cache.put(
+                self.get_cache_key(location, start_date), location, f'{year}-{month:02d}',
+                stats, MonthlyStatsCache.is_closed_month(end_date)
+            )
+            self.stats_cache.clear_failure(location, start_date)
+        except Exception as e:
+            print(f"Cache write failed for {location} {start_date}: {e}")
+    
+    def ee_request(self, obj, label):
+        """getInfo() with retries, backoff and the shared Earth Engine concurrency cap"""
+        return call_with_retry(lambda: ee_get_info(obj, label), label, self.ee_retry, self.ee_limiter)
+    
+    def fetch_month(self, location, start_date, end_date):
+        """Stats for one month from its own requests; {} marks a month without imagery"""
+        collection = self.get_sentinel_data(location, start_date, end_date, self.cloud_threshold)
+        if self.ee_request(collection.size(), 'collection_size') == 0:
+            return {}
+        
+        # Mapping indices keeps the collection size, so no second size check is needed
+        # One mean reducer over all index bands, whatever indices are configured
+        stats = self.ee_request(self.index_composite(collection).reduceRegion(
+            reducer=ee.Reducer.mean(),
+            geometry=self.regions[location],
+            scale=self.reduce_scale,
+            bestEffort=True
+        ), 'reduce_region')
+        return stats or {}
+    
+    def fetch_months(self, location, windows, failures=None):
+        """Reduce each month with its own requests, several months at a time"""
+        fetched = {}
+        run = current_run()
+        
+        def fetch(start_date, end_date):
+            with attached_run(run):
+                return self.fetch_month(location, start_date, end_date)
+        
+        workers = max(1, min(self.month_workers, len(windows)))
+        with ThreadPoolExecutor(max_workers=workers, thread_name_prefix='ee-month') as executor:
+            futures = {
+                executor.submit(fetch, start_date, end_date): start_date
+                for year, month, start_date, end_date in windows
+            }
+            for future in as_completed(futures):
+                start_date = futures[future]
                 try:
-                    collection = self.get_sentinel_data(location, start_date, end_date)
-                    if collection.size().getInfo() == 0:
-                        continue
-                        
-                    processed_collection = collection.map(self.calculate_indices)
-                    if processed_collection.size().getInfo() > 0:
-                        median_image = processed_collection.median()
-                        stats = median_image.reduceRegion(
-                            reducer=ee.Reducer.mean(),
-                            geometry=self.regions[location],
-                            scale=500,
-                            bestEffort=True
-                        ).getInfo()
-                        
-                        if stats:
-                            stats['location'] = location
-                            stats['year'] = year
-                            stats['month'] = month
-                            stats['date'] = f'{year}-{month:02d}'
-                            all_data.append(stats)
-                            
+                    fetched[start_date] = future.result()
                 except Exception as e:
+                    if failures is not None:
+                        failures[start_date] = {
+                            'reason': str(e),
+                            'kind': classify_error(e),
+                            'attempts': getattr(e, 'attempts', 1)
+                        }
+        
+        return fetched
+    
+    def fetch_months_batched(self, location, windows, failures=None):
+        """Reduce all months in a single server-side computation and one getInfo()
+        
+        If the batched request fails for any reason other than rate limiting
+        (e.g. it times out or runs out of memory), the months are fetched
+        one by one instead.
+        """
+        region = self.regions[location]
+        
+        months = [
+            ee.Feature(None, {'start_date': start_date, 'end_date': end_date})
+            for year, month, start_date, end_date in windows
+        ]
+        
+        def reduce_month(feature):
+            collection = self.get_sentinel_data(
+                location, ee.Date(feature.get('start_date')), ee.Date(feature.get('end_date')),
+                self.cloud_threshold
+            )
+            stats = self.index_composite(collection).reduceRegion(
+                reducer=ee.Reducer.mean(),
+                geometry=region,
+                scale=self.reduce_scale,
+                bestEffort=True
+            )
+            return feature.set(stats).set('image_count', collection.size())
+        
+        try:
+            features = self.ee_request(ee.FeatureCollection(months).map(reduce_month), 'batched_months')['features']
+        except Exception as e:
+            kind = classify_error(e)
+            print(f"Batched extraction failed for {location} ({kind}): {e}")
+            if kind != 'rate_limit':
+                return self.fetch_months(location, windows, failures)
+            if failures is not None:
+                for window in windows:
+                    failures[window[2]] = {'reason': str(e), 'kind': kind, 'attempts': getattr(e, 'attempts', 1)}
+            return {}
+        
+        fetched = {}
+        for feature in features:
+            stats = dict(feature['properties'])
+            start_date = stats.pop('start_date')
+            stats.pop('end_date', None)
+            image_count = stats.pop('image_count', 0)
+            fetched[start_date] = stats if image_count else {}
+        
+        print(f"{location}: Reduced {len(windows)} months in 1 request")
+        return fetched
+    
+    def fetch_index_rasters(self, location, windows, index_name='NDWI', max_pixels=250000):
+        """Monthly median rasters of one index, every month in one computePixels request
+        
+        The grid covers the region's bounding box at SHORELINE_SCALE_M, or
+        coarser when that would exceed max_pixels. Months without imagery
+        are left out.
+        """
+        index = get_indices([index_name])[0]
+        west, south, east, north = self.region_bounds[location]
+        width_m = (east - west) * METRES_PER_DEGREE * np.cos(np.radians((south + north) / 2))
+        height_m = (north - south) * METRES_PER_DEGREE
+        scale = max(self.shoreline_scale, np.sqrt(width_m * height_m / max_pixels))
+        width = max(1, int(np.ceil(width_m / scale)))
+        height = max(1, int(np.ceil(height_m / scale)))
+        nodata = -9999
+        
+        months = []
+        for year, month, start_date, end_date in windows:
+            collection = self.get_sentinel_data(location, start_date, end_date, self.cloud_threshold)
+            composite = collection.select(list(index.bands)).map(index.ee_image).median()
+            months.append(ee.Image(ee.Algorithms.If(
+                collection.size().gt(0), composite, ee.Image.constant(nodata)
+            )).rename(f'm{len(months)}').unmask(nodata).toFloat())
+        
+        request = {
+            'expression': ee.Image.cat(months),
+            'fileFormat': 'NUMPY_NDARRAY',
+            'grid': {
+                'dimensions': {'width': width, 'height': height},
+                'affineTransform': {
+                    'scaleX': (east - west) / width, 'shearX': 0, 'translateX': west,
+                    'shearY': 0, 'scaleY': -(north - south) / height, 'translateY': north
+                },
+                'crsCode': 'EPSG:4326'
+            }
+        }
+        pixels = call_with_retry(
+            lambda: ee_call(lambda: ee.data.computePixels(request), 'index_rasters'),
+            'index_rasters', self.ee_retry, self.ee_limiter
+        )
+        
+        rasters = {}
+        for position, window in enumerate(windows):
+            raster = np.array(pixels[f'm{position}'], dtype=np.float32)
+            raster[raster <= nodata] = np.nan
+            if np.isfinite(raster).any():
+                rasters[window[2]] = raster
+        print(f"{location}: {len(rasters)} {index_name} rasters of {width}x{height} px at {scale:.0f} m in 1 request")
+        return {'bounds': (west, south, east, north), 'rasters': rasters} if rasters else None
+    
+    def monthly_rasters(self, location, months, index_name='NDWI'):
+        """Rasters of one index for 'YYYY-MM' months from the data source; None if unavailable"""
+        months = sorted(months)
+        if not months:
+            return None
+        start, end = ((int(month[:4]), int(month[5:7])) for month in (months[0], months[-1]))
+        windows = [
+            window for window in self.get_month_windows(start=start, end=end)
+            if f'{window[0]}-{window[1]:02d}' in months
+        ]
+        try:
+            return self.data_source.fetch_index_rasters(location, windows, index_name, self.shoreline_max_pixels)
+        except Exception as e:
+            print(f"{index_name} rasters unavailable for {location}: {e}")
+            return None
+    
+    def measure_shoreline(self, location, fetched):
+        """Shoreline change from monthly NDWI rasters; None without enough months or a shoreline"""
+        if not fetched or len(fetched['rasters']) < 2:
+            return None
+        
+        dates = sorted(fetched['rasters'])
+        with timed('shoreline.analyze'):
+            result = self.shoreline.analyze(
+                np.stack([fetched['rasters'][date] for date in dates]), fetched['bounds'], dates
+            )
+        if result:
+            summary = result['summary']
+            print(f"{location}: {summary['measured_transects']}/{summary['transects']} transects measured, "
+                  f"median rate {summary.get('median_rate_m_per_year', 0):+.2f} m/yr")
+        return result
+    
+    def threat_heatmap(self, ndwi, ndci):
+        """Per-pixel threat in [0, 1] from the NDWI change rate and current NDCI
+        
+        Uses the thresholds of assess_threat_level: an NDWI change of 0.1 per
+        year or an NDCI of 0.15 each contribute a quarter.
+        """
+        dates = sorted(ndwi['rasters'])
+        years = max(1 / 12, (decimal_years(dates[-1:]) - decimal_years(dates[:1]))[0])
+        water_change = np.abs(ndwi['rasters'][dates[-1]] - ndwi['rasters'][dates[0]]) / years
+        chlorophyll = ndci if ndci is not None else np.full_like(water_change, np.nan)
+        heat = (0.5 * np.clip(np.nan_to_num(water_change) / 0.2, 0, 1)
+                + 0.5 * np.clip(np.nan_to_num(chlorophyll) / 0.3, 0, 1))
+        return np.where(np.isnan(water_change) & np.isnan(chlorophyll), np.nan, heat).astype(np.float32)
+    
+    def render_map_layers(self, location, ndwi):
+        """Render the NDWI, NDCI and threat layers of the latest month into the tile store
+        
+        Reuses the NDWI rasters already fetched for the shoreline stage; NDCI
+        costs one more request for the latest month. Returns {layer: description}.
+        """
+        if not self.tile_store or not ndwi:
+            return {}
+        month = max(ndwi['rasters'])
+        latest_ndwi = ndwi['rasters'][month]
+        ndci = self.monthly_rasters(location, [month[:7]], 'NDCI')
+        latest_ndci = ndci['rasters'].get(month) if ndci else None
+        if latest_ndci is not None and latest_ndci.shape != latest_ndwi.shape:
+            latest_ndci = None
+        
+        layers = {'NDWI': latest_ndwi, 'threat_heatmap': self.threat_heatmap(ndwi, latest_ndci)}
+        if latest_ndci is not None:
+            layers['NDCI'] = latest_ndci
+        
+        rendered = {}
+        for layer, raster in layers.items():
+            try:
+                rendered[layer] = self.tile_store.render_layer(location, month[:7], layer, raster, ndwi['bounds'])
+                count('map_layers.cached' if rendered[layer]['cached'] else 'map_layers.rendered')
+            except Exception as e:
+                print(f"Rendering {layer} for {location} failed: {e}")
+        return rendered
+    
+    def extract_tile_time_series(self, location, tile_size=0.1, years=1, windows=None):
+        """Per-tile monthly means for a region split into a regular grid
+        
+        Every month's composite is reduced over all tiles with reduceRegions,
+        and months x tiles are fetched together in batches that stay under
+        the Earth Engine 5000-element query limit.
+        """
+        if windows is None:
+            windows = self.get_month_windows(years)
+        tiles = build_tile_grid(self.region_bounds[location], tile_size)
+        tile_batch_size = max(1, 5000 // max(1, len(windows)))
+        print(f"{location}: {len(tiles)} tiles x {len(windows)} months "
+              f"in {-(-len(tiles) // tile_batch_size)} requests")
+        
+        months = ee.FeatureCollection([
+            ee.Feature(None, {
+                'year': year, 'month': month,
+                'start_date': start_date, 'end_date': end_date
+            })
+            for year, month, start_date, end_date in windows
+        ])
+        
+        all_data = []
+        for batch in chunked(tiles, tile_batch_size):
+            tile_collection = ee.FeatureCollection([
+                ee.Feature(ee.Geometry.Rectangle(*tile['bounds']), {'tile_id': tile['tile_id']})
+                for tile in batch
+            ])
+            
+            def reduce_month(month_feature):
+                collection = self.get_sentinel_data(
+                    location, ee.Date(month_feature.get('start_date')),
+                    ee.Date(month_feature.get('end_date')), self.cloud_threshold
+                )
+                composite = self.index_composite(collection)
+                reduced = composite.reduceRegions(
+                    collection=tile_collection,
+                    reducer=ee.Reducer.mean(),
+                    scale=self.reduce_scale
+                ).map(lambda tile: ee.Feature(None, tile.toDictionary()).set({
+                    'year': month_feature.get('year'),
+                    'month': month_feature.get('month')
+                }))
+                return ee.FeatureCollection(ee.Algorithms.If(
+                    collection.size().gt(0), reduced, ee.FeatureCollection([])
+                ))
+            
+            try:
+                features = self.ee_request(months.map(reduce_month).flatten(), 'tile_batch')['features']
+            except Exception as e:
+                print(f"Tile batch failed for {location}: {e}")
+                continue
+            
+            for feature in features:
+                stats = feature['properties']
+                if all(stats.get(name) is None for name in self.index_names):
                     continue
+                stats['location'] = location
+                stats['date'] = f"{stats['year']}-{stats['month']:02d}"
+                all_data.append(stats)
         
-        print(f"{location}: Collected {len(all_data)} monthly data points")
-        return pd.DataFrame(all_data)
+        tile_df = pd.DataFrame(all_data)
+        if tile_df.empty:
+            return tile_df
+        tile_info = pd.DataFrame(tiles)[['tile_id', 'row', 'col', 'center']]
+        return tile_df.merge(tile_info, on='tile_id').sort_values(['tile_id', 'year', 'month'])
     
-    def detect_environmental_anomalies(self, df):
-        """Detect anomalies using AI"""
-        if len(df) < 5:
-            df['anomaly_score'] = 0
-            df['is_anomaly'] = False
+    def run_grid_analysis(self, location, tile_size=0.1, years=1, hotspot_count=10):
+        """Trend, anomaly and threat stages for every tile of a region"""
+        tile_df = self.extract_tile_time_series(location, tile_size=tile_size, years=years)
+        if tile_df.empty:
+            return None
+        
+        scored, summary = self.analyze_locations_batch(tile_df, group_col='tile_id')
+        centers = tile_df.drop_duplicates('tile_id').set_index('tile_id')['center']
+        summary['center'] = summary['tile_id'].map(centers)
+        
+        if 'NDWI_annual_change' in summary.columns:
+            ranked = summary.reindex(
+                summary['NDWI_annual_change'].abs().sort_values(ascending=False).index
+            )
+        else:
+            ranked = summary
+        
+        return {
+            'tile_size': tile_size,
+            'tile_count': len(summary),
+            'threat_counts': {level: int(count) for level, count in summary['threat_level'].value_counts().items()},
+            'anomaly_count': int(scored['is_anomaly'].sum()),
+            'anomaly_method': 'zscore',
+            'hotspots': json.loads(ranked.head(hotspot_count)[
+                [col for col in ('tile_id', 'center', 'threat_level', 'NDWI_annual_change',
+                                 'NDCI_annual_change', 'anomaly_count') if col in ranked.columns]
+            ].to_json(orient='records')),
+            'tiles': summary
+        }
+    
+    def get_last_analysis_state(self, location):
+        """Return (last processed 'YYYY-MM', previous series DataFrame) for a location"""
+        if self.client:
+            try:
+                with timed('mongo.find_one'):
+                    previous = self.collection.find_one(
+                        {'location': location, 'last_processed_month': {'$exists': True}},
+                        sort=[('timestamp', -1)]
+                    )
+                if previous:
+                    return previous['last_processed_month'], pd.DataFrame(previous.get('time_series', []))
+            except Exception as e:
+                print(f"Could not read previous analysis for {location}: {e}")
+        
+        # Fall back to the months already held in the local cache
+        if self.stats_cache:
+            last_month = self.stats_cache.latest_month(location)
+            if last_month:
+                year, month = (int(part) for part in last_month.split('-'))
+                windows = self.get_month_windows(start=(year - 1, month), end=(year, month))
+                cached = [window for window in windows if self.get_cached_month(location, window) is not None]
+                if cached:
+                    return last_month, self.extract_time_series_data(location, windows=cached)
+        
+        return None, pd.DataFrame()
+    
+    def extract_new_months(self, location, batched=True, years=1):
+        """Extract only the closed months after the last stored result
+        
+        Returns (combined DataFrame, number of new rows).
+        """
+        last_month, previous_df = self.get_last_analysis_state(location)
+        # Months queried without imagery are not asked for again
+        checked_month = self.get_last_checked_month(location)
+        resume_after = max(filter(None, (last_month, checked_month)), default=None)
+        
+        now = datetime.now()
+        last_closed = (now.year, now.month - 1) if now.month > 1 else (now.year - 1, 12)
+        first_in_window = (last_closed[0] - years, last_closed[1] + 1) if last_closed[1] < 12 else (last_closed[0] - years + 1, 1)
+        if resume_after:
+            year, month = (int(part) for part in resume_after.split('-'))
+            start = max((year, month + 1) if month < 12 else (year + 1, 1), first_in_window)
+        else:
+            start = first_in_window
+        
+        windows = self.get_month_windows(start=start, end=last_closed)
+        # Months that failed in earlier runs are retried too, so gaps get filled in
+        new_starts = {window[2] for window in windows}
+        retry_windows = [window for window in self.failed_month_windows(location) if window[2] not in new_starts]
+        if not windows and not retry_windows:
+            print(f"{location}: up to date through {resume_after}")
+            return self.trim_to_window(previous_df, first_in_window), 0
+        
+        print(f"{location}: ingesting {len(windows)} new months after {resume_after or 'start of history'}"
+              + (f" and retrying {len(retry_windows)} failed months" if retry_windows else ""))
+        all_windows = sorted(retry_windows + windows)
+        monthly_stats = self.collect_monthly_stats(location, all_windows, batched)
+        new_df = self.monthly_frame(location, all_windows, monthly_stats)
+        
+        # Months with imagery advance last_processed_month through the stored report;
+        # when none had imagery, the answered months are marked so they are not asked again
+        if not any(monthly_stats.get(window[2]) for window in windows):
+            answered = None
+            for window in windows:
+                if window[2] not in monthly_stats:
+                    break
+                answered = f'{window[0]}-{window[1]:02d}'
+            self.record_checked_month(location, answered)
+        
+        combined = pd.concat([previous_df, new_df], ignore_index=True)
+        if not combined.empty:
+            combined = (combined.drop_duplicates(subset='date', keep='last')
+                .sort_values(['year', 'month'])
+                .reset_index(drop=True))
+        return self.trim_to_window(combined, first_in_window), len(new_df)
+    
+    @staticmethod
+    def trim_to_window(df, first_month):
+        """Rows from first_month (year, month) on, so the carried series stays one analysis window long"""
+        if df.empty or 'year' not in df.columns:
             return df
+        keep = df['year'].astype(int) * 12 + df['month'].astype(int) >= first_month[0] * 12 + first_month[1]
+        return df[keep].reset_index(drop=True)
+    
+    def get_last_checked_month(self, location):
+        """Newest 'YYYY-MM' queried after the last stored month and found without imagery"""
+        if not self.client or self.summary_collection is None:
+            return None
+        try:
+            summary = self.summary_collection.find_one({'_id': location}, {'last_checked_month': 1})
+            return summary.get('last_checked_month') if summary else None
+        except Exception as e:
+            print(f"Could not read last checked month for {location}: {e}")
+            return None
+    
+    def record_checked_month(self, location, month):
+        """Remember months without imagery on the location's summary"""
+        if not month or not self.client or self.summary_collection is None:
+            return
+        try:
+            # No upsert: a summary is only created from a stored report
+            self.summary_collection.update_one({'_id': location}, {'$max': {'last_checked_month': month}})
+        except Exception as e:
+            print(f"Could not record last checked month for {location}: {e}")
+    
+    def detect_environmental_anomalies(self, df, location=None):
+        """Detect anomalies using AI"""
+        df, model = self.score_environmental_anomalies(df, location)
+        return df
+    
+    def score_environmental_anomalies(self, df, location=None):
+        """Score anomalies with the location's stored model; returns (df, model or None)
         
+        The model is only refitted when the retrain policy says so, so old
+        months keep their scores and flags while new months are added.
+        Without a location or a model store the model is fitted per call.
+        """
         features = ['NDWI', 'NDCI']
         valid_features = [f for f in features if f in df.columns and not df[f].isnull().all()]
         
         if not valid_features:
             df['anomaly_score'] = 0
             df['is_anomaly'] = False
-            return df
-        
-        X = df[valid_features].fillna(0).values
+            return df, None
         
         try:
-            X_scaled = self.scaler.fit_transform(X)
-            self.anomaly_detector.fit(X_scaled)
-            anomaly_scores = self.anomaly_detector.decision_function(X_scaled)
-            predictions = self.anomaly_detector.predict(X_scaled)
+            model = self.get_anomaly_model(location, df, valid_features)
+            if model is None:
+                df['anomaly_score'] = 0
+                df['is_anomaly'] = False
+                return df, None
             
+            anomaly_scores, predictions = model.score(df)
             df['anomaly_score'] = anomaly_scores
-            df['is_anomaly'] = predictions == -1
+            df['is_anomaly'] = predictions
             
             anomaly_count = df['is_anomaly'].sum()
             print(f"✅ Anomaly detection: {anomaly_count} anomalies found")
+            return df, model
             
         except Exception as e:
+            print(f"Anomaly detection failed: {e}")
             df['anomaly_score'] = 0
             df['is_anomaly'] = False
+            return df, None
+    
+    def get_anomaly_model(self, location, df, features):
+        """Stored model for the location, refitted and saved when retraining is due"""
+        store = self.anomaly_models if location else None
+        model = None
+        if store:
+            try:
+                model = store.latest(location)
+            except Exception as e:
+                print(f"Could not load anomaly model for {location}: {e}")
         
-        return df
+        reason = self.anomaly_retrain.reason(model, df, features, self.anomaly_contamination, self.random_state)
+        if reason is None:
+            count('anomaly_model.reused')
+            return model
+        if len(df) < 5:
+            # Too little history to refit; a due model still scores if the features match
+            return None if reason in ('no model', 'features changed', 'settings changed') else model
+        
+        with timed('anomaly_model.fit'):
+            model = AnomalyModel.fit(df, features, self.anomaly_contamination, self.random_state)
+        model.reason = reason
+        count('anomaly_model.fitted')
+        if store:
+            try:
+                store.save(location, model)
+                print(f"{location}: trained anomaly model v{model.version} ({reason})")
+            except Exception as e:
+                print(f"Could not save anomaly model for {location}: {e}")
+        return model
     
     def analyze_environmental_trends(self, df):
         """Analyze environmental trends"""
-        trends = {}
-        
-        for feature in ['NDWI', 'NDCI']:
-            if feature in df.columns and not df[feature].isnull().all():
-                feature_data = df[[feature, 'year', 'month']].dropna()
-                if len(feature_data) > 2:
-                    feature_data['time_index'] = feature_data['year'] + (feature_data['month'] - 1) / 12
-                    X = feature_data['time_index'].values.reshape(-1, 1)
-                    y = feature_data[feature].values
-                    
-                    try:
-                        self.trend_model.fit(X, y)
-                        slope = self.trend_model.coef_[0]
-                        trends[f'{feature}_trend'] = slope
-                        trends[f'{feature}_annual_change'] = slope * 12
-                    except:
-                        trends[f'{feature}_trend'] = 0
-                        trends[f'{feature}_annual_change'] = 0
+        if df.empty or 'year' not in df.columns:
+            return {}
         
-        return trends
+        # Closed-form least squares; same slopes as a per-feature LinearRegression
+        trend_table = batch_trends(df.assign(series=0), ['NDWI', 'NDCI'], group_col='series')
+        return trends_to_dict(trend_table, 0, group_col='series')
     
-    def assess_threat_level(self, trends, current_data):
+    def analyze_locations_batch(self, df, group_col='location'):
+        """Trends, anomalies and threat levels for many locations at once
+        
+        Takes a long-format DataFrame (one row per location and month) and
+        returns (scored rows, one summary row per location). Anomalies are
+        the z-score approximation of batch_anomalies, not the stored
+        IsolationForest that run_complete_analysis_pipeline scores a region with.
+        """
+        scored, summary = analyze_groups(df, ['NDWI', 'NDCI'], group_col)
+        summary['threat_level'] = [
+            self.assess_threat_level(row, row) for row in summary.to_dict('records')
+        ]
+        return scored, summary
+    
+    def assess_threat_level(self, trends, current_data, shoreline=None):
         """Assess comprehensive threat level"""
         score = 0
         ndwi_trend = abs(trends.get('NDWI_annual_change', 0))
         if ndwi_trend > 0.1: score += 2
         
+        # Transect erosion shows retreat that the region-mean NDWI slope averages away;
+        # rasters too coarse to resolve it are left out
+        if shoreline and shoreline.get('reliable', True):
+            eroding_share = shoreline.get('eroding_share', 0)
+            if eroding_share >= 0.2: score += 2
+            if eroding_share >= 0.4: score += 2
+        
         ndci_trend = trends.get('NDCI_annual_change', 0)
         if ndci_trend > 0.08: score += 2
         
@@ -471,157 +1327,353 @@ Anomalies Detected: {len(anomalies)}
         if score >= 2: return 'medium'
         return 'low'
     
-    def create_visualization(self, df, location):
-        """Create comprehensive visualization"""
-        fig, axes = plt.subplots(1, 2, figsize=(15, 10))
-        fig.suptitle(f'Coastal AI Analysis - {location}', fontsize=16, fontweight='bold')
-        
-        if 'NDWI' in df.columns:
-            axes[0].plot(df['date'], df['NDWI'], 'b-', linewidth=2, label='NDWI')
-            if 'is_anomaly' in df.columns and df['is_anomaly'].any():
-                anomalies = df[df['is_anomaly']]
-                axes[0].scatter(anomalies['date'], anomalies['NDWI'], color='red', s=100, label='Anomalies')
-            axes[0].set_title('Water Index (NDWI)')
-            axes[0].set_ylabel('NDWI Value')
-            axes[0].tick_params(axis='x', rotation=45)
-            axes[0].legend()
-            axes[0].grid(True, alpha=0.3)
-        
-        if 'NDCI' in df.columns:
-            axes[1].plot(df['date'], df['NDCI'], 'g-', linewidth=2, label='NDCI')
-            if 'is_anomaly' in df.columns and df['is_anomaly'].any():
-                anomalies = df[df['is_anomaly']]
-                axes[1].scatter(anomalies['date'], anomalies['NDCI'], color='red', s=100, label='Anomalies')
-            axes[1].set_title('Chlorophyll Index (NDCI)')
-            axes[1].set_ylabel('NDCI Value')
-            axes[1].tick_params(axis='x', rotation=45)
-            axes[1].legend()
-            axes[1].grid(True, alpha=0.3)
-        
-        plt.tight_layout()
-        return fig
-    
     def save_to_mongodb(self, analysis_results):
         """Save analysis results to MongoDB"""
         if not self.client:
             return False
         
         try:
-            results_serializable = json.loads(json.dumps(analysis_results, default=str))
-            result = self.collection.insert_one(results_serializable)
+            if self.sink:
+                self.sink.add_result(analysis_results)
+                print(f"Analysis for {analysis_results.get('location')} queued for MongoDB")
+                return True
+            
+            document = to_bson(analysis_results)
+            with timed('mongo.insert_one'):
+                result = self.collection.insert_one(document)
+            with timed('mongo.summary_update'):
+                bulk_upsert(self.summary_collection, [summary_update(document)])
             print(f"Analysis saved to MongoDB with ID: {result.inserted_id}")
+            try:
+                self.retention.apply(document['location'])
+            except Exception as e:
+                print(f"Report retention failed for {document['location']}: {e}")
             return True
         except Exception as e:
             print(f"Failed to save to MongoDB: {e}")
             return False
     
-    def run_complete_analysis_pipeline(self, location):
-        """Complete analysis pipeline for a location"""
+    def save_time_series(self, location, df):
+        """Upsert per-month index values and anomaly scores into the monthly metrics collection"""
+        if not self.client or df.empty:
+            return False
+        columns = ['year', 'month'] + [
+            name for name in self.index_names + ['anomaly_score', 'is_anomaly'] if name in df.columns
+        ]
+        rows = df[columns].to_dict('records')
+        if self.sink:
+            self.sink.add_monthly_metrics(location, rows)
+            return True
+        
+        try:
+            with timed('mongo.monthly_metrics'):
+                bulk_upsert(self.monthly_collection, monthly_metric_updates(location, rows))
+            return True
+        except Exception as e:
+            print(f"Failed to save monthly metrics for {location}: {e}")
+            return False
+    
+    def flush_results(self):
+        """Write any buffered MongoDB documents now"""
+        if self.sink:
+            return self.sink.flush()
+        return 0
+    
+    def close(self):
+        """Flush pending writes and stop background workers"""
+        self.flush_results()
+        self.renderer.shutdown()
+        if getattr(self.data_source, 'compositor', None):
+            self.data_source.compositor.shutdown()
+    
+    def save_tile_results(self, location, tile_summary):
+        """Replace the stored per-tile summary for a location"""
+        if not self.client:
+            return False
+        
+        try:
+            records = to_bson(tile_summary)
+            tile_collection = self.db['tile_analysis']
+            for tile_record in records:
+                tile_record['location'] = location
+                tile_record['updated_at'] = datetime.now()
+            with timed('mongo.replace_tiles'):
+                tile_collection.delete_many({'location': location})
+                if records:
+                    tile_collection.insert_many(records)
+            print(f"Saved {len(records)} tile summaries for {location}")
+            return True
+        except Exception as e:
+            print(f"Failed to save tile results: {e}")
+            return False
+    
+    def save_shoreline_transects(self, location, shoreline):
+        """Replace the stored transects for a location (arrays packed as little-endian bytes)"""
+        if not self.client:
+            return False
+        
+        try:
+            document = to_bson(dict(shoreline['transects'], summary=shoreline['summary']))
+            document.update({'location': location, 'updated_at': datetime.now()})
+            with timed('mongo.replace_shoreline'):
+                self.db['shoreline_transects'].update_one(
+                    {'location': location}, {'$set': document}, upsert=True
+                )
+            return True
+        except Exception as e:
+            print(f"Failed to save shoreline transects: {e}")
+            return False
+    
+    def run_complete_analysis_pipeline(self, location, batched=True, incremental=False, tile_size=None,
+                                       years=1, start_month=None, end_month=None, raise_errors=False):
+        """Complete analysis pipeline for a location
+        
+        start_month/end_month are inclusive (year, month) pairs that override
+        the default `years` window. With raise_errors the caller (e.g. the job
+        scheduler) sees failures instead of a None result, so it can retry.
+        """
         print(f"\n{'='*60}")
         print(f"ANALYZING: {location}")
         print(f"{'='*60}")
         
+        # Stage timings, Earth Engine calls and per-location metadata are tracked per run
+        run = start_run(location)
+        run_status = 'failed'
+        self.report_progress('region_started', location, incremental=incremental, batched=batched)
         try:
             # 1. Data Collection
             print("Collecting satellite data...")
-            df = self.extract_time_series_data(location, years=1)
+            with timed('stage.extract'):
+                if incremental:
+                    df, new_rows = self.extract_new_months(location, batched=batched, years=years)
+                else:
+                    windows = self.get_month_windows(years, start_month, end_month)
+                    df = self.extract_time_series_data(location, years=years, batched=batched, windows=windows)
+                    new_rows = len(df)
             
-            if df.empty or len(df) < 3:
+            self.report_progress('extracted', location, data_points=len(df), new_rows=new_rows)
+            if new_rows == 0 or df.empty or len(df) < 3:
+                run_status = 'skipped'
+                self.report_progress('region_skipped', location,
+                                     reason='no new months' if new_rows == 0 else 'not enough monthly data')
                 return None
             
             # 2. AI Analysis
             print("Running AI analysis...")
-            df = self.detect_environmental_anomalies(df)
-            trends = self.analyze_environmental_trends(df)
+            with timed('stage.anomalies'):
+                df, anomaly_model = self.score_environmental_anomalies(df, location)
+            self.report_progress('anomalies_scored', location,
+                                 anomaly_count=int(df['is_anomaly'].sum()) if 'is_anomaly' in df.columns else 0)
+            with timed('stage.trends'):
+                trends = self.analyze_environmental_trends(df)
             
-            # 3. Insights Generation
+            # 3. Insights Generation (runs in the background while the later stages proceed)
             print("Generating insights...")
             anomalies = df[df['is_anomaly']] if 'is_anomaly' in df.columns else pd.DataFrame()
-            insights = self.generate_ai_insights(location, df, trends, anomalies)
+            with timed('stage.insight_request'):
+                insight_future = self.request_ai_insights(location, df, trends, anomalies)
             
-            # 4. Threat Assessment
-            latest_data = df.iloc[-1].to_dict()
-            threat_level = self.assess_threat_level(trends, latest_data)
+            # 4. Shoreline change along transects, then Threat Assessment
+            shoreline = None
+            ndwi_rasters = None
+            if self.shoreline_enabled or self.tile_store:
+                with timed('stage.rasters'):
+                    ndwi_rasters = self.monthly_rasters(location, df['date'].unique()[-self.shoreline_max_months:])
+            if self.shoreline_enabled:
+                with timed('stage.shoreline'):
+                    shoreline = self.measure_shoreline(location, ndwi_rasters)
+                if shoreline:
+                    self.report_progress('shoreline_measured', location, **{
+                        key: shoreline['summary'].get(key)
+                        for key in ('measured_transects', 'eroding_share', 'median_rate_m_per_year')
+                    })
+            with timed('stage.threat'):
+                latest_data = df.iloc[-1].to_dict()
+                threat_level = self.assess_threat_level(
+                    trends, latest_data, shoreline['summary'] if shoreline else None
+                )
+            self.report_progress('threat_assessed', location, threat_level=threat_level)
             
-            # 5. Visualization
+            # 5. Visualization (rendered in a worker process)
             print("Creating visualizations...")
-            fig = self.create_visualization(df, location)
+            with timed('stage.render_submit'):
+                viz_future = self.renderer.submit(df, location)
             
-            # 6. Save Map Configuration
+            # 6. Render map layers once and save the Map Configuration that points at them
+            with timed('stage.map_layers'):
+                layer_tiles = self.render_map_layers(location, ndwi_rasters)
+            if layer_tiles:
+                self.report_progress('map_layers_ready', location, layers=sorted(layer_tiles))
             print("Saving map configuration...")
-            map_config = {
-                'center': [self.regions[location].centroid().coordinates().getInfo()[1], 
-                          self.regions[location].centroid().coordinates().getInfo()[0]],
-                'zoom': 10,
-                'layers': ['NDWI', 'NDCI', 'threat_heatmap'],
-                'style': 'satellite'
-            }
-            self.save_map_configuration(location, map_config)
+            with timed('stage.map_config'):
+                map_config = {
+                    'center': self.region_metadata(location)['center'],
+                    'zoom': 10,
+                    # Only layers that were rendered; NDCI is missing when its fetch fails
+                    'layers': sorted(layer_tiles),
+                    'layer_tiles': layer_tiles,
+                    'style': 'satellite'
+                }
+                self.save_map_configuration(location, map_config)
             
-            # 7. Generate GEE Map
-            print("Generating interactive map...")
-            gee_map = self.generate_gee_map(location)
+            # 7. Generate GEE Map (interactive runs only; headless runs never use it)
+            gee_map = None
+            if not self.headless:
+                print("Generating interactive map...")
+                with timed('stage.gee_map'):
+                    gee_map = self.generate_gee_map(location)
             
-            # 8. Compile Results
+            # 7b. Tiled sub-region analysis
+            grid = None
+            if tile_size:
+                print(f"Running grid analysis ({tile_size} degree tiles)...")
+                with timed('stage.grid'):
+                    grid = self.run_grid_analysis(location, tile_size=tile_size)
+            
+            # 8. Compile Results (waits only for whatever is still running in the background)
+            with timed('stage.insight_wait'):
+                insights = self.resolve_ai_insights(insight_future, location, df, trends, anomalies)
+            self.report_progress('insight_ready', location,
+                                 source='groq' if insights.startswith('GROQ AI ANALYSIS') else 'rule_based')
+            with timed('stage.render_wait'):
+                try:
+                    visualization = viz_future.result()
+                except Exception as e:
+                    print(f"Visualization failed for {location}: {e}")
+                    visualization = None
+            if visualization:
+                record('render.chart', visualization.get('render_seconds', 0))
             results = {
                 'location': location,
                 'timestamp': datetime.now().isoformat(),
                 'data_points': len(df),
                 'threat_level': threat_level,
                 'anomaly_count': len(anomalies),
+                'anomaly_model': anomaly_model.info() if anomaly_model else None,
                 'trends': trends,
+                'shoreline': shoreline['summary'] if shoreline else None,
                 'insights': insights,
                 'recommendations': self.get_recommendations(threat_level),
                 'map_configuration': map_config,
                 'has_gee_map': gee_map is not None,
+                'visualization': visualization,
+                'last_processed_month': df['date'].iloc[-1],
+                'failed_months': [
+                    {key: failure[key] for key in ('start_date', 'reason', 'kind', 'attempts')}
+                    for failure in self.get_failed_months(location)
+                ],
+                'time_series': df[['date', 'year', 'month'] + [
+                    name for name in self.index_names if name in df.columns
+                ]].to_dict('records'),
                 'ai_provider': 'Groq - Llama 3 8B'
             }
             
             # 9. Save to Database
             print("Saving results...")
-            self.save_to_mongodb(results)
-            
-            # 10. Save Visualization
-            viz_filename = f"{location.replace(' ', '_')}_analysis.png"
-            fig.savefig(viz_filename, dpi=300, bbox_inches='tight')
-            plt.close()
+            with timed('stage.save'):
+                if grid:
+                    results['grid'] = {key: value for key, value in grid.items() if key != 'tiles'}
+                    self.save_tile_results(location, grid['tiles'])
+                if shoreline:
+                    self.save_shoreline_transects(location, shoreline)
+                # Timings up to this point travel with the stored document
+                results['instrumentation'] = run.summary()
+                persisted = self.save_to_mongodb(results)
+                self.save_time_series(location, df)
+                if self.flush_each_region:
+                    self.flush_results()
+            self.report_progress('saved', location, persisted=persisted)
             
             print(f"Analysis complete for {location}!")
             print(f"AI Provider: {results['ai_provider']}")
             print(f"Data Points: {len(df)}")
+            if self.stats_cache:
+                print(f"Cache: {self.stats_cache.stats()}")
             print(f"Anomalies: {len(anomalies)}")
             print(f"Threat Level: {threat_level.upper()}")
+            print(f"Earth Engine calls: {results['instrumentation']['ee_calls']}")
+            print(f"Stage timings: {results['instrumentation']['stages']}")
             
+            run_status = 'completed'
+            self.report_progress('region_completed', location, threat_level=threat_level,
+                                 anomaly_count=len(anomalies), data_points=len(df),
+                                 duration_seconds=results['instrumentation']['duration_seconds'])
             return results
             
         except Exception as e:
+            self.report_progress('region_failed', location, error=str(e))
+            if raise_errors:
+                raise
             print(f"Error in analysis pipeline: {e}")
             import traceback
             traceback.print_exc()
             return None
+        finally:
+            end_run(run, run_status)
+    
+    def run_multi_region_analysis(self, locations, max_workers=None, **pipeline_options):
+        """Run the pipeline for several regions concurrently"""
+        if max_workers is None:
+            max_workers = int(os.getenv('ANALYSIS_MAX_WORKERS', '4'))
+        max_workers = max(1, min(max_workers, len(locations)))
+        
+        print(f"Running {len(locations)} regions with {max_workers} parallel workers")
+        self.report_progress('batch_started', locations=list(locations))
+        all_results = {}
+        
+        with ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='region') as executor:
+            futures = {
+                executor.submit(self.run_complete_analysis_pipeline, location, **pipeline_options): location
+                for location in locations
+            }
+            for future in as_completed(futures):
+                location = futures[future]
+                try:
+                    results = future.result()
+                except Exception as e:
+                    print(f"Analysis failed for {location}: {e}")
+                    continue
+                if results:
+                    all_results[location] = results
+        
+        self.flush_results()
+        self.report_progress('batch_completed', completed=sorted(all_results),
+                             failed=[location for location in locations if location not in all_results])
+        
+        # Keep the caller's region order for reporting
+        return {location: all_results[location] for location in locations if location in all_results}
 
 # Main execution
 if __name__ == "__main__":
-    analyst = CoastalAIAnalyst()
-    target_locations = ['Pulicat Lake', 'Sunderbans', 'Goa Coast', 'Kochi']
+    # Prompt for missing credentials only when someone is at the terminal
+    analyst = CoastalAIAnalyst(interactive=True if sys.stdin.isatty() else None)
+    # --backfill [locations] only re-fetches months that failed in earlier runs
+    if sys.argv[1:2] == ['--backfill']:
+        recovered = analyst.backfill_failed_months(sys.argv[2:] or None)
+        print(f"Backfilled {sum(len(dates) for dates in recovered.values())} months")
+        analyst.close()
+        sys.exit(0)
+    
+    # Locations may be passed as arguments; default to every monitored region
+    target_locations = sys.argv[1:] or analyst.registry.names
     
     print("Starting Coastal AI Monitoring System")
     print("Attempting Groq API integration")
     print("Will use enhanced fallback if API unavailable")
     print(f"Analyzing {len(target_locations)} coastal regions\n")
     
-    all_results = {}
+    incremental = os.getenv('ANALYSIS_INCREMENTAL', '').lower() in ('1', 'true', 'yes')
+    tile_size = float(os.getenv('ANALYSIS_TILE_SIZE', '0')) or None
+    all_results = analyst.run_multi_region_analysis(
+        target_locations, incremental=incremental, tile_size=tile_size
+    )
     
-    for location in target_locations:
-        results = analyst.run_complete_analysis_pipeline(location)
-        if results:
-            all_results[location] = results
-            
-            print(f"\nINSIGHTS FOR {location.upper()}:")
-            print("-" * 60)
-            print(results['insights'])
-            print("-" * 60)
-            print("\n" + "="*80 + "\n")
+    for location, results in all_results.items():
+        print(f"\nINSIGHTS FOR {location.upper()}:")
+        print("-" * 60)
+        print(results['insights'])
+        print("-" * 60)
+        print("\n" + "="*80 + "\n")
     
     print("COASTAL MONITORING SUMMARY REPORT")
     print("=" * 60)
@@ -631,5 +1683,6 @@ if __name__ == "__main__":
         ai_provider = results['ai_provider']
         print(f"{location:15} | AI: {ai_provider:16} | Threat: {threat_level.upper():8} | Anomalies: {anomalies:3d}")
     
+    analyst.close()
 
     print(f"\nAnalysis completed at {datetime.now().strftime('%Y-%m-%d %H:%M')}")
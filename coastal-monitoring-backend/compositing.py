@@ -0,0 +1,183 @@
+# compositing.py
+"""Memory-bounded monthly median compositing for local scenes
+
+A month of scenes is never stacked whole. The region window is split into
+blocks sized so that one block's scene stack fits a memory budget, each
+block is cloud-masked, indexed and median-composited on its own, and only
+per-index sums and pixel counts leave the block. Blocks run in a process
+pool with a bounded number in flight. composite_raster() keeps the
+per-pixel medians of one index instead, for the shoreline stage.
+"""
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
+
+import numpy as np
+
+from data_sources import BandReader, block_windows, cloud_mask, compute_indices
+from spectral_indices import source_bands
+
+BYTES_PER_VALUE = 4
+
+
+def block_size_for_budget(n_scenes, n_indices, n_bands, budget_bytes, minimum=64, maximum=4096):
+    """Square block edge whose working set stays within budget_bytes
+
+    Per pixel a block holds one float32 per scene and index, about as much
+    again while nanmedian sorts, plus one scene's raw bands.
+    """
+    per_pixel = BYTES_PER_VALUE * (2 * n_scenes * n_indices + 2 * n_bands)
+    edge = int((budget_bytes / per_pixel) ** 0.5)
+    return max(minimum, min(maximum, edge))
+
+
+def composite_block(scene_bands, block, index_names):
+    """Median composite of one block; returns ({index: sum}, {index: count})
+
+    scene_bands is a list of {band: path} per scene. Runs in a worker
+    process, so files are opened here rather than passed in.
+    """
+    row_start, row_stop, col_start, col_stop = block
+    shape = (len(scene_bands), row_stop - row_start, col_stop - col_start)
+    stacks = {name: np.empty(shape, dtype=np.float32) for name in index_names}
+
+    for position, paths in enumerate(scene_bands):
+        readers = {band: BandReader(path) for band, path in paths.items()}
+        try:
+            bands = {band: reader.read(*block) for band, reader in readers.items()}
+            mask = cloud_mask(bands.pop('SCL')) if 'SCL' in bands else None
+            for name, values in compute_indices(bands, index_names, mask).items():
+                stacks[name][position] = values
+        finally:
+            for reader in readers.values():
+                reader.close()
+
+    sums, counts = {}, {}
+    for name, stack in stacks.items():
+        valid = ~np.isnan(stack).all(axis=0)
+        if valid.any():
+            median = np.nanmedian(stack[:, valid], axis=0)
+            sums[name] = float(median.sum(dtype=np.float64))
+            counts[name] = int(median.size)
+    return sums, counts
+
+
+def median_block(scene_bands, block, index_name, step=1):
+    """Per-pixel median of one index over the scenes for one block, every `step`-th pixel"""
+    row_start, row_stop, col_start, col_stop = block
+    stack = None
+    for position, paths in enumerate(scene_bands):
+        readers = {band: BandReader(path) for band, path in paths.items()}
+        try:
+            bands = {band: reader.read(*block)[::step, ::step] for band, reader in readers.items()}
+            mask = cloud_mask(bands.pop('SCL')) if 'SCL' in bands else None
+            values = compute_indices(bands, [index_name], mask)[index_name]
+        finally:
+            for reader in readers.values():
+                reader.close()
+        if stack is None:
+            stack = np.empty((len(scene_bands),) + values.shape, dtype=np.float32)
+        stack[position] = values
+
+    median = np.full(stack.shape[1:], np.nan, dtype=np.float32)
+    valid = ~np.isnan(stack).all(axis=0)
+    if valid.any():
+        median[valid] = np.nanmedian(stack[:, valid], axis=0)
+    return block, median
+
+
+class StreamingCompositor:
+    """Block-wise median compositing with a memory budget and optional process pool"""
+
+    def __init__(self, memory_budget_mb=None, max_workers=None, block_size=None):
+        self.memory_budget_mb = memory_budget_mb or int(os.getenv('COMPOSITE_MEMORY_MB', '256'))
+        if max_workers is None:
+            max_workers = int(os.getenv('COMPOSITE_WORKERS', str(os.cpu_count() or 1)))
+        self.max_workers = max(1, max_workers)
+        self.block_size = block_size
+        self.executor = None
+
+    def get_executor(self):
+        if self.executor is None:
+            self.executor = ProcessPoolExecutor(
+                max_workers=self.max_workers,
+                mp_context=multiprocessing.get_context('spawn')
+            )
+        return self.executor
+
+    def plan_blocks(self, window, n_scenes, index_names):
+        block_size = self.block_size
+        if block_size is None:
+            # The budget is shared by every block in flight
+            n_bands = len(source_bands(index_names)) + 1
+            budget = self.memory_budget_mb * 1024 * 1024 / self.max_workers
+            block_size = block_size_for_budget(n_scenes, len(index_names), n_bands, budget)
+        return list(block_windows(window, block_size))
+
+    def composite(self, scene_bands, window, index_names):
+        """Mean over the window of the per-pixel median of each index"""
+        index_names = list(index_names)
+        blocks = self.plan_blocks(window, len(scene_bands), index_names)
+        totals = {name: 0.0 for name in index_names}
+        counts = {name: 0 for name in index_names}
+
+        def accumulate(partial):
+            sums, block_counts = partial
+            for name, value in sums.items():
+                totals[name] += value
+                counts[name] += block_counts[name]
+
+        if self.max_workers == 1 or len(blocks) == 1:
+            for block in blocks:
+                accumulate(composite_block(scene_bands, block, index_names))
+        else:
+            executor = self.get_executor()
+            pending = set()
+            for block in blocks:
+                # Keep at most one queued block per worker so memory stays bounded
+                if len(pending) >= 2 * self.max_workers:
+                    done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        accumulate(future.result())
+                pending.add(executor.submit(composite_block, scene_bands, block, index_names))
+            for future in pending:
+                accumulate(future.result())
+
+        return {name: totals[name] / counts[name] for name in index_names if counts[name]}
+
+    def composite_raster(self, scene_bands, window, index_name, step=1):
+        """Per-pixel median raster of one index over the window, subsampled by step"""
+        row_start, row_stop, col_start, col_stop = window
+        raster = np.full((-(-(row_stop - row_start) // step), -(-(col_stop - col_start) // step)),
+                         np.nan, dtype=np.float32)
+        blocks = self.plan_blocks(window, len(scene_bands), [index_name])
+        if step > 1:
+            # Blocks must start on the subsampling grid
+            block_size = -(-(blocks[0][1] - blocks[0][0]) // step) * step
+            blocks = list(block_windows(window, block_size))
+
+        def place(result):
+            (block_row, _, block_col, _), median = result
+            row, col = (block_row - row_start) // step, (block_col - col_start) // step
+            raster[row:row + median.shape[0], col:col + median.shape[1]] = median
+
+        if self.max_workers == 1 or len(blocks) == 1:
+            for block in blocks:
+                place(median_block(scene_bands, block, index_name, step))
+        else:
+            executor = self.get_executor()
+            pending = set()
+            for block in blocks:
+                if len(pending) >= 2 * self.max_workers:
+                    done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        place(future.result())
+                pending.add(executor.submit(median_block, scene_bands, block, index_name, step))
+            for future in pending:
+                place(future.result())
+        return raster
+
+    def shutdown(self):
+        if self.executor is not None:
+            self.executor.shutdown(wait=True)
+            self.executor = None
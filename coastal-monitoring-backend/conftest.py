@@ -0,0 +1,49 @@
+# conftest.py
+import pytest
+
+
+class FakeMonthSource:
+    """Data source that answers months from a dict and fails the months listed in `failing`"""
+
+    name = 'earthengine'
+
+    def __init__(self, stats=None, failing=()):
+        self.stats = stats or {}
+        self.failing = set(failing)
+        self.calls = []
+
+    def fetch_months(self, location, windows, batched=False, failures=None):
+        self.calls.append([window[2] for window in windows])
+        fetched = {}
+        for year, month, start_date, end_date in windows:
+            if start_date in self.failing:
+                if failures is not None:
+                    failures[start_date] = {'reason': 'Computation timed out', 'kind': 'transient', 'attempts': 5}
+                continue
+            fetched[start_date] = self.stats.get(start_date, {'NDWI': 0.1 * month, 'NDCI': -0.01 * month})
+        return fetched
+
+
+@pytest.fixture
+def analyst(tmp_path, monkeypatch):
+    """Offline CoastalAIAnalyst: every cache and output under tmp_path, no MongoDB or Groq"""
+    for name, value in {
+        'SATELLITE_CACHE_PATH': str(tmp_path / 'cache' / 'monthly_stats.sqlite'),
+        'LLM_CACHE_DISABLED': '1',
+        'ANOMALY_MODEL_DIR': str(tmp_path / 'anomaly_models'),
+        'TILE_STORE_DIR': str(tmp_path / 'tiles'),
+        'VISUALIZATION_DIR': str(tmp_path / 'charts'),
+        'PIPELINE_METRICS_PATH': str(tmp_path / 'runs.jsonl'),
+        'COASTAL_HEADLESS': '1',
+    }.items():
+        monkeypatch.setenv(name, value)
+    for name in ('GROQ_API_KEY', 'MONGODB_URI', 'SATELLITE_DATA_SOURCE', 'SATELLITE_CACHE_DISABLED'):
+        monkeypatch.delenv(name, raising=False)
+
+    from coastal_ai_analyst_fixed_1 import CoastalAIAnalyst
+
+    analyst = CoastalAIAnalyst(interactive=False, headless=True)
+    # Tests that need MongoDB attach one themselves
+    analyst._mongo_connected = True
+    yield analyst
+    analyst.close()
@@ -0,0 +1,306 @@
+# data_sources.py
+"""Satellite data sources for the monthly index statistics
+
+EarthEngineDataSource reduces Sentinel-2 composites in Earth Engine.
+LocalRasterDataSource computes the same statistics from archived scenes
+on disk, laid out as
+
+    <root>/<Location_Name>/<YYYY-MM-DD>[_<scene id>]/<band>.npy|.tif
+    <root>/<Location_Name>/<YYYY-MM-DD>[_<scene id>]/meta.json   (optional)
+
+Band files hold the bands the configured indices read (see
+spectral_indices.py) on a common grid; only those bands are opened. An
+optional SCL band masks cloud and shadow pixels. meta.json may give the scene "bounds"
+(west, south, east, north) and "cloudy_pixel_percentage". GeoTIFFs are
+read with rasterio when it is installed.
+"""
+import json
+import os
+import re
+from abc import ABC, abstractmethod
+
+import numpy as np
+
+from spectral_indices import get_indices, source_bands
+
+# Sentinel-2 scene classification values treated as unusable
+SCL_MASK_CLASSES = (3, 8, 9, 10)
+
+SCENE_PATTERN = re.compile(r'^(\d{4}-\d{2}-\d{2})(?:_.*)?$')
+
+
+def compute_indices(bands, index_names, mask=None):
+    """Vectorized index arrays for one scene block; masked pixels become NaN"""
+    indices = {}
+    for index in get_indices(index_names):
+        values = index.compute(bands)
+        if mask is not None:
+            values[mask] = np.nan
+        indices[index.name] = values
+    return indices
+
+
+def cloud_mask(scl):
+    return np.isin(scl, SCL_MASK_CLASSES)
+
+
+def window_for_bounds(shape, scene_bounds, region_bounds):
+    """Pixel window (row_start, row_stop, col_start, col_stop) of a region inside a scene"""
+    height, width = shape
+    if scene_bounds is None:
+        return 0, height, 0, width
+    west, south, east, north = scene_bounds
+    r_west, r_south, r_east, r_north = region_bounds
+    x_res = (east - west) / width
+    y_res = (north - south) / height
+    col_start = max(0, int(np.floor((r_west - west) / x_res)))
+    col_stop = min(width, int(np.ceil((r_east - west) / x_res)))
+    row_start = max(0, int(np.floor((north - r_north) / y_res)))
+    row_stop = min(height, int(np.ceil((north - r_south) / y_res)))
+    return row_start, max(row_start, row_stop), col_start, max(col_start, col_stop)
+
+
+def window_bounds(shape, scene_bounds, window, step=1):
+    """(west, south, east, north) covered by a pixel window sampled every `step` pixels"""
+    height, width = shape
+    west, south, east, north = scene_bounds
+    x_res = (east - west) / width
+    y_res = (north - south) / height
+    row_start, row_stop, col_start, col_stop = window
+    rows = -(-(row_stop - row_start) // step) * step
+    cols = -(-(col_stop - col_start) // step) * step
+    return (west + col_start * x_res, north - (row_start + rows) * y_res,
+            west + (col_start + cols) * x_res, north - row_start * y_res)
+
+
+def block_windows(window, block_size):
+    """Split a pixel window into square blocks"""
+    row_start, row_stop, col_start, col_stop = window
+    for row in range(row_start, row_stop, block_size):
+        for col in range(col_start, col_stop, block_size):
+            yield row, min(row + block_size, row_stop), col, min(col + block_size, col_stop)
+
+
+class BandReader:
+    """Windowed reads from a memory-mapped .npy or a GeoTIFF band"""
+
+    def __init__(self, path):
+        self.path = path
+        self.dataset = None
+        if path.endswith('.npy'):
+            self.array = np.load(path, mmap_mode='r')
+            self.shape = self.array.shape
+            self.bounds = None
+        else:
+            import rasterio
+            self.dataset = rasterio.open(path)
+            self.shape = (self.dataset.height, self.dataset.width)
+            self.bounds = tuple(self.dataset.bounds)
+
+    def read(self, row_start, row_stop, col_start, col_stop):
+        if self.dataset is None:
+            return np.asarray(self.array[row_start:row_stop, col_start:col_stop])
+        from rasterio.windows import Window
+        return self.dataset.read(1, window=Window(col_start, row_start,
+                                                  col_stop - col_start, row_stop - row_start))
+
+    def close(self):
+        if self.dataset is not None:
+            self.dataset.close()
+
+
+class SatelliteDataSource(ABC):
+    """Monthly index statistics for a region
+
+    fetch_months returns {start_date: stats}; an empty dict marks a month
+    without usable imagery and a missing key a month that failed. When a
+    failures dict is passed, failed months are added to it as
+    {start_date: {'reason', 'kind', 'attempts'}}.
+    """
+
+    name = None
+
+    @abstractmethod
+    def fetch_months(self, location, windows, batched=False, failures=None):
+        """{start_date: stats} for the (year, month, start_date, end_date) windows"""
+
+    def fetch_index_rasters(self, location, windows, index_name='NDWI', max_pixels=250000):
+        """Monthly median rasters of one index on a common grid
+
+        Returns {'bounds': (west, south, east, north), 'rasters': {start_date:
+        2-D float32 array, row 0 at the north edge, NaN where undefined}},
+        or None when the source has no rasters for the region.
+        """
+        return None
+
+
+class EarthEngineDataSource(SatelliteDataSource):
+    """Sentinel-2 composites reduced in Earth Engine by the analyst"""
+
+    name = 'earthengine'
+
+    def __init__(self, analyst):
+        self.analyst = analyst
+
+    def fetch_months(self, location, windows, batched=False, failures=None):
+        if batched:
+            return self.analyst.fetch_months_batched(location, windows, failures)
+        return self.analyst.fetch_months(location, windows, failures)
+
+    def fetch_index_rasters(self, location, windows, index_name='NDWI', max_pixels=250000):
+        return self.analyst.fetch_index_rasters(location, windows, index_name, max_pixels)
+
+
+class LocalRasterDataSource(SatelliteDataSource):
+    """Monthly median composites computed from archived scenes on disk"""
+
+    name = 'local'
+
+    def __init__(self, root=None, region_bounds=None, index_names=('NDWI', 'NDCI'),
+                 cloud_threshold=30, compositor=None):
+        self.root = root or os.getenv('LOCAL_RASTER_DIR', 'data/scenes')
+        self.region_bounds = region_bounds or {}
+        self.index_names = list(index_names)
+        self.bands = source_bands(self.index_names)
+        self.cloud_threshold = cloud_threshold
+        if compositor is None:
+            from compositing import StreamingCompositor
+            compositor = StreamingCompositor()
+        self.compositor = compositor
+
+    def location_dir(self, location):
+        return os.path.join(self.root, location.replace(' ', '_'))
+
+    def list_scenes(self, location, start_date, end_date):
+        """Scene directories acquired in [start_date, end_date) under the cloud threshold"""
+        directory = self.location_dir(location)
+        if not os.path.isdir(directory):
+            return []
+
+        scenes = []
+        for entry in sorted(os.listdir(directory)):
+            match = SCENE_PATTERN.match(entry)
+            if not match or not (start_date <= match.group(1) < end_date):
+                continue
+            path = os.path.join(directory, entry)
+            meta = {}
+            if os.path.exists(os.path.join(path, 'meta.json')):
+                with open(os.path.join(path, 'meta.json')) as handle:
+                    meta = json.load(handle)
+            if meta.get('cloudy_pixel_percentage', 0) >= self.cloud_threshold:
+                continue
+            scenes.append({'path': path, 'date': match.group(1), 'meta': meta})
+        return scenes
+
+    def scene_band_paths(self, scene, bands=None):
+        """{band: path} for the bands the configured indices need, plus SCL if present"""
+        paths = {}
+        for band in (bands or self.bands) + ['SCL']:
+            for extension in ('.npy', '.tif'):
+                path = os.path.join(scene['path'], band + extension)
+                if os.path.exists(path):
+                    paths[band] = path
+                    break
+            else:
+                if band != 'SCL':
+                    raise FileNotFoundError(f"{scene['path']} has no {band} band")
+        return paths
+
+    def scene_stack(self, scenes, bands=None):
+        """Band paths of the scenes on the first usable scene's grid
+
+        Returns (scene_bands, shape, scene_bounds); scene_bands is empty
+        when no scene is usable.
+        """
+        bands = bands or self.bands
+        scene_bands = []
+        reference = None
+        for scene in scenes:
+            try:
+                paths = self.scene_band_paths(scene, bands)
+                reader = BandReader(paths[bands[0]])
+                reader.close()
+            except Exception as e:
+                print(f"Skipping scene {scene['path']}: {e}")
+                continue
+            if reference is None:
+                reference = (reader.shape, scene['meta'].get('bounds') or reader.bounds)
+            if reader.shape != reference[0]:
+                print(f"Skipping scene {scene['path']}: grid {reader.shape} != {reference[0]}")
+                continue
+            scene_bands.append(paths)
+        if not scene_bands:
+            return [], None, None
+        return scene_bands, reference[0], reference[1]
+
+    def composite_month(self, location, scenes):
+        """Per-pixel median across scenes, averaged over the region window"""
+        scene_bands, shape, scene_bounds = self.scene_stack(scenes)
+        if not scene_bands:
+            return {}
+
+        window = window_for_bounds(shape, scene_bounds, self.region_bounds.get(location, scene_bounds))
+        return self.compositor.composite(scene_bands, window, self.index_names)
+
+    def fetch_index_rasters(self, location, windows, index_name='NDWI', max_pixels=250000):
+        """Per-pixel monthly medians of one index over the region window
+
+        The window is subsampled by a whole-pixel step so that each raster
+        stays under max_pixels. Scenes on a different grid from the first
+        month's are skipped.
+        """
+        bands = source_bands([index_name])
+        rasters = {}
+        grid = None
+        for year, month, start_date, end_date in windows:
+            scene_bands, shape, scene_bounds = self.scene_stack(
+                self.list_scenes(location, start_date, end_date), bands
+            )
+            if not scene_bands:
+                continue
+            if grid is None:
+                region_bounds = self.region_bounds.get(location, scene_bounds)
+                if region_bounds is None:
+                    print(f"{location}: scenes have no bounds, so no rasters can be placed")
+                    return None
+                window = window_for_bounds(shape, scene_bounds, region_bounds)
+                pixels = (window[1] - window[0]) * (window[3] - window[2])
+                step = max(1, int(np.ceil(np.sqrt(pixels / max_pixels))))
+                grid = (shape, scene_bounds or region_bounds, window, step)
+            elif shape != grid[0]:
+                print(f"{location}: skipping {start_date}, grid {shape} != {grid[0]}")
+                continue
+            rasters[start_date] = self.compositor.composite_raster(scene_bands, grid[2], index_name, grid[3])
+
+        if not rasters:
+            return None
+        shape, scene_bounds, window, step = grid
+        return {'bounds': window_bounds(shape, scene_bounds, window, step), 'rasters': rasters}
+
+    def fetch_months(self, location, windows, batched=False, failures=None):
+        fetched = {}
+        for year, month, start_date, end_date in windows:
+            try:
+                scenes = self.list_scenes(location, start_date, end_date)
+                fetched[start_date] = self.composite_month(location, scenes) if scenes else {}
+            except Exception as e:
+                print(f"Local composite failed for {location} {start_date}: {e}")
+                if failures is not None:
+                    failures[start_date] = {'reason': str(e), 'kind': 'permanent', 'attempts': 1}
+        print(f"{location}: Composited {len(fetched)} months from {self.location_dir(location)}")
+        return fetched
+
+
+def write_scene(root, location, date, bands, bounds=None, cloudy_pixel_percentage=0, scene_id=None):
+    """Store band arrays as an archived scene in the LocalRasterDataSource layout"""
+    name = f"{date}_{scene_id}" if scene_id else date
+    path = os.path.join(root, location.replace(' ', '_'), name)
+    os.makedirs(path, exist_ok=True)
+    for band, values in bands.items():
+        np.save(os.path.join(path, f'{band}.npy'), values)
+    meta = {'cloudy_pixel_percentage': cloudy_pixel_percentage}
+    if bounds is not None:
+        meta['bounds'] = list(bounds)
+    with open(os.path.join(path, 'meta.json'), 'w') as handle:
+        json.dump(meta, handle)
+    return path
@@ -0,0 +1,191 @@
+# instrumentation.py
+"""Timers, counters and per-run memo for the analysis pipeline
+
+Each pipeline run opens a RunStats (start_run/end_run or pipeline_run())
+on its own thread. timed() and count() record against that run and
+against process-wide totals, so work done on background threads (the LLM
+event loop, the MongoDB write-behind flusher) still shows up in
+snapshot(). Earth Engine requests go through ee_get_info so every round
+trip is counted and timed.
+
+Finished runs are appended as JSON lines to PIPELINE_METRICS_PATH
+(metrics/pipeline_runs.jsonl by default; "off" disables it).
+"""
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime
+
+_state = threading.local()
+
+
+class Recorder:
+    """Counters and {count, seconds} timers"""
+
+    def __init__(self):
+        self.counters = {}
+        self.timers = {}
+        self.lock = threading.Lock()
+
+    def incr(self, name, amount=1):
+        with self.lock:
+            self.counters[name] = self.counters.get(name, 0) + amount
+
+    def record(self, name, seconds):
+        with self.lock:
+            timer = self.timers.setdefault(name, {'count': 0, 'seconds': 0.0})
+            timer['count'] += 1
+            timer['seconds'] += seconds
+
+    def snapshot(self):
+        with self.lock:
+            return {
+                'counters': dict(self.counters),
+                'timers': {name: {'count': timer['count'], 'seconds': round(timer['seconds'], 4)}
+                           for name, timer in self.timers.items()}
+            }
+
+
+# Totals for the whole process, including background threads
+totals = Recorder()
+
+
+class RunStats(Recorder):
+    """Counters, timers and memoized values for one pipeline run"""
+
+    def __init__(self, location):
+        super().__init__()
+        self.location = location
+        self.memo = {}
+        self.previous = None
+        self.started_at = datetime.now()
+        self.start = time.perf_counter()
+
+    def memoize(self, key, compute):
+        if key not in self.memo:
+            self.memo[key] = compute()
+        return self.memo[key]
+
+    def summary(self):
+        """Compact summary stored with the analysis result"""
+        snapshot = self.snapshot()
+        counters = snapshot['counters']
+        return {
+            'duration_seconds': round(time.perf_counter() - self.start, 3),
+            'stages': {name.split('.', 1)[1]: timer['seconds']
+                       for name, timer in snapshot['timers'].items() if name.startswith('stage.')},
+            'calls': {name: timer for name, timer in snapshot['timers'].items()
+                      if not name.startswith('stage.')},
+            'counters': {name: value for name, value in counters.items() if not name.startswith('ee_calls')},
+            'ee_calls': counters.get('ee_calls', 0),
+            'ee_calls_by_type': {name.split('.', 1)[1]: value for name, value in counters.items()
+                                 if name.startswith('ee_calls.')}
+        }
+
+
+def start_run(location):
+    """Make a fresh RunStats current for this thread"""
+    run = RunStats(location)
+    run.previous = getattr(_state, 'run', None)
+    _state.run = run
+    return run
+
+
+def end_run(run, status='completed'):
+    _state.run = run.previous
+    emit(dict(run.summary(), location=run.location, status=status,
+              started_at=run.started_at.isoformat()))
+
+
+@contextmanager
+def pipeline_run(location):
+    run = start_run(location)
+    status = 'failed'
+    try:
+        yield run
+        status = 'completed'
+    finally:
+        end_run(run, status)
+
+
+def current_run():
+    return getattr(_state, 'run', None)
+
+
+@contextmanager
+def attached_run(run):
+    """Record against another thread's run, e.g. from a worker pool"""
+    previous = getattr(_state, 'run', None)
+    _state.run = run
+    try:
+        yield run
+    finally:
+        _state.run = previous
+
+
+def count(name, amount=1):
+    totals.incr(name, amount)
+    run = current_run()
+    if run is not None:
+        run.incr(name, amount)
+
+
+def record(name, seconds, run=None):
+    """Add a timing; pass run to attribute work finished on another thread"""
+    totals.record(name, seconds)
+    run = run or current_run()
+    if run is not None:
+        run.record(name, seconds)
+
+
+@contextmanager
+def timed(name):
+    """Time a block, or a function when used as @timed(name)"""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        record(name, time.perf_counter() - start)
+
+
+def memoize(key, compute):
+    """Value of compute() cached for the current run (uncached outside a run)"""
+    run = current_run()
+    return compute() if run is None else run.memoize(key, compute)
+
+
+def ee_get_info(obj, label):
+    """Blocking Earth Engine request, counted and timed as one round trip"""
+    return ee_call(obj.getInfo, label)
+
+
+def ee_call(request, label):
+    """Any blocking Earth Engine request (e.g. ee.data.computePixels), counted like getInfo"""
+    count('ee_calls')
+    count(f'ee_calls.{label}')
+    with timed(f'ee.{label}'):
+        return request()
+
+
+def snapshot():
+    return totals.snapshot()
+
+
+_emit_lock = threading.Lock()
+
+
+def emit(record_data):
+    """Append one JSON line to the metrics file"""
+    path = os.getenv('PIPELINE_METRICS_PATH', 'metrics/pipeline_runs.jsonl')
+    if not path or path.lower() == 'off':
+        return
+    try:
+        with _emit_lock:
+            if os.path.dirname(path):
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(path, 'a') as handle:
+                handle.write(json.dumps(record_data, default=str) + '\n')
+    except Exception as e:
+        print(f"Failed to write pipeline metrics: {e}")
@@ -0,0 +1,275 @@
+# job_scheduler.py
+import hashlib
+import json
+import os
+import random
+import sqlite3
+import threading
+import time
+import uuid
+
+from instrumentation import count, record
+from progress import progress_context
+from request_retry import classify_error
+
+ACTIVE_STATUSES = ('queued', 'running')
+
+
+def make_dedup_key(location, params):
+    """Jobs with the same location and parameters share one key"""
+    payload = json.dumps({'location': location, 'params': params}, sort_keys=True, default=str)
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+
+class SQLiteJobBroker:
+    """Durable local job queue with priorities, retries and in-flight deduplication"""
+
+    def __init__(self, path=None, max_attempts=3, base_retry_delay=30.0, max_retry_delay=900.0):
+        self.path = path or os.getenv('JOB_BROKER_PATH', 'cache/jobs.sqlite')
+        self.max_attempts = max_attempts
+        self.base_retry_delay = base_retry_delay
+        self.max_retry_delay = max_retry_delay
+        self.lock = threading.Lock()
+
+        if os.path.dirname(self.path):
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        self.conn = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None)
+        self.conn.row_factory = sqlite3.Row
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS jobs (
+                job_id TEXT PRIMARY KEY,
+                dedup_key TEXT NOT NULL,
+                location TEXT NOT NULL,
+                params TEXT NOT NULL,
+                priority INTEGER NOT NULL DEFAULT 0,
+                status TEXT NOT NULL,
+                attempts INTEGER NOT NULL DEFAULT 0,
+                max_attempts INTEGER NOT NULL,
+                available_at REAL NOT NULL,
+                created_at REAL NOT NULL,
+                started_at REAL,
+                finished_at REAL,
+                result TEXT,
+                error TEXT
+            )
+        """)
+        self.conn.execute("CREATE INDEX IF NOT EXISTS idx_jobs_dedup ON jobs (dedup_key, status)")
+        self.conn.execute("CREATE INDEX IF NOT EXISTS idx_jobs_queue ON jobs (status, priority, available_at)")
+
+    def enqueue(self, location, params=None, priority=0):
+        """Queue a job, or return the identical job already queued or running
+
+        Returns (job_id, coalesced). A coalesced queued job is raised to the
+        higher of the two priorities.
+        """
+        params = params or {}
+        dedup_key = make_dedup_key(location, params)
+        now = time.time()
+
+        with self.lock:
+            self.conn.execute("BEGIN IMMEDIATE")
+            try:
+                existing = self.conn.execute(
+                    "SELECT job_id, priority FROM jobs WHERE dedup_key = ? AND status IN (?, ?) "
+                    "ORDER BY created_at LIMIT 1",
+                    (dedup_key, *ACTIVE_STATUSES)
+                ).fetchone()
+                if existing:
+                    if priority > existing['priority']:
+                        self.conn.execute(
+                            "UPDATE jobs SET priority = ? WHERE job_id = ? AND status = 'queued'",
+                            (priority, existing['job_id'])
+                        )
+                    self.conn.execute("COMMIT")
+                    return existing['job_id'], True
+
+                job_id = uuid.uuid4().hex
+                self.conn.execute(
+                    "INSERT INTO jobs (job_id, dedup_key, location, params, priority, status, attempts, "
+                    "max_attempts, available_at, created_at) VALUES (?, ?, ?, ?, ?, 'queued', 0, ?, ?, ?)",
+                    (job_id, dedup_key, location, json.dumps(params, default=str), priority,
+                     self.max_attempts, now, now)
+                )
+                self.conn.execute("COMMIT")
+                return job_id, False
+            except Exception:
+                self.conn.execute("ROLLBACK")
+                raise
+
+    def claim(self):
+        """Atomically take the highest-priority job that is due, or None"""
+        now = time.time()
+        with self.lock:
+            self.conn.execute("BEGIN IMMEDIATE")
+            try:
+                row = self.conn.execute(
+                    "SELECT * FROM jobs WHERE status = 'queued' AND available_at <= ? "
+                    "ORDER BY priority DESC, created_at LIMIT 1",
+                    (now,)
+                ).fetchone()
+                if row is None:
+                    self.conn.execute("COMMIT")
+                    return None
+                self.conn.execute(
+                    "UPDATE jobs SET status = 'running', attempts = attempts + 1, started_at = ? "
+                    "WHERE job_id = ?",
+                    (now, row['job_id'])
+                )
+                self.conn.execute("COMMIT")
+            except Exception:
+                self.conn.execute("ROLLBACK")
+                raise
+
+        job = self.to_dict(row)
+        job['status'] = 'running'
+        job['attempts'] += 1
+        return job
+
+    def complete(self, job_id, result):
+        with self.lock:
+            self.conn.execute(
+                "UPDATE jobs SET status = 'completed', finished_at = ?, result = ?, error = NULL "
+                "WHERE job_id = ?",
+                (time.time(), json.dumps(result, default=str), job_id)
+            )
+
+    def fail(self, job_id, error, retry=True):
+        """Schedule a retry with exponential backoff, or mark the job failed
+
+        Returns the retry delay, or None once the job has failed for good.
+        With retry=False (an error retrying can not fix) it fails at once.
+        """
+        with self.lock:
+            row = self.conn.execute(
+                "SELECT attempts, max_attempts FROM jobs WHERE job_id = ?", (job_id,)
+            ).fetchone()
+            if row is None:
+                return None
+            if retry and row['attempts'] < row['max_attempts']:
+                delay = min(self.max_retry_delay, self.base_retry_delay * 2 ** (row['attempts'] - 1))
+                delay *= random.uniform(0.8, 1.2)
+                self.conn.execute(
+                    "UPDATE jobs SET status = 'queued', available_at = ?, error = ? WHERE job_id = ?",
+                    (time.time() + delay, str(error), job_id)
+                )
+                return delay
+            self.conn.execute(
+                "UPDATE jobs SET status = 'failed', finished_at = ?, error = ? WHERE job_id = ?",
+                (time.time(), str(error), job_id)
+            )
+            return None
+
+    def requeue_stale(self):
+        """Return jobs left running by a previous process to the queue"""
+        with self.lock:
+            return self.conn.execute(
+                "UPDATE jobs SET status = 'queued', available_at = ? WHERE status = 'running'",
+                (time.time(),)
+            ).rowcount
+
+    def get(self, job_id):
+        with self.lock:
+            row = self.conn.execute("SELECT * FROM jobs WHERE job_id = ?", (job_id,)).fetchone()
+        return self.to_dict(row) if row else None
+
+    def counts(self):
+        with self.lock:
+            rows = self.conn.execute("SELECT status, COUNT(*) FROM jobs GROUP BY status").fetchall()
+        return {status: count for status, count in rows}
+
+    def purge_finished(self, older_than_seconds=7 * 24 * 3600):
+        with self.lock:
+            return self.conn.execute(
+                "DELETE FROM jobs WHERE status IN ('completed', 'failed') AND finished_at < ?",
+                (time.time() - older_than_seconds,)
+            ).rowcount
+
+    @staticmethod
+    def to_dict(row):
+        job = dict(row)
+        job['params'] = json.loads(job['params'])
+        job['result'] = json.loads(job['result']) if job['result'] else None
+        return job
+
+
+class JobScheduler:
+    """Runs queued analysis jobs with at most max_concurrent Earth Engine jobs at a time"""
+
+    def __init__(self, run_job, broker=None, max_concurrent=2, poll_interval=1.0):
+        self.run_job = run_job
+        self.broker = broker or SQLiteJobBroker()
+        self.max_concurrent = max_concurrent
+        self.poll_interval = poll_interval
+        self.condition = threading.Condition()
+        self.stop_event = threading.Event()
+        self.threads = []
+
+    def start(self):
+        recovered = self.broker.requeue_stale()
+        if recovered:
+            print(f"Requeued {recovered} interrupted jobs")
+        for index in range(self.max_concurrent):
+            thread = threading.Thread(target=self.dispatch_loop, name=f'ee-job-{index}', daemon=True)
+            thread.start()
+            self.threads.append(thread)
+
+    def submit(self, location, params=None, priority=0):
+        job_id, coalesced = self.broker.enqueue(location, params, priority)
+        if coalesced:
+            print(f"Coalesced request for {location} into job {job_id}")
+            count('jobs.coalesced')
+        count('jobs.submitted')
+        with self.condition:
+            self.condition.notify_all()
+        return job_id
+
+    def dispatch_loop(self):
+        while not self.stop_event.is_set():
+            job = self.broker.claim()
+            if job is None:
+                with self.condition:
+                    self.condition.wait(self.poll_interval)
+                continue
+
+            start = time.perf_counter()
+            try:
+                # Progress events from the run carry the scheduled job's id
+                with progress_context(job_id=job['job_id'], attempt=job['attempts']):
+                    result = self.run_job(job['location'], **job['params'])
+                self.broker.complete(job['job_id'], result)
+                count('jobs.completed')
+            except Exception as e:
+                # Bad parameters or unknown locations fail the same way on every attempt
+                kind = classify_error(e)
+                delay = self.broker.fail(job['job_id'], e, retry=kind != 'permanent')
+                if delay is not None:
+                    print(f"Job {job['job_id']} ({job['location']}) failed ({kind}), retrying in {delay:.0f}s: {e}")
+                    count('jobs.retries')
+                else:
+                    print(f"Job {job['job_id']} ({job['location']}) failed permanently ({kind}): {e}")
+                    count('jobs.failed')
+            record('jobs.run', time.perf_counter() - start)
+
+            with self.condition:
+                self.condition.notify_all()
+
+    def wait(self, job_ids, timeout=None):
+        """Block until every job has finished or the timeout passes; returns the jobs"""
+        deadline = None if timeout is None else time.time() + timeout
+        while True:
+            jobs = {job_id: self.broker.get(job_id) for job_id in job_ids}
+            if all(job and job['status'] in ('completed', 'failed') for job in jobs.values()):
+                return jobs
+            remaining = None if deadline is None else deadline - time.time()
+            if remaining is not None and remaining <= 0:
+                return jobs
+            with self.condition:
+                self.condition.wait(self.poll_interval if remaining is None else min(self.poll_interval, remaining))
+
+    def stop(self):
+        self.stop_event.set()
+        with self.condition:
+            self.condition.notify_all()
+        for thread in self.threads:
+            thread.join(timeout=5)
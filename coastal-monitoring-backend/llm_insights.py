@@ -0,0 +1,251 @@
+# llm_insights.py
+import asyncio
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+
+from instrumentation import count, record
+
+
+class PromptCache:
+    """Content-hashed prompt -> response cache with LRU and TTL eviction"""
+
+    def __init__(self, path=None, max_entries=500, ttl_seconds=7 * 24 * 3600):
+        self.path = path or os.getenv('LLM_CACHE_PATH', 'cache/llm_responses.sqlite')
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+
+        if os.path.dirname(self.path):
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        self.conn = sqlite3.connect(self.path, check_same_thread=False)
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS llm_responses (
+                prompt_hash TEXT PRIMARY KEY,
+                model TEXT NOT NULL,
+                response TEXT NOT NULL,
+                created_at REAL NOT NULL,
+                last_used REAL NOT NULL
+            )
+        """)
+        self.conn.commit()
+
+    @staticmethod
+    def make_key(prompt, **params):
+        payload = json.dumps({'prompt': prompt, 'params': params}, sort_keys=True)
+        return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+    def get(self, key):
+        """Return (model, response) or None"""
+        now = time.time()
+        with self.lock:
+            row = self.conn.execute(
+                "SELECT model, response, created_at FROM llm_responses WHERE prompt_hash = ?", (key,)
+            ).fetchone()
+            if row is None or (self.ttl_seconds is not None and now - row[2] > self.ttl_seconds):
+                if row is not None:
+                    self.conn.execute("DELETE FROM llm_responses WHERE prompt_hash = ?", (key,))
+                    self.conn.commit()
+                self.misses += 1
+                return None
+
+            self.conn.execute("UPDATE llm_responses SET last_used = ? WHERE prompt_hash = ?", (now, key))
+            self.conn.commit()
+            self.hits += 1
+            return row[0], row[1]
+
+    def put(self, key, model, response):
+        now = time.time()
+        with self.lock:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO llm_responses VALUES (?, ?, ?, ?, ?)",
+                (key, model, response, now, now)
+            )
+            # Evict the least recently used entries beyond the size limit
+            self.conn.execute("""
+                DELETE FROM llm_responses WHERE prompt_hash IN (
+                    SELECT prompt_hash FROM llm_responses ORDER BY last_used DESC LIMIT -1 OFFSET ?
+                )
+            """, (self.max_entries,))
+            self.conn.commit()
+
+    def clear(self):
+        with self.lock:
+            self.conn.execute("DELETE FROM llm_responses")
+            self.conn.commit()
+
+    def stats(self):
+        return {'hits': self.hits, 'misses': self.misses}
+
+
+class CircuitBreaker:
+    """Skip a model for a cooldown period after repeated failures"""
+
+    def __init__(self, failure_threshold=1, cooldown_seconds=300):
+        self.failure_threshold = failure_threshold
+        self.cooldown_seconds = cooldown_seconds
+        self.failures = {}
+        self.opened_at = {}
+        self.lock = threading.Lock()
+
+    def is_open(self, model):
+        with self.lock:
+            opened_at = self.opened_at.get(model)
+            if opened_at is None:
+                return False
+            if time.time() - opened_at >= self.cooldown_seconds:
+                # Half-open: let one call through to probe the model again
+                del self.opened_at[model]
+                self.failures[model] = self.failure_threshold - 1
+                return False
+            return True
+
+    def record_success(self, model):
+        with self.lock:
+            self.failures.pop(model, None)
+            self.opened_at.pop(model, None)
+
+    def record_failure(self, model):
+        with self.lock:
+            self.failures[model] = self.failures.get(model, 0) + 1
+            if self.failures[model] >= self.failure_threshold:
+                self.opened_at[model] = time.time()
+
+
+class AsyncInsightClient:
+    """Async Groq client with per-model timeouts, a circuit breaker and a response cache
+
+    All requests run on one background event loop, so synchronous callers
+    on any thread can share the client, the breaker and in-flight requests.
+    """
+
+    def __init__(self, api_key, models, base_url=None, timeout_seconds=20,
+                 cache=None, breaker=None, temperature=0.7, max_tokens=1024, top_p=0.8):
+        self.api_key = api_key
+        self.models = list(models)
+        self.base_url = base_url
+        self.timeout_seconds = timeout_seconds
+        self.cache = cache
+        self.breaker = breaker or CircuitBreaker()
+        self.params = {'temperature': temperature, 'max_tokens': max_tokens, 'top_p': top_p}
+
+        self.client = None
+        self.loop = None
+        self.loop_lock = threading.Lock()
+        self.in_flight = {}
+
+    def get_loop(self):
+        with self.loop_lock:
+            if self.loop is None:
+                self.loop = asyncio.new_event_loop()
+                threading.Thread(target=self.loop.run_forever, name='llm-insights', daemon=True).start()
+            return self.loop
+
+    def get_client(self):
+        if self.client is None and self.api_key:
+            import groq
+            self.client = groq.AsyncGroq(
+                api_key=self.api_key,
+                base_url=self.base_url,
+                max_retries=0,
+                timeout=self.timeout_seconds
+            )
+        return self.client
+
+    async def query_model(self, client, prompt, model):
+        chat_completion = await asyncio.wait_for(
+            client.chat.completions.create(
+                messages=[{"role": "user", "content": prompt}],
+                model=model,
+                stream=False,
+                **self.params
+            ),
+            timeout=self.timeout_seconds
+        )
+        return chat_completion.choices[0].message.content
+
+    async def agenerate(self, prompt):
+        """Return (model, response), or (None, None) if every model is unavailable"""
+        key = PromptCache.make_key(prompt, models=self.models, **self.params)
+        if self.cache:
+            cached = self.cache.get(key)
+            if cached:
+                print(f"LLM cache hit ({cached[0]})")
+                count('llm_cache.hits')
+                return cached
+            count('llm_cache.misses')
+
+        # Identical prompts already being generated share one request
+        if key in self.in_flight:
+            count('llm.coalesced')
+            return await asyncio.shield(self.in_flight[key])
+
+        task = asyncio.ensure_future(self.generate_uncached(prompt))
+        self.in_flight[key] = task
+        try:
+            model, response = await task
+        finally:
+            self.in_flight.pop(key, None)
+
+        if response and self.cache:
+            self.cache.put(key, model, response)
+        return model, response
+
+    async def try_model(self, client, prompt, model):
+        """One model's response, or None; failures open the model's circuit"""
+        if self.breaker.is_open(model):
+            print(f"Skipping {model} (circuit open)")
+            count('groq.circuit_skips')
+            return None
+        start = time.perf_counter()
+        try:
+            print(f"Using Groq with {model}...")
+            response = await self.query_model(client, prompt, model)
+            record('groq.request', time.perf_counter() - start)
+            if response:
+                self.breaker.record_success(model)
+                return response
+        except asyncio.TimeoutError:
+            print(f"Groq model {model} timed out after {self.timeout_seconds}s")
+        except Exception as e:
+            print(f"Groq API call failed: {e}")
+        self.breaker.record_failure(model)
+        count('groq.failures')
+        return None
+
+    async def generate_uncached(self, prompt):
+        client = self.get_client()
+        if client is None:
+            return None, None
+
+        for model in self.models:
+            response = await self.try_model(client, prompt, model)
+            if response:
+                return model, response
+
+        return None, None
+
+    def submit(self, prompt):
+        """Schedule a prompt and return a concurrent.futures.Future of (model, response)"""
+        return asyncio.run_coroutine_threadsafe(self.agenerate(prompt), self.get_loop())
+
+    def generate(self, prompt):
+        return self.submit(prompt).result()
+
+    def generate_with(self, prompt, model):
+        """One model's uncached response without falling back to the others; None on failure"""
+        async def query():
+            client = self.get_client()
+            return await self.try_model(client, prompt, model) if client else None
+        return asyncio.run_coroutine_threadsafe(query(), self.get_loop()).result()
+
+    def generate_many(self, prompts):
+        """Generate several prompts concurrently"""
+        async def gather():
+            return await asyncio.gather(*(self.agenerate(prompt) for prompt in prompts))
+        return asyncio.run_coroutine_threadsafe(gather(), self.get_loop()).result()
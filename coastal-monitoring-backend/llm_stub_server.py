@@ -0,0 +1,96 @@
+# llm_stub_server.py
+"""Local stand-in for the Groq chat completions API
+
+Run it and point the analyst at it for offline tests and benchmarks:
+
+    python llm_stub_server.py --port 8765 --delay 0.5 --fail-models gemma-7b-it
+    GROQ_BASE_URL=http://127.0.0.1:8765 GROQ_API_KEY=stub python coastal_ai_analyst_fixed_1.py
+"""
+import argparse
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+class StubCompletionHandler(BaseHTTPRequestHandler):
+    delay = 0.0
+    delays = {}
+    fail_models = set()
+    responses = {}
+    request_count = 0
+    count_lock = threading.Lock()
+
+    def do_POST(self):
+        if not self.path.rstrip('/').endswith('/chat/completions'):
+            self.send_error(404)
+            return
+
+        length = int(self.headers.get('Content-Length', 0))
+        body = json.loads(self.rfile.read(length) or b'{}')
+        model = body.get('model', 'stub')
+        with StubCompletionHandler.count_lock:
+            StubCompletionHandler.request_count += 1
+
+        time.sleep(self.delays.get(model, self.delay))
+        if model in self.fail_models:
+            self.send_json(503, {'error': {'message': f'{model} unavailable', 'type': 'server_error'}})
+            return
+
+        prompt = body.get('messages', [{}])[-1].get('content', '')
+        content = self.responses.get(model) or f"Stub assessment from {model} ({len(prompt)} prompt chars)."
+        self.send_json(200, {
+            'id': f'stub-{StubCompletionHandler.request_count}',
+            'object': 'chat.completion',
+            'created': int(time.time()),
+            'model': model,
+            'choices': [{
+                'index': 0,
+                'message': {'role': 'assistant', 'content': content},
+                'finish_reason': 'stop'
+            }],
+            'usage': {'prompt_tokens': 0, 'completion_tokens': 0, 'total_tokens': 0}
+        })
+
+    def send_json(self, status, payload):
+        data = json.dumps(payload).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def start_stub_server(port=0, delay=0.0, fail_models=(), responses=None, delays=None):
+    """Start the stub in a background thread and return (server, base_url)
+
+    delays overrides the delay per model, e.g. to make one model time out.
+    """
+    handler = type('ConfiguredStubHandler', (StubCompletionHandler,), {
+        'delay': delay,
+        'delays': dict(delays or {}),
+        'fail_models': set(fail_models),
+        'responses': dict(responses or {})
+    })
+    server = ThreadingHTTPServer(('127.0.0.1', port), handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f'http://127.0.0.1:{server.server_address[1]}'
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Local Groq API stub')
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--delay', type=float, default=0.0, help='seconds to wait before answering')
+    parser.add_argument('--fail-models', nargs='*', default=[], help='models that return HTTP 503')
+    args = parser.parse_args()
+
+    server, base_url = start_stub_server(args.port, args.delay, args.fail_models)
+    print(f"Groq stub listening on {base_url}")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        server.shutdown()
@@ -0,0 +1,196 @@
+# map_tiles.py
+"""Pre-rendered map layers: a thumbnail and an XYZ tile pyramid per layer
+
+Layers are rendered once per analysis from the rasters the pipeline has
+already fetched and written under TILE_STORE_DIR, which the Node API
+serves as static files:
+
+    <root>/<key>/layer.json          bounds, zooms, style and month
+    <root>/<key>/thumbnail.png
+    <root>/<key>/<z>/<x>/<y>.png     Web Mercator tiles, 256 px
+
+The key is a hash of the location, month, layer, style and raster values.
+A layer that was already rendered is reused as it is, and its files never
+change, so they can be cached by browsers indefinitely. Dashboards read
+these files and never start Earth Engine work.
+"""
+import hashlib
+import json
+import math
+import os
+import shutil
+import struct
+import tempfile
+import zlib
+
+import numpy as np
+
+STYLE_VERSION = 1
+
+LAYER_STYLES = {
+    'NDWI': {'min': -0.5, 'max': 0.5, 'palette': ['8c510a', 'd8b365', 'f5f5f5', '5ab4ac', '01665e']},
+    'NDCI': {'min': -0.2, 'max': 0.4, 'palette': ['2c7bb6', 'abd9e9', 'ffffbf', 'fdae61', 'd7191c']},
+    'threat_heatmap': {'min': 0.0, 'max': 1.0, 'palette': ['ffffb2', 'fecc5c', 'fd8d3c', 'f03b20', 'bd0026']},
+}
+
+# Web Mercator ground resolution of one 256 px tile pixel at zoom 0, on the equator
+EQUATOR_METRES_PER_PIXEL = 156543.03392
+
+
+def encode_png(rgba):
+    """8-bit RGBA array (rows x cols x 4) as PNG bytes"""
+    height, width, _ = rgba.shape
+    # Filter type 0 (none) in front of every scanline
+    scanlines = np.hstack([np.zeros((height, 1), dtype=np.uint8), rgba.reshape(height, width * 4)])
+
+    def chunk(kind, data):
+        return (struct.pack('>I', len(data)) + kind + data
+                + struct.pack('>I', zlib.crc32(kind + data) & 0xffffffff))
+
+    return (b'\x89PNG\r\n\x1a\n'
+            + chunk(b'IHDR', struct.pack('>IIBBBBB', width, height, 8, 6, 0, 0, 0))
+            + chunk(b'IDAT', zlib.compress(scanlines.tobytes(), 6))
+            + chunk(b'IEND', b''))
+
+
+def colorize(values, style):
+    """RGBA for values on the style's palette; NaN is transparent"""
+    palette = np.array([[int(color[i:i + 2], 16) for i in (0, 2, 4)] for color in style['palette']], dtype=np.float32)
+    valid = np.isfinite(values)
+    position = np.clip((np.where(valid, values, style['min']) - style['min']) / (style['max'] - style['min']), 0, 1)
+    position = position * (len(palette) - 1)
+    lower = np.minimum(position.astype(np.int64), len(palette) - 2)
+    fraction = (position - lower)[..., None]
+    rgb = palette[lower] * (1 - fraction) + palette[lower + 1] * fraction
+
+    rgba = np.zeros(values.shape + (4,), dtype=np.uint8)
+    rgba[..., :3] = np.round(rgb).astype(np.uint8)
+    rgba[..., 3] = np.where(valid, 255, 0)
+    return rgba
+
+
+def tile_index(lon, lat, zoom):
+    """(x, y) of the tile containing a point"""
+    n = 2 ** zoom
+    lat = math.radians(max(-85.0511, min(85.0511, lat)))
+    x = int((lon + 180) / 360 * n)
+    y = int((1 - math.log(math.tan(lat) + 1 / math.cos(lat)) / math.pi) / 2 * n)
+    return min(n - 1, max(0, x)), min(n - 1, max(0, y))
+
+
+def tile_pixel_lonlat(x, y, zoom, size):
+    """Longitudes (cols) and latitudes (rows) of a tile's pixel centres"""
+    n = 2 ** zoom
+    offsets = (np.arange(size) + 0.5) / size
+    lon = (x + offsets) / n * 360 - 180
+    lat = np.degrees(np.arctan(np.sinh(np.pi * (1 - 2 * (y + offsets) / n))))
+    return lon, lat
+
+
+class TileStore:
+    """Content-addressed thumbnails and tile pyramids on disk"""
+
+    def __init__(self, root=None, public_url=None, tile_size=256, max_tiles=256, thumbnail_size=512):
+        self.root = root or os.getenv('TILE_STORE_DIR', 'tiles')
+        self.public_url = (public_url or os.getenv('TILE_PUBLIC_URL', '/tiles')).rstrip('/')
+        self.tile_size = tile_size
+        self.max_tiles = max_tiles
+        self.thumbnail_size = thumbnail_size
+        os.makedirs(self.root, exist_ok=True)
+
+    @staticmethod
+    def layer_key(location, month, layer, raster, bounds):
+        digest = hashlib.sha256()
+        digest.update(json.dumps([location, month, layer, STYLE_VERSION, LAYER_STYLES[layer],
+                                  list(bounds), list(raster.shape)]).encode('utf-8'))
+        digest.update(np.ascontiguousarray(raster, dtype='<f4').tobytes())
+        return digest.hexdigest()[:24]
+
+    def zoom_range(self, bounds, shape):
+        """Zooms from about one tile for the region up to the raster's resolution"""
+        west, south, east, north = bounds
+        latitude = math.cos(math.radians((south + north) / 2))
+        pixel_m = (north - south) / shape[0] * 111195
+        max_zoom = max(0, min(18, int(math.log2(EQUATOR_METRES_PER_PIXEL * latitude / pixel_m))))
+
+        def tile_count(zoom):
+            x0, y0 = tile_index(west, north, zoom)
+            x1, y1 = tile_index(east, south, zoom)
+            return (x1 - x0 + 1) * (y1 - y0 + 1)
+
+        while max_zoom > 0 and sum(tile_count(zoom) for zoom in range(max(0, max_zoom - 4), max_zoom + 1)) > self.max_tiles:
+            max_zoom -= 1
+        return max(0, max_zoom - 4), max_zoom
+
+    def sample(self, raster, bounds, lon, lat):
+        """Nearest raster values at a lon/lat grid; NaN outside the raster"""
+        west, south, east, north = bounds
+        height, width = raster.shape
+        rows = np.floor((north - lat) / (north - south) * height).astype(np.int64)
+        cols = np.floor((lon - west) / (east - west) * width).astype(np.int64)
+        inside = (rows >= 0)[:, None] & (rows < height)[:, None] & (cols >= 0)[None, :] & (cols < width)[None, :]
+        values = raster[np.clip(rows, 0, height - 1)[:, None], np.clip(cols, 0, width - 1)[None, :]]
+        return np.where(inside, values, np.nan)
+
+    def write_layer(self, directory, layer, raster, bounds):
+        style = LAYER_STYLES[layer]
+        west, south, east, north = bounds
+        min_zoom, max_zoom = self.zoom_range(bounds, raster.shape)
+
+        scale = self.thumbnail_size / max(raster.shape)
+        rows = np.linspace(north, south, max(1, round(raster.shape[0] * scale)), endpoint=False)
+        cols = np.linspace(west, east, max(1, round(raster.shape[1] * scale)), endpoint=False)
+        with open(os.path.join(directory, 'thumbnail.png'), 'wb') as handle:
+            handle.write(encode_png(colorize(self.sample(raster, bounds, cols, rows), style)))
+
+        tiles = 0
+        for zoom in range(min_zoom, max_zoom + 1):
+            x0, y0 = tile_index(west, north, zoom)
+            x1, y1 = tile_index(east, south, zoom)
+            for x in range(x0, x1 + 1):
+                os.makedirs(os.path.join(directory, str(zoom), str(x)), exist_ok=True)
+                for y in range(y0, y1 + 1):
+                    lon, lat = tile_pixel_lonlat(x, y, zoom, self.tile_size)
+                    values = self.sample(raster, bounds, lon, lat)
+                    with open(os.path.join(directory, str(zoom), str(x), f'{y}.png'), 'wb') as handle:
+                        handle.write(encode_png(colorize(values, style)))
+                    tiles += 1
+        return {'min_zoom': min_zoom, 'max_zoom': max_zoom, 'tile_count': tiles}
+
+    def render_layer(self, location, month, layer, raster, bounds):
+        """Render a layer unless that exact layer is stored already; returns its description"""
+        raster = np.asarray(raster, dtype=np.float32)
+        key = self.layer_key(location, month, layer, raster, bounds)
+        directory = os.path.join(self.root, key)
+        metadata_path = os.path.join(directory, 'layer.json')
+        if os.path.exists(metadata_path):
+            with open(metadata_path) as handle:
+                return dict(json.load(handle), cached=True)
+
+        # Render into a scratch directory and rename it, so readers never see a partial layer
+        scratch = tempfile.mkdtemp(prefix=f'.{key}-', dir=self.root)
+        os.chmod(scratch, 0o755)
+        try:
+            pyramid = self.write_layer(scratch, layer, raster, bounds)
+            url = f'{self.public_url}/{key}'
+            metadata = dict(pyramid, **{
+                'key': key,
+                'location': location,
+                'month': month,
+                'layer': layer,
+                'bounds': [float(value) for value in bounds],
+                'style': LAYER_STYLES[layer],
+                'thumbnail_url': f'{url}/thumbnail.png',
+                'tile_url': f'{url}/{{z}}/{{x}}/{{y}}.png'
+            })
+            with open(os.path.join(scratch, 'layer.json'), 'w') as handle:
+                json.dump(metadata, handle)
+            try:
+                os.rename(scratch, directory)
+            except OSError:
+                # Rendered concurrently by another run; theirs is identical
+                shutil.rmtree(scratch, ignore_errors=True)
+            return dict(metadata, cached=False)
+        except Exception:
+            shutil.rmtree(scratch, ignore_errors=True)
+            raise
@@ -0,0 +1,411 @@
+# mongo_sink.py
+import atexit
+import math
+import os
+import threading
+import time
+from datetime import datetime, date, timedelta
+
+import numpy as np
+import pandas as pd
+
+from instrumentation import count, record
+from llm_insights import CircuitBreaker
+
+_clients = {}
+_clients_lock = threading.Lock()
+
+
+def get_mongo_client(uri=None):
+    """One pooled MongoClient per URI, shared by every analyst in the process"""
+    from pymongo import MongoClient
+
+    with _clients_lock:
+        if uri not in _clients:
+            _clients[uri] = MongoClient(
+                uri,
+                maxPoolSize=int(os.getenv('MONGODB_MAX_POOL_SIZE', '20')),
+                serverSelectionTimeoutMS=int(os.getenv('MONGODB_TIMEOUT_MS', '10000'))
+            )
+        return _clients[uri]
+
+
+def to_bson(value):
+    """Convert numpy/pandas values to types the BSON encoder accepts"""
+    if isinstance(value, dict):
+        return {str(key): to_bson(item) for key, item in value.items()}
+    if isinstance(value, (list, tuple, set)):
+        return [to_bson(item) for item in value]
+    if isinstance(value, np.ndarray):
+        return [to_bson(item) for item in value.tolist()]
+    if isinstance(value, pd.Timestamp):
+        return value.to_pydatetime()
+    if isinstance(value, np.generic):
+        value = value.item()
+    if isinstance(value, float) and math.isnan(value):
+        return None
+    if isinstance(value, (str, int, float, bool, datetime, bytes)) or value is None:
+        return value
+    if isinstance(value, date):
+        return datetime(value.year, value.month, value.day)
+    if isinstance(value, pd.DataFrame):
+        return to_bson(value.to_dict('records'))
+    return str(value)
+
+
+# Collections derived from the full reports in ai_analysis; dashboards read these
+SUMMARY_COLLECTION = 'analysis_summary'
+MONTHLY_COLLECTION = 'analysis_monthly_metrics'
+ROLLUP_COLLECTION = 'analysis_rollups'
+
+SUMMARY_FIELDS = ('location', 'timestamp', 'data_points', 'threat_level', 'anomaly_count', 'trends',
+                  'shoreline', 'recommendations', 'last_processed_month', 'has_gee_map', 'ai_provider')
+INSIGHT_EXCERPT_CHARS = 500
+
+
+def ensure_analysis_indexes(db, results_collection='ai_analysis', map_collection='map_configurations'):
+    """Indexes behind the per-location reads of the API and the pipeline"""
+    db[results_collection].create_index([('location', 1), ('timestamp', -1)])
+    db[map_collection].create_index([('location', 1)])
+    db[MONTHLY_COLLECTION].create_index([('location', 1), ('month', 1)], unique=True)
+    db[MONTHLY_COLLECTION].create_index([('month', 1)])
+    db[ROLLUP_COLLECTION].create_index([('location', 1), ('month', 1)], unique=True)
+
+
+def summarize_result(document):
+    """Compact copy of a stored report for the location's summary document"""
+    summary = {key: document.get(key) for key in SUMMARY_FIELDS}
+    insights = document.get('insights') or ''
+    summary['insights'] = insights[:INSIGHT_EXCERPT_CHARS]
+    summary['insights_truncated'] = len(insights) > INSIGHT_EXCERPT_CHARS
+    layer_tiles = (document.get('map_configuration') or {}).get('layer_tiles') or {}
+    summary['thumbnails'] = {layer: tiles.get('thumbnail_url') for layer, tiles in layer_tiles.items()}
+    summary['report_id'] = document.get('_id')
+    summary['updated_at'] = datetime.now()
+    return summary
+
+
+def summary_update(document):
+    """Upsert of a location's summary ({_id: location}) from a stored report
+
+    The filter only matches a summary that is not newer than the report, so
+    a report landing late never replaces a newer one: its upsert collides
+    with the existing _id and the duplicate key error is ignored.
+    """
+    from pymongo import UpdateOne
+
+    return UpdateOne(
+        {'_id': document['location'], 'timestamp': {'$lte': document['timestamp']}},
+        {'$set': summarize_result(document), '$inc': {'analysis_count': 1}},
+        upsert=True
+    )
+
+
+def monthly_metric_updates(location, rows):
+    """One upsert per (location, month) from per-month rows ({'year', 'month', <metrics>})"""
+    from pymongo import UpdateOne
+
+    operations = []
+    for row in rows:
+        row = to_bson(row)
+        year, month = int(row.pop('year')), int(row.pop('month'))
+        operations.append(UpdateOne(
+            {'location': location, 'month': f'{year:04d}-{month:02d}'},
+            {'$set': {
+                'date': datetime(year, month, 1),
+                'metrics': {key: value for key, value in row.items() if key not in ('date', 'location')},
+                'updated_at': datetime.now()
+            }},
+            upsert=True
+        ))
+    return operations
+
+
+def bulk_upsert(collection, operations):
+    """Unordered bulk write that tolerates the duplicate keys of lost upsert races"""
+    from pymongo.errors import BulkWriteError
+
+    if not operations:
+        return 0
+    try:
+        collection.bulk_write(operations, ordered=False)
+    except BulkWriteError as e:
+        errors = e.details.get('writeErrors', [])
+        if any(error.get('code') != 11000 for error in errors):
+            raise
+        return len(operations) - len(errors)
+    return len(operations)
+
+
+class ReportRetention:
+    """Rolls old full reports of a location up into monthly counts, then deletes them
+
+    The newest keep_reports reports (at least one, the report the summary
+    points at) are always kept, and so is anything newer than
+    max_age_days. Older reports are counted into one rollup document per
+    (location, month); their per-month index values already live in the
+    monthly metrics collection. Every report is added to its rollup by an
+    update that only matches while the report's _id is not in report_ids,
+    so reports rolled up by an interrupted run are not counted again when
+    the retry rolls up and deletes them.
+    """
+
+    PROJECTION = {'timestamp': 1, 'threat_level': 1, 'anomaly_count': 1}
+
+    def __init__(self, results, rollups, keep_reports=10, max_age_days=90):
+        self.results = results
+        self.rollups = rollups
+        self.keep_reports = max(1, keep_reports)
+        self.max_age_days = max_age_days
+
+    def apply(self, location):
+        """Roll up and delete the location's expired reports; returns how many were removed"""
+        if not self.max_age_days:
+            return 0
+        kept = list(self.results.find({'location': location}, {'timestamp': 1},
+                                      sort=[('timestamp', -1)], skip=self.keep_reports - 1, limit=1))
+        if not kept:
+            return 0
+        cutoff = min((datetime.now() - timedelta(days=self.max_age_days)).isoformat(), kept[0]['timestamp'])
+
+        expired = list(self.results.find({'location': location, 'timestamp': {'$lt': cutoff}},
+                                         self.PROJECTION, sort=[('timestamp', 1)]))
+        if not expired:
+            return 0
+
+        from pymongo import UpdateOne
+
+        # Create missing rollups first, so the per-report updates below never upsert
+        months = sorted({report['timestamp'][:7] for report in expired})
+        bulk_upsert(self.rollups, [
+            UpdateOne({'location': location, 'month': month},
+                      {'$setOnInsert': {'reports': 0, 'anomaly_total': 0, 'report_ids': []}}, upsert=True)
+            for month in months
+        ])
+        operations = []
+        for report in expired:
+            anomaly_count = report.get('anomaly_count') or 0
+            operations.append(UpdateOne(
+                {'location': location, 'month': report['timestamp'][:7], 'report_ids': {'$ne': report['_id']}},
+                {
+                    '$inc': {'reports': 1, 'anomaly_total': anomaly_count,
+                             f"threat_levels.{report.get('threat_level') or 'unknown'}": 1},
+                    '$max': {'max_anomaly_count': anomaly_count, 'last_report_at': report['timestamp']},
+                    '$min': {'first_report_at': report['timestamp']},
+                    '$addToSet': {'report_ids': report['_id']},
+                    '$set': {'updated_at': datetime.now()}
+                }
+            ))
+        self.rollups.bulk_write(operations, ordered=False)
+        deleted = self.results.delete_many({'_id': {'$in': [report['_id'] for report in expired]}}).deleted_count
+        count('mongo.reports_rolled_up', deleted)
+        return deleted
+
+
+class MongoWriteBehindSink:
+    """Buffers analysis documents and flushes them with bulk writes
+
+    Each flush inserts the full reports first, then moves the per-location
+    summaries to them, upserts the monthly metrics and finally applies the
+    report retention to the locations that received a report.
+    """
+
+    def __init__(self, db, results_collection='ai_analysis', map_collection='map_configurations',
+                 flush_size=50, flush_interval=5.0, retention=None):
+        self.db = db
+        self.results = db[results_collection]
+        self.map_configs = db[map_collection]
+        self.summaries = db[SUMMARY_COLLECTION]
+        self.monthly = db[MONTHLY_COLLECTION]
+        self.retention = retention
+        self.flush_size = flush_size
+        self.flush_interval = flush_interval
+
+        self.pending_results = []
+        self.pending_summaries = []
+        self.pending_map_configs = {}
+        self.pending_monthly = {}
+        self.lock = threading.Lock()
+        self.flush_lock = threading.Lock()
+        self.stop_event = threading.Event()
+        self.flusher = None
+        atexit.register(self.close)
+
+    def start(self):
+        """Flush in the background every flush_interval seconds"""
+        if self.flusher is None:
+            self.flusher = threading.Thread(target=self.run_flusher, name='mongo-sink', daemon=True)
+            self.flusher.start()
+
+    def run_flusher(self):
+        while not self.stop_event.wait(self.flush_interval):
+            self.flush()
+
+    def add_result(self, document):
+        with self.lock:
+            self.pending_results.append(to_bson(document))
+            should_flush = len(self.pending_results) >= self.flush_size
+        if should_flush:
+            self.flush()
+
+    def add_map_config(self, location, map_config):
+        # Later configs for the same location replace earlier unflushed ones
+        with self.lock:
+            self.pending_map_configs[location] = to_bson(map_config)
+
+    def add_monthly_metrics(self, location, rows):
+        """Queue per-month rows ({'year', 'month', <metrics>}) for the monthly metrics collection"""
+        operations = monthly_metric_updates(location, rows)
+        with self.lock:
+            # Re-analysed months replace their previous measurements
+            self.pending_monthly.setdefault(location, []).extend(operations)
+
+    def flush(self):
+        """Write everything buffered so far; returns the number of documents written"""
+        with self.flush_lock:
+            with self.lock:
+                results, self.pending_results = self.pending_results, []
+                summaries, self.pending_summaries = self.pending_summaries, []
+                map_configs, self.pending_map_configs = self.pending_map_configs, {}
+                monthly, self.pending_monthly = self.pending_monthly, {}
+
+            start = time.perf_counter()
+            written = 0
+            inserted = self.insert_results(results) if results else []
+            written += len(inserted)
+            # Summaries point at the inserted reports, so they follow the insert
+            summaries += [summary_update(document) for document in
+                          sorted(inserted, key=lambda document: document['timestamp'])]
+
+            if summaries:
+                try:
+                    written += bulk_upsert(self.summaries, summaries)
+                except Exception as e:
+                    print(f"MongoDB bulk write of analysis summaries failed: {e}")
+                    self.requeue(summaries=summaries)
+
+            if map_configs:
+                from pymongo import UpdateOne
+
+                operations = [
+                    UpdateOne({'location': location}, {'$set': config}, upsert=True)
+                    for location, config in map_configs.items()
+                ]
+                try:
+                    self.map_configs.bulk_write(operations, ordered=False)
+                    written += len(operations)
+                except Exception as e:
+                    print(f"MongoDB bulk write of map configurations failed: {e}")
+                    self.requeue(map_configs=map_configs)
+
+            for location, operations in monthly.items():
+                try:
+                    written += bulk_upsert(self.monthly, operations)
+                except Exception as e:
+                    print(f"MongoDB monthly metrics write failed for {location}: {e}")
+                    self.requeue(monthly={location: operations})
+
+            if self.retention:
+                for location in sorted({document['location'] for document in inserted}):
+                    try:
+                        self.retention.apply(location)
+                    except Exception as e:
+                        print(f"Report retention failed for {location}: {e}")
+
+            if written:
+                print(f"Flushed {written} documents to MongoDB")
+                record('mongo.flush', time.perf_counter() - start)
+                count('mongo.documents_written', written)
+            return written
+
+    def insert_results(self, results):
+        """Insert buffered reports; returns the ones stored, failed ones are requeued
+
+        insert_many sets _id on every document before sending, so a report
+        that landed in an earlier, partly failed flush comes back as a
+        duplicate key error. Those count as stored rather than failing the
+        batch forever.
+        """
+        from pymongo.errors import BulkWriteError
+
+        try:
+            self.results.insert_many(results, ordered=False)
+            return results
+        except BulkWriteError as e:
+            failed = {error['index'] for error in e.details.get('writeErrors', []) if error.get('code') != 11000}
+        except Exception as e:
+            print(f"MongoDB bulk insert of results failed: {e}")
+            self.requeue(results=results)
+            return []
+
+        if failed:
+            print(f"MongoDB bulk insert failed for {len(failed)} of {len(results)} results")
+            self.requeue(results=[document for index, document in enumerate(results) if index in failed])
+        return [document for index, document in enumerate(results) if index not in failed]
+
+    def requeue(self, results=(), summaries=(), map_configs=None, monthly=None):
+        """Put a failed batch back so the next flush retries it"""
+        with self.lock:
+            self.pending_results = list(results) + self.pending_results
+            self.pending_summaries = list(summaries) + self.pending_summaries
+            for location, config in (map_configs or {}).items():
+                self.pending_map_configs.setdefault(location, config)
+            for location, operations in (monthly or {}).items():
+                self.pending_monthly[location] = operations + self.pending_monthly.get(location, [])
+
+    def close(self):
+        self.stop_event.set()
+        self.flush()
+
+
+class StatusDocumentWriter:
+    """Mirrors progress events into one status document per location
+
+    Documents ({_id: location}) are updated in place as each stage finishes,
+    so the API or a change stream on the collection sees progress right
+    away. Per-month events are left to the progress stream.
+
+    A failed update opens a circuit breaker, so while MongoDB is unreachable
+    status updates are dropped instead of each one waiting for the server
+    selection timeout; after the cooldown one update probes it again.
+    """
+
+    FINISHED = {'region_completed': 'completed', 'region_failed': 'failed', 'region_skipped': 'skipped'}
+    STREAM_ONLY = ('month_extracted', 'month_failed')
+
+    def __init__(self, collection, breaker=None):
+        self.collection = collection
+        self.breaker = breaker or CircuitBreaker(
+            cooldown_seconds=float(os.getenv('ANALYSIS_STATUS_COOLDOWN_SECONDS', '60'))
+        )
+
+    def update(self, event):
+        location = event.get('location')
+        if not location or event['type'] in self.STREAM_ONLY:
+            return
+        if self.breaker.is_open('analysis_status'):
+            count('mongo.status_skips')
+            return
+        details = {key: value for key, value in event.items() if key not in ('type', 'location', 'seq')}
+        fields = {
+            'location': location,
+            'stage': event['type'],
+            'updated_at': datetime.now(),
+            f"stages.{event['type']}": details
+        }
+        if event['type'] == 'region_started':
+            fields.update({'status': 'running', 'started_at': datetime.now(), 'finished_at': None,
+                           'error': None, 'job_id': event.get('job_id'), 'stages': {'region_started': details}})
+            del fields['stages.region_started']
+        elif event['type'] in self.FINISHED:
+            fields.update({'status': self.FINISHED[event['type']], 'finished_at': datetime.now(),
+                           'error': event.get('error')})
+
+        start = time.perf_counter()
+        try:
+            self.collection.update_one({'_id': location}, {'$set': to_bson(fields)}, upsert=True)
+            self.breaker.record_success('analysis_status')
+        except Exception as e:
+            print(f"Failed to update analysis status for {location}, pausing status updates: {e}")
+            self.breaker.record_failure('analysis_status')
+        record('mongo.status_update', time.perf_counter() - start)
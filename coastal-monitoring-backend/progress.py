@@ -0,0 +1,96 @@
+# progress.py
+"""Structured progress events for analysis runs
+
+publish() sends each event to every configured channel:
+
+    ANALYSIS_PROGRESS_FD     file descriptor that receives newline-delimited
+                             JSON (the Node API passes a pipe as fd 3)
+    ANALYSIS_PROGRESS_PATH   file that NDJSON events are appended to
+    add_listener()           in-process callbacks, e.g. the analysis worker's
+                             per-job event log
+
+Events are flat dicts with type, location, timestamp and a process-wide
+sequence number. Fields set with progress_context() on the current thread
+(such as a job id) are added to every event published inside it.
+"""
+import itertools
+import json
+import os
+import threading
+from contextlib import contextmanager
+from datetime import datetime
+
+_state = threading.local()
+_listeners = []
+_sequence = itertools.count(1)
+_stream = None
+_stream_opened = False
+_lock = threading.Lock()
+
+
+def add_listener(listener):
+    with _lock:
+        _listeners.append(listener)
+
+
+def remove_listener(listener):
+    with _lock:
+        if listener in _listeners:
+            _listeners.remove(listener)
+
+
+@contextmanager
+def progress_context(**fields):
+    """Add fields to every event published on this thread inside the block"""
+    previous = getattr(_state, 'fields', {})
+    _state.fields = dict(previous, **fields)
+    try:
+        yield
+    finally:
+        _state.fields = previous
+
+
+def get_stream():
+    """NDJSON output from the environment, opened once (None when not configured)"""
+    global _stream, _stream_opened
+    if not _stream_opened:
+        _stream_opened = True
+        try:
+            if os.getenv('ANALYSIS_PROGRESS_FD'):
+                _stream = os.fdopen(int(os.environ['ANALYSIS_PROGRESS_FD']), 'w', buffering=1)
+            elif os.getenv('ANALYSIS_PROGRESS_PATH'):
+                path = os.environ['ANALYSIS_PROGRESS_PATH']
+                if os.path.dirname(path):
+                    os.makedirs(os.path.dirname(path), exist_ok=True)
+                _stream = open(path, 'a', buffering=1)
+        except Exception as e:
+            print(f"Progress stream unavailable: {e}")
+    return _stream
+
+
+def publish(event_type, location=None, **fields):
+    """Send one event to the stream and listeners; returns the event"""
+    event = dict(getattr(_state, 'fields', {}))
+    event.update(fields)
+    event.update({
+        'type': event_type,
+        'location': location,
+        'timestamp': datetime.now().isoformat(),
+        'seq': next(_sequence)
+    })
+
+    with _lock:
+        stream = get_stream()
+        listeners = list(_listeners)
+        if stream is not None:
+            try:
+                stream.write(json.dumps(event, default=str) + '\n')
+            except Exception as e:
+                print(f"Failed to write progress event: {e}")
+
+    for listener in listeners:
+        try:
+            listener(event)
+        except Exception as e:
+            print(f"Progress listener failed: {e}")
+    return event
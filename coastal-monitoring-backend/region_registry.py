@@ -0,0 +1,238 @@
+# region_registry.py
+"""Monitored coastal regions with precomputed bounds, centroids and a spatial index
+
+Regions come from a GeoJSON FeatureCollection (REGION_REGISTRY_PATH,
+regions.geojson by default, also read by the Node API) or from a MongoDB
+collection of {name, geometry, properties} documents. Polygon and
+MultiPolygon geometries are supported.
+"""
+import json
+import math
+import os
+
+import numpy as np
+
+DEFAULT_REGISTRY_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'regions.geojson')
+
+
+def geometry_polygons(geometry):
+    """List of polygons, each a list of rings, for a Polygon or MultiPolygon"""
+    if geometry['type'] == 'Polygon':
+        return [geometry['coordinates']]
+    if geometry['type'] == 'MultiPolygon':
+        return geometry['coordinates']
+    raise ValueError(f"Unsupported region geometry: {geometry['type']}")
+
+
+def ring_area_centroid(ring):
+    """Signed area and centroid of a ring (shoelace formula)"""
+    points = np.asarray(ring, dtype=float)
+    # Work relative to the first vertex to keep the products well conditioned
+    origin = points[0]
+    x, y = points[:, 0] - origin[0], points[:, 1] - origin[1]
+    x1, y1 = np.roll(x, -1), np.roll(y, -1)
+    cross = x * y1 - x1 * y
+    area = cross.sum() / 2
+    if area == 0:
+        return 0.0, (float(points[:, 0].mean()), float(points[:, 1].mean()))
+    return float(area), (float(origin[0] + ((x + x1) * cross).sum() / (6 * area)),
+                         float(origin[1] + ((y + y1) * cross).sum() / (6 * area)))
+
+
+def geometry_centroid(geometry):
+    """Area-weighted (lon, lat) centroid; holes count negatively"""
+    total = 0.0
+    cx = cy = 0.0
+    for polygon in geometry_polygons(geometry):
+        for index, ring in enumerate(polygon):
+            area, (x, y) = ring_area_centroid(ring)
+            area = abs(area) if index == 0 else -abs(area)
+            total += area
+            cx += x * area
+            cy += y * area
+    if total == 0:
+        points = np.concatenate([np.asarray(polygon[0], dtype=float) for polygon in geometry_polygons(geometry)])
+        return float(points[:, 0].mean()), float(points[:, 1].mean())
+    return cx / total, cy / total
+
+
+def geometry_bounds(geometry):
+    points = np.concatenate([
+        np.asarray(ring, dtype=float)
+        for polygon in geometry_polygons(geometry) for ring in polygon
+    ])
+    return (float(points[:, 0].min()), float(points[:, 1].min()),
+            float(points[:, 0].max()), float(points[:, 1].max()))
+
+
+def ring_contains(ring, lon, lat):
+    """Even-odd ray casting over all edges of a ring at once"""
+    points = np.asarray(ring, dtype=float)
+    x0, y0 = points[:, 0], points[:, 1]
+    x1, y1 = np.roll(x0, -1), np.roll(y0, -1)
+    straddles = (y0 > lat) != (y1 > lat)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        crossing = x0 + (lat - y0) * (x1 - x0) / (y1 - y0)
+    return bool(np.count_nonzero(straddles & (lon < crossing)) % 2)
+
+
+def geometry_contains(geometry, lon, lat):
+    for polygon in geometry_polygons(geometry):
+        if ring_contains(polygon[0], lon, lat) and not any(ring_contains(hole, lon, lat) for hole in polygon[1:]):
+            return True
+    return False
+
+
+def rectangle_geometry(bounds):
+    west, south, east, north = bounds
+    return {'type': 'Polygon', 'coordinates': [[[west, south], [east, south], [east, north],
+                                                [west, north], [west, south]]]}
+
+
+def str_order(boxes, node_capacity):
+    """Sort-Tile-Recursive order: vertical slices by x centre, then y within each slice"""
+    n = len(boxes)
+    cx = (boxes[:, 0] + boxes[:, 2]) / 2
+    cy = (boxes[:, 1] + boxes[:, 3]) / 2
+    leaf_count = math.ceil(n / node_capacity)
+    slice_size = node_capacity * math.ceil(math.sqrt(leaf_count))
+    rank = np.empty(n, dtype=np.int64)
+    rank[np.argsort(cx, kind='stable')] = np.arange(n)
+    return np.lexsort((cy, rank // slice_size))
+
+
+class STRTree:
+    """Static packed R-tree over bounding boxes (west, south, east, north)"""
+
+    def __init__(self, boxes, node_capacity=16):
+        boxes = np.asarray(boxes, dtype=float).reshape(-1, 4)
+        self.node_capacity = node_capacity
+        order = str_order(boxes, node_capacity) if len(boxes) else np.arange(0)
+        self.items = order
+        # levels[0] holds the leaf entries; each higher level holds nodes whose
+        # children are the [start, stop) range of the level below
+        self.levels = [(boxes[order], None, None)]
+
+        current = boxes[order]
+        while len(current) > node_capacity:
+            starts = np.arange(0, len(current), node_capacity)
+            stops = np.minimum(starts + node_capacity, len(current))
+            nodes = np.column_stack([
+                np.minimum.reduceat(current[:, 0], starts),
+                np.minimum.reduceat(current[:, 1], starts),
+                np.maximum.reduceat(current[:, 2], starts),
+                np.maximum.reduceat(current[:, 3], starts),
+            ])
+            order = str_order(nodes, node_capacity)
+            current = nodes[order]
+            self.levels.append((current, starts[order], stops[order]))
+
+    @staticmethod
+    def intersects(boxes, bbox):
+        west, south, east, north = bbox
+        return (boxes[:, 0] <= east) & (boxes[:, 2] >= west) & (boxes[:, 1] <= north) & (boxes[:, 3] >= south)
+
+    def query(self, bbox):
+        """Indices (into the original boxes) of every box intersecting bbox"""
+        candidates = np.arange(len(self.levels[-1][0]))
+        for level in range(len(self.levels) - 1, 0, -1):
+            boxes, starts, stops = self.levels[level]
+            hits = candidates[self.intersects(boxes[candidates], bbox)]
+            if not len(hits):
+                return np.arange(0)
+            candidates = np.concatenate([np.arange(starts[i], stops[i]) for i in hits])
+        leaves = self.levels[0][0]
+        return self.items[candidates[self.intersects(leaves[candidates], bbox)]]
+
+
+class RegionRegistry:
+    """Named monitoring regions with client-side geometry metadata"""
+
+    def __init__(self, regions):
+        self.regions = {}
+        for region in regions:
+            geometry = region['geometry']
+            self.regions[region['name']] = {
+                'name': region['name'],
+                'geometry': geometry,
+                'properties': region.get('properties', {}),
+                'bounds': geometry_bounds(geometry),
+                'centroid': geometry_centroid(geometry),
+            }
+        self.names = list(self.regions)
+        self.index = STRTree([self.regions[name]['bounds'] for name in self.names])
+
+    @classmethod
+    def from_geojson(cls, path=None):
+        path = path or os.getenv('REGION_REGISTRY_PATH', DEFAULT_REGISTRY_PATH)
+        with open(path) as handle:
+            collection = json.load(handle)
+        return cls([
+            {'name': feature['properties']['name'], 'geometry': feature['geometry'],
+             'properties': feature['properties']}
+            for feature in collection['features']
+        ])
+
+    @classmethod
+    def from_mongo(cls, collection, query=None):
+        return cls([
+            {'name': doc['name'], 'geometry': doc['geometry'], 'properties': doc.get('properties', {})}
+            for doc in collection.find(query or {}, {'_id': 0})
+        ])
+
+    @classmethod
+    def from_bounds(cls, region_bounds):
+        return cls([
+            {'name': name, 'geometry': rectangle_geometry(bounds)} for name, bounds in region_bounds.items()
+        ])
+
+    def __contains__(self, name):
+        return name in self.regions
+
+    def __iter__(self):
+        return iter(self.names)
+
+    def __len__(self):
+        return len(self.names)
+
+    def __getitem__(self, name):
+        return self.regions[name]
+
+    def bounds(self, name):
+        return self.regions[name]['bounds']
+
+    def centroid(self, name):
+        """(lon, lat)"""
+        return self.regions[name]['centroid']
+
+    def geometry(self, name):
+        return self.regions[name]['geometry']
+
+    def bounds_by_name(self):
+        return {name: region['bounds'] for name, region in self.regions.items()}
+
+    def query_bbox(self, bbox):
+        """Regions whose bounds intersect a (west, south, east, north) box"""
+        return [self.names[i] for i in sorted(self.index.query(bbox))]
+
+    def query_point(self, lon, lat):
+        """Regions whose geometry contains the point"""
+        return [name for name in self.query_bbox((lon, lat, lon, lat))
+                if geometry_contains(self.regions[name]['geometry'], lon, lat)]
+
+    def summary(self, name):
+        """JSON-ready bounds and [lat, lon] centre, e.g. for the API"""
+        region = self.regions[name]
+        lon, lat = region['centroid']
+        return {'name': name, 'bounds': list(region['bounds']), 'center': [lat, lon],
+                'properties': region['properties']}
+
+    def to_feature_collection(self):
+        return {
+            'type': 'FeatureCollection',
+            'features': [
+                {'type': 'Feature', 'properties': dict(region['properties'], name=name),
+                 'geometry': region['geometry']}
+                for name, region in self.regions.items()
+            ]
+        }
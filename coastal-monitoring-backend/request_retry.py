@@ -0,0 +1,161 @@
+# request_retry.py
+"""Retries with backoff and a shared concurrency cap for Earth Engine requests
+
+Earth Engine reports quota pressure as errors like "Too many concurrent
+aggregations" or HTTP 429. Those are retried with a longer exponential
+backoff and also halve the number of requests allowed in flight; each run
+of successful requests then gives one slot back. Other transient errors
+(timeouts, 5xx, dropped connections) are retried without touching the cap,
+and anything else fails on the first attempt.
+"""
+import random
+import re
+import threading
+import time
+
+from instrumentation import count
+
+# Status codes only count as whole words, so "5000 elements" or "1429 images" do not match
+RATE_LIMIT_PATTERN = re.compile(
+    r'too many concurrent|too many requests|rate limit|quota exceeded|resource[ _]exhausted|\b429\b'
+)
+TRANSIENT_PATTERN = re.compile(
+    r'timed out|timeout|deadline exceeded|internal error|service unavailable|backend error|temporarily'
+    r'|connection (?:reset|refused|aborted|closed|error)|\b50[0234]\b'
+)
+RATE_LIMIT_STATUSES = {429}
+TRANSIENT_STATUSES = {500, 502, 503, 504}
+
+
+def http_status(error):
+    """HTTP status carried by googleapiclient (resp.status) or requests (response.status_code) errors"""
+    status = getattr(getattr(error, 'resp', None), 'status', None)
+    if status is None:
+        status = getattr(getattr(error, 'response', None), 'status_code', None)
+    try:
+        return int(status) if status is not None else None
+    except (TypeError, ValueError):
+        return None
+
+
+def classify_error(error):
+    """'rate_limit', 'transient' or 'permanent'"""
+    if isinstance(error, RequestFailed):
+        return error.kind
+    status = http_status(error)
+    if status in RATE_LIMIT_STATUSES:
+        return 'rate_limit'
+    if status in TRANSIENT_STATUSES:
+        return 'transient'
+    message = str(error).lower()
+    if RATE_LIMIT_PATTERN.search(message):
+        return 'rate_limit'
+    if isinstance(error, (TimeoutError, ConnectionError)) or TRANSIENT_PATTERN.search(message):
+        return 'transient'
+    return 'permanent'
+
+
+class RequestFailed(Exception):
+    """A request that still failed after its last attempt"""
+
+    def __init__(self, message, kind, attempts):
+        super().__init__(message)
+        self.kind = kind
+        self.attempts = attempts
+
+
+class AdaptiveLimiter:
+    """Caps requests in flight; halves on rate limiting, grows back on success"""
+
+    def __init__(self, max_limit=8, min_limit=1, increase_after=5):
+        self.max_limit = max(1, max_limit)
+        self.min_limit = max(1, min(min_limit, self.max_limit))
+        self.limit = self.max_limit
+        self.increase_after = increase_after
+        self.active = 0
+        self.successes = 0
+        self.condition = threading.Condition()
+
+    def __enter__(self):
+        with self.condition:
+            while self.active >= self.limit:
+                self.condition.wait()
+            self.active += 1
+        return self
+
+    def __exit__(self, *exc_info):
+        with self.condition:
+            self.active -= 1
+            self.condition.notify()
+
+    def on_success(self):
+        with self.condition:
+            self.successes += 1
+            if self.limit < self.max_limit and self.successes >= self.increase_after:
+                self.limit += 1
+                self.successes = 0
+                self.condition.notify()
+
+    def on_rate_limit(self):
+        with self.condition:
+            self.limit = max(self.min_limit, self.limit // 2)
+            self.successes = 0
+
+
+_limiters = {}
+_limiters_lock = threading.Lock()
+
+
+def get_request_limiter(name, max_limit):
+    """One limiter per service, shared by every analyst in the process"""
+    with _limiters_lock:
+        if name not in _limiters:
+            _limiters[name] = AdaptiveLimiter(max_limit)
+        return _limiters[name]
+
+
+class RetryPolicy:
+    """Exponential backoff with jitter; rate limits start from a longer delay"""
+
+    def __init__(self, max_attempts=5, base_delay=1.0, rate_limit_delay=5.0, max_delay=60.0):
+        self.max_attempts = max(1, max_attempts)
+        self.base_delay = base_delay
+        self.rate_limit_delay = rate_limit_delay
+        self.max_delay = max_delay
+
+    def delay(self, attempt, kind):
+        base = self.rate_limit_delay if kind == 'rate_limit' else self.base_delay
+        # Equal jitter keeps at least half the backoff while spreading retries apart
+        backoff = min(self.max_delay, base * 2 ** (attempt - 1))
+        return backoff / 2 + random.uniform(0, backoff / 2)
+
+
+def call_with_retry(request, label, policy, limiter):
+    """Run request() under the limiter, retrying transient and rate-limit errors
+
+    Raises RequestFailed with the error kind and attempt count once the
+    error is permanent or the attempts run out.
+    """
+    attempt = 0
+    while True:
+        attempt += 1
+        with limiter:
+            try:
+                result = request()
+            except Exception as e:
+                error, kind = e, classify_error(e)
+            else:
+                limiter.on_success()
+                return result
+
+        if kind == 'rate_limit':
+            limiter.on_rate_limit()
+            count('ee_throttled')
+        if kind == 'permanent' or attempt >= policy.max_attempts:
+            raise RequestFailed(str(error), kind, attempt) from error
+
+        delay = policy.delay(attempt, kind)
+        count('ee_retries')
+        count(f'ee_retries.{kind}')
+        print(f"{label} failed ({kind}: {error}); retry {attempt}/{policy.max_attempts - 1} in {delay:.1f}s")
+        time.sleep(delay)
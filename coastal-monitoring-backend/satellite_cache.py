@@ -0,0 +1,180 @@
+# satellite_cache.py
+import sqlite3
+import hashlib
+import json
+import os
+import threading
+import time
+from datetime import datetime
+
+
+class MonthlyStatsCache:
+    """SQLite cache of monthly satellite statistics
+
+    Months whose extraction failed are kept in failed_months with the
+    reason, so later runs can backfill exactly those months.
+    """
+
+    def __init__(self, path=None, ttl_seconds=None, open_month_ttl_seconds=6 * 3600):
+        self.path = path or os.getenv('SATELLITE_CACHE_PATH', 'cache/monthly_stats.sqlite')
+        # Closed months never change upstream, so they only expire when a TTL is set
+        self.ttl_seconds = ttl_seconds
+        self.open_month_ttl_seconds = open_month_ttl_seconds
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+
+        if os.path.dirname(self.path):
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        self.conn = sqlite3.connect(self.path, check_same_thread=False)
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS monthly_stats (
+                cache_key TEXT PRIMARY KEY,
+                location TEXT NOT NULL,
+                date TEXT NOT NULL,
+                stats TEXT NOT NULL,
+                closed INTEGER NOT NULL,
+                created_at REAL NOT NULL
+            )
+        """)
+        self.conn.execute(
+            "CREATE INDEX IF NOT EXISTS idx_monthly_stats_location ON monthly_stats (location, date)"
+        )
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS failed_months (
+                location TEXT NOT NULL,
+                start_date TEXT NOT NULL,
+                end_date TEXT NOT NULL,
+                reason TEXT NOT NULL,
+                kind TEXT NOT NULL,
+                attempts INTEGER NOT NULL,
+                first_failed_at REAL NOT NULL,
+                last_failed_at REAL NOT NULL,
+                PRIMARY KEY (location, start_date)
+            )
+        """)
+        self.conn.commit()
+
+    @staticmethod
+    def make_key(region_geojson, date, cloud_threshold, scale, indices):
+        """Hash everything that changes the value of a monthly reduction"""
+        payload = json.dumps({
+            'region': region_geojson,
+            'date': date,
+            'cloud_threshold': cloud_threshold,
+            'scale': scale,
+            'indices': sorted(indices)
+        }, sort_keys=True)
+        return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+    @staticmethod
+    def is_closed_month(end_date):
+        """A month is closed once its end date has passed"""
+        return datetime.strptime(end_date, '%Y-%m-%d') <= datetime.now()
+
+    def get(self, cache_key):
+        """Return cached stats ({} for a month without imagery) or None on a miss"""
+        with self.lock:
+            row = self.conn.execute(
+                "SELECT stats, closed, created_at FROM monthly_stats WHERE cache_key = ?",
+                (cache_key,)
+            ).fetchone()
+
+            if row is None:
+                self.misses += 1
+                return None
+
+            stats, closed, created_at = row
+            ttl = self.ttl_seconds if closed else self.open_month_ttl_seconds
+            if ttl is not None and time.time() - created_at > ttl:
+                self.conn.execute("DELETE FROM monthly_stats WHERE cache_key = ?", (cache_key,))
+                self.conn.commit()
+                self.misses += 1
+                return None
+
+            self.hits += 1
+            return json.loads(stats)
+
+    def put(self, cache_key, location, date, stats, closed):
+        with self.lock:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO monthly_stats VALUES (?, ?, ?, ?, ?, ?)",
+                (cache_key, location, date, json.dumps(stats, default=float), int(closed), time.time())
+            )
+            self.conn.commit()
+
+    def record_failure(self, location, start_date, end_date, reason, kind, attempts=1):
+        """Remember a month that could not be extracted; attempts accumulate across runs"""
+        now = time.time()
+        with self.lock:
+            self.conn.execute("""
+                INSERT INTO failed_months VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+                ON CONFLICT (location, start_date) DO UPDATE SET
+                    reason = excluded.reason,
+                    kind = excluded.kind,
+                    attempts = attempts + excluded.attempts,
+                    last_failed_at = excluded.last_failed_at
+            """, (location, start_date, end_date, reason[:500], kind, attempts, now, now))
+            self.conn.commit()
+
+    def clear_failure(self, location, start_date):
+        with self.lock:
+            self.conn.execute(
+                "DELETE FROM failed_months WHERE location = ? AND start_date = ?", (location, start_date)
+            )
+            self.conn.commit()
+
+    def failed_months(self, location=None):
+        """Outstanding failures as dicts, oldest month first"""
+        query = "SELECT * FROM failed_months"
+        params = []
+        if location is not None:
+            query += " WHERE location = ?"
+            params.append(location)
+        with self.lock:
+            cursor = self.conn.execute(query + " ORDER BY location, start_date", params)
+            columns = [column[0] for column in cursor.description]
+            return [dict(zip(columns, row)) for row in cursor.fetchall()]
+
+    def latest_month(self, location):
+        """Most recent cached 'YYYY-MM' with data for a location"""
+        with self.lock:
+            row = self.conn.execute(
+                "SELECT MAX(date) FROM monthly_stats WHERE location = ? AND closed = 1 AND stats != '{}'",
+                (location,)
+            ).fetchone()
+        return row[0] if row else None
+
+    def invalidate(self, location=None, before=None, open_only=False):
+        """Drop cached months, optionally for one location, older than a timestamp or still open"""
+        query = "DELETE FROM monthly_stats WHERE 1 = 1"
+        params = []
+        if location is not None:
+            query += " AND location = ?"
+            params.append(location)
+        if before is not None:
+            query += " AND created_at < ?"
+            params.append(before.timestamp() if isinstance(before, datetime) else before)
+        if open_only:
+            query += " AND closed = 0"
+
+        with self.lock:
+            deleted = self.conn.execute(query, params).rowcount
+            self.conn.commit()
+        return deleted
+
+    def clear(self):
+        return self.invalidate()
+
+    def stats(self):
+        """Hit/miss counters for this process"""
+        total = self.hits + self.misses
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': self.hits / total if total else 0.0
+        }
+
+    def close(self):
+        with self.lock:
+            self.conn.close()
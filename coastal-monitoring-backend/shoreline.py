@@ -0,0 +1,277 @@
+# shoreline.py
+"""Shoreline positions and erosion rates from monthly NDWI rasters
+
+ShorelineEngine.analyze() works on a stack of monthly NDWI composites that
+share one grid (row 0 at the north edge of `bounds`):
+
+    1. Each month is thresholded into a water mask.
+    2. The baseline is the shoreline of the water frequency across months,
+       i.e. the median shoreline. Transect origins are spread along it
+       `spacing_m` apart.
+    3. Each transect is shore-normal and points seaward, along the
+       gradient of the smoothed baseline water mask.
+    4. Every transect samples every month's mask at once. Its shoreline
+       position is the land-to-water crossing nearest the baseline, in
+       metres, positive seaward.
+    5. The erosion rate of each transect is the least-squares slope of
+       its positions over time (m/yr). Negative slopes mean the shoreline
+       retreats and the coast is eroding.
+
+Positions are only as precise as a pixel, so the engine scales to the
+raster: transects reach at least `min_transect_pixels` pixels to each
+side of the baseline, and a transect only counts as eroding when it
+retreats faster than one pixel over the observed period. Summaries of
+rasters coarser than `max_reliable_pixel_m` are marked unreliable.
+
+All steps are array operations over every transect and month; transects
+are only chunked to bound memory. Distances use a local equirectangular
+projection, which is accurate at the size of a monitored region.
+"""
+import numpy as np
+
+METRES_PER_DEGREE = 6371008.8 * np.pi / 180
+NODATA = -1
+
+
+def otsu_threshold(values, bins=256):
+    """Threshold that best separates the values into two classes"""
+    values = values[np.isfinite(values)]
+    if values.size == 0:
+        return 0.0
+    counts, edges = np.histogram(values, bins=bins)
+    centres = (edges[:-1] + edges[1:]) / 2
+    weight = np.cumsum(counts)
+    total = weight[-1]
+    cumulative_mean = np.cumsum(counts * centres)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        mean_low = cumulative_mean / weight
+        mean_high = (cumulative_mean[-1] - cumulative_mean) / (total - weight)
+        variance = weight * (total - weight) * (mean_low - mean_high) ** 2
+    return float(centres[np.nanargmax(variance[:-1])])
+
+
+def water_masks(rasters, threshold=0.0):
+    """int8 stack: 1 water, 0 land, NODATA where the index is undefined"""
+    masks = np.full(rasters.shape, NODATA, dtype=np.int8)
+    for position, raster in enumerate(rasters):
+        valid = np.isfinite(raster)
+        level = otsu_threshold(raster) if threshold == 'otsu' else float(threshold)
+        masks[position][valid] = (raster[valid] > level).astype(np.int8)
+    return masks
+
+
+def box_mean(values, radius):
+    """Mean over a (2 * radius + 1) square window, from an integral image"""
+    size = 2 * radius + 1
+    padded = np.pad(values.astype(np.float64), radius, mode='edge')
+    integral = np.zeros((padded.shape[0] + 1, padded.shape[1] + 1))
+    integral[1:, 1:] = padded.cumsum(axis=0).cumsum(axis=1)
+    sums = (integral[size:, size:] - integral[:-size, size:]
+            - integral[size:, :-size] + integral[:-size, :-size])
+    return sums / (size * size)
+
+
+def shoreline_pixels(water, valid):
+    """Water pixels with a valid land pixel among their 4 neighbours"""
+    land = valid & ~water
+    edge = np.zeros_like(water)
+    edge[1:, :] |= land[:-1, :]
+    edge[:-1, :] |= land[1:, :]
+    edge[:, 1:] |= land[:, :-1]
+    edge[:, :-1] |= land[:, 1:]
+    return water & valid & edge
+
+
+class RasterGrid:
+    """Pixel <-> metre <-> lon/lat conversions for a north-up raster"""
+
+    def __init__(self, bounds, shape):
+        self.west, self.south, self.east, self.north = bounds
+        self.height, self.width = shape
+        self.deg_x = (self.east - self.west) / self.width
+        self.deg_y = (self.north - self.south) / self.height
+        latitude = np.radians((self.north + self.south) / 2)
+        # Metric x grows east, y grows south like the row index
+        self.dx = self.deg_x * METRES_PER_DEGREE * np.cos(latitude)
+        self.dy = self.deg_y * METRES_PER_DEGREE
+
+    def pixel_centres(self, rows, cols):
+        return (cols + 0.5) * self.dx, (rows + 0.5) * self.dy
+
+    def pixel_index(self, x, y):
+        return np.floor(y / self.dy).astype(np.int64), np.floor(x / self.dx).astype(np.int64)
+
+    def lonlat(self, x, y):
+        return self.west + x / self.dx * self.deg_x, self.north - y / self.dy * self.deg_y
+
+
+def decimal_years(dates):
+    """'YYYY-MM[-DD]' strings as fractional years"""
+    return np.array([int(date[:4]) + (int(date[5:7]) - 1) / 12 for date in dates], dtype=np.float64)
+
+
+def linear_rates(times, positions, min_observations=3):
+    """Least-squares slope per column of positions (months x transects), NaN-aware"""
+    valid = np.isfinite(positions)
+    n = valid.sum(axis=0)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        mean_t = (times[:, None] * valid).sum(axis=0) / n
+        mean_p = np.where(valid, positions, 0).sum(axis=0) / n
+        dt = np.where(valid, times[:, None] - mean_t, 0)
+        dp = np.where(valid, positions - mean_p, 0)
+        s_tt = (dt * dt).sum(axis=0)
+        rates = (dt * dp).sum(axis=0) / s_tt
+    return np.where((n >= min_observations) & (s_tt > 0), rates, np.nan), n
+
+
+def pack_array(values, dtype):
+    """Little-endian bytes of an array with its dtype and shape, for compact storage"""
+    values = np.ascontiguousarray(values, dtype=np.dtype(dtype).newbyteorder('<'))
+    return {'dtype': np.dtype(dtype).str.lstrip('<>|='), 'shape': list(values.shape), 'data': values.tobytes()}
+
+
+class ShorelineEngine:
+    """Transect-based shoreline change from monthly NDWI rasters"""
+
+    def __init__(self, water_threshold=0.0, spacing_m=50.0, transect_length_m=500.0,
+                 smoothing_m=60.0, erosion_rate=2.0, min_observations=3, chunk_size=2000,
+                 min_transect_pixels=10, max_reliable_pixel_m=60.0):
+        self.water_threshold = water_threshold
+        self.spacing_m = spacing_m
+        self.transect_length_m = transect_length_m
+        self.smoothing_m = smoothing_m
+        self.erosion_rate = erosion_rate
+        self.min_observations = min_observations
+        self.chunk_size = chunk_size
+        self.min_transect_pixels = min_transect_pixels
+        self.max_reliable_pixel_m = max_reliable_pixel_m
+
+    def transect_length(self, pixel_m):
+        """Configured length, stretched to min_transect_pixels pixels each side on coarse rasters"""
+        return max(self.transect_length_m, 2 * self.min_transect_pixels * pixel_m)
+
+    def erosion_threshold(self, pixel_m, years):
+        """Configured erosion rate, raised to one pixel over the observed period"""
+        return max(self.erosion_rate, pixel_m / years) if years > 0 else self.erosion_rate
+
+    def build_transects(self, masks, grid):
+        """Origins (x, y) on the baseline and seaward unit normals, one row per transect"""
+        valid = (masks != NODATA).any(axis=0)
+        observed = (masks != NODATA).sum(axis=0)
+        water_share = np.where(observed > 0, (masks == 1).sum(axis=0) / np.maximum(observed, 1), 0)
+        baseline = water_share >= 0.5
+
+        radius = max(1, int(round(self.smoothing_m / min(grid.dx, grid.dy) / 2)))
+        smoothed = box_mean(baseline, radius)
+        grad_y, grad_x = np.gradient(smoothed)
+        rows, cols = np.nonzero(shoreline_pixels(baseline, valid))
+        normal_x = grad_x[rows, cols] / grid.dx
+        normal_y = grad_y[rows, cols] / grid.dy
+        length = np.hypot(normal_x, normal_y)
+        keep = length > 0
+        rows, cols = rows[keep], cols[keep]
+        normals = np.stack([normal_x[keep], normal_y[keep]], axis=1) / length[keep, None]
+        x, y = grid.pixel_centres(rows, cols)
+
+        # One transect per spacing-sized cell along the baseline
+        cells = np.floor(x / self.spacing_m).astype(np.int64) * 1_000_003 + np.floor(y / self.spacing_m).astype(np.int64)
+        _, first = np.unique(cells, return_index=True)
+        first.sort()
+        return np.stack([x[first], y[first]], axis=1), normals[first]
+
+    def measure_positions(self, masks, grid, origins, normals):
+        """Shoreline position (m, seaward positive) per month and transect; NaN if not found"""
+        step = min(grid.dx, grid.dy) / 2
+        half = self.transect_length(min(grid.dx, grid.dy)) / 2
+        offsets = np.arange(-half, half + step / 2, step)
+        midpoints = (offsets[:-1] + offsets[1:]) / 2
+        positions = np.full((masks.shape[0], len(origins)), np.nan)
+
+        for start in range(0, len(origins), self.chunk_size):
+            stop = start + self.chunk_size
+            x = origins[start:stop, 0, None] + offsets[None, :] * normals[start:stop, 0, None]
+            y = origins[start:stop, 1, None] + offsets[None, :] * normals[start:stop, 1, None]
+            rows, cols = grid.pixel_index(x, y)
+            inside = (rows >= 0) & (rows < grid.height) & (cols >= 0) & (cols < grid.width)
+            samples = masks[:, np.clip(rows, 0, grid.height - 1), np.clip(cols, 0, grid.width - 1)]
+            samples[:, ~inside] = NODATA
+
+            # Land followed by water walking seaward; keep the crossing nearest the baseline
+            crossing = (samples[..., :-1] == 0) & (samples[..., 1:] == 1)
+            distance = np.where(crossing, np.abs(midpoints), np.inf)
+            nearest = distance.argmin(axis=-1)
+            found = np.isfinite(np.take_along_axis(distance, nearest[..., None], axis=-1)[..., 0])
+            positions[:, start:stop] = np.where(found, midpoints[nearest], np.nan)
+        return positions
+
+    def analyze(self, rasters, bounds, dates):
+        """Shoreline change for NDWI rasters (months x rows x cols) dated 'YYYY-MM...'
+
+        Returns {'summary', 'transects'}, or None when fewer than two months
+        have data or no shoreline is found.
+        """
+        rasters = np.asarray(rasters, dtype=np.float32)
+        masks = water_masks(rasters, self.water_threshold)
+        has_data = (masks != NODATA).any(axis=(1, 2))
+        if has_data.sum() < 2:
+            return None
+        masks, dates = masks[has_data], [date for date, keep in zip(dates, has_data) if keep]
+
+        grid = RasterGrid(bounds, masks.shape[1:])
+        origins, normals = self.build_transects(masks, grid)
+        if len(origins) == 0:
+            return None
+
+        positions = self.measure_positions(masks, grid, origins, normals)
+        times = decimal_years(dates)
+        rates, observations = linear_rates(times, positions, self.min_observations)
+        measured = np.isfinite(rates)
+        lon, lat = grid.lonlat(origins[:, 0], origins[:, 1])
+        pixel_m = float(min(grid.dx, grid.dy))
+        threshold = self.erosion_threshold(pixel_m, times.max() - times.min())
+
+        summary = {
+            'months': len(dates),
+            'first_month': dates[0][:7],
+            'last_month': dates[-1][:7],
+            'transects': int(len(origins)),
+            'measured_transects': int(measured.sum()),
+            'transect_spacing_m': self.spacing_m,
+            'transect_length_m': round(self.transect_length(pixel_m), 1),
+            'pixel_size_m': round(pixel_m, 1),
+            'erosion_threshold_m_per_year': round(float(threshold), 2),
+            'reliable': bool(pixel_m <= self.max_reliable_pixel_m)
+        }
+        if measured.any():
+            measured_rates = rates[measured]
+            eroding = np.flatnonzero(measured & (rates < -threshold))
+            worst = eroding[np.argsort(rates[eroding])][:10]
+            summary.update({
+                'mean_rate_m_per_year': round(float(measured_rates.mean()), 2),
+                'median_rate_m_per_year': round(float(np.median(measured_rates)), 2),
+                'max_erosion_m_per_year': round(float(max(0.0, -measured_rates.min())), 2),
+                'eroding_share': round(float((measured_rates < -threshold).mean()), 3),
+                'accreting_share': round(float((measured_rates > threshold).mean()), 3),
+                'hotspots': [
+                    {'lon': round(float(lon[i]), 6), 'lat': round(float(lat[i]), 6),
+                     'rate_m_per_year': round(float(rates[i]), 2)}
+                    for i in worst
+                ]
+            })
+
+        # Per-month shorelines are origin + position * normal, so storing the
+        # position matrix in decimetres keeps every month's shoreline compactly.
+        # int16 covers +-3276.6 m; the longer transects of coarse pixels use int32
+        half_dm = self.transect_length(pixel_m) / 2 * 10
+        position_dtype = np.int16 if half_dm < np.iinfo(np.int16).max else np.int32
+        missing = int(np.iinfo(position_dtype).min)
+        position_dm = np.where(np.isfinite(positions), np.round(positions * 10), missing)
+        transects = {
+            'months': [date[:7] for date in dates],
+            'origin_lonlat': pack_array(np.stack([lon, lat], axis=1), np.float64),
+            'normal_east_north': pack_array(np.stack([normals[:, 0], -normals[:, 1]], axis=1), np.float32),
+            'position_dm': dict(pack_array(position_dm, position_dtype), missing=missing),
+            'rate_m_per_year': pack_array(rates, np.float32),
+            'observations': pack_array(np.minimum(observations, np.iinfo(np.uint16).max), np.uint16)
+        }
+        return {'summary': summary, 'transects': transects}
@@ -0,0 +1,122 @@
+# spectral_indices.py
+"""Registry of Sentinel-2 spectral indices
+
+Each index knows the source bands it reads and how to compute itself both
+on NumPy band arrays (local scenes) and on an Earth Engine image. A run
+declares the indices it needs; source_bands() then gives the only bands
+that have to be selected, read or composited for them.
+
+    NDWI    water                    (B3 - B8) / (B3 + B8)
+    MNDWI   water, SWIR based        (B3 - B11) / (B3 + B11)
+    NDCI    chlorophyll              (B5 - B4) / (B5 + B4)
+    NDVI    vegetation               (B8 - B4) / (B8 + B4)
+    NDTI    turbidity                (B4 - B3) / (B4 + B3)
+    FAI     floating algae           NIR above the red-SWIR baseline
+
+Earth Engine images are never imported here; index methods only call
+methods on the image they are given.
+"""
+import numpy as np
+
+# Sentinel-2 L2A surface reflectance is stored as reflectance * 10000
+REFLECTANCE_SCALE = 0.0001
+
+
+class SpectralIndex:
+    """An index computed from a fixed set of Sentinel-2 bands"""
+
+    def __init__(self, name, bands, description=''):
+        self.name = name
+        self.bands = tuple(bands)
+        self.description = description
+
+    def compute(self, bands):
+        """float32 array from {band: array}; NaN where undefined"""
+        raise NotImplementedError
+
+    def ee_image(self, image):
+        """Single-band Earth Engine image named after the index"""
+        raise NotImplementedError
+
+
+class NormalizedDifference(SpectralIndex):
+    """(a - b) / (a + b)"""
+
+    def compute(self, bands):
+        a = np.asarray(bands[self.bands[0]], dtype=np.float32)
+        b = np.asarray(bands[self.bands[1]], dtype=np.float32)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            result = (a - b) / (a + b)
+        result[~np.isfinite(result)] = np.nan
+        return result
+
+    def ee_image(self, image):
+        return image.normalizedDifference(list(self.bands)).rename(self.name)
+
+
+class BaselineHeight(SpectralIndex):
+    """Reflectance of a peak band above the line between two neighbouring bands
+
+    bands are (left, peak, right) and wavelengths their centres in nm.
+    """
+
+    def __init__(self, name, bands, wavelengths, description=''):
+        super().__init__(name, bands, description)
+        left, peak, right = wavelengths
+        self.weight = (peak - left) / (right - left)
+
+    def compute(self, bands):
+        left, peak, right = (np.asarray(bands[band], dtype=np.float32) for band in self.bands)
+        baseline = left + (right - left) * self.weight
+        return ((peak - baseline) * REFLECTANCE_SCALE).astype(np.float32)
+
+    def ee_image(self, image):
+        left, peak, right = self.bands
+        return image.expression(
+            '(PEAK - (LEFT + (RIGHT - LEFT) * weight)) * scale',
+            {
+                'LEFT': image.select(left),
+                'PEAK': image.select(peak),
+                'RIGHT': image.select(right),
+                'weight': self.weight,
+                'scale': REFLECTANCE_SCALE
+            }
+        ).rename(self.name)
+
+
+SPECTRAL_INDICES = {}
+
+
+def register_index(index):
+    SPECTRAL_INDICES[index.name] = index
+    return index
+
+
+register_index(NormalizedDifference('NDWI', ('B3', 'B8'), 'Water index'))
+register_index(NormalizedDifference('MNDWI', ('B3', 'B11'), 'Modified water index'))
+register_index(NormalizedDifference('NDCI', ('B5', 'B4'), 'Chlorophyll index'))
+register_index(NormalizedDifference('NDVI', ('B8', 'B4'), 'Vegetation index'))
+register_index(NormalizedDifference('NDTI', ('B4', 'B3'), 'Turbidity index'))
+register_index(BaselineHeight('FAI', ('B4', 'B8', 'B11'), (665, 833, 1610), 'Floating algae index'))
+
+
+def get_indices(names):
+    """Registered indices for names, in order; unknown names raise ValueError"""
+    unknown = [name for name in names if name not in SPECTRAL_INDICES]
+    if unknown:
+        raise ValueError(f"Unknown spectral indices: {', '.join(unknown)} "
+                         f"(known: {', '.join(SPECTRAL_INDICES)})")
+    return [SPECTRAL_INDICES[name] for name in names]
+
+
+def source_bands(names):
+    """Sorted source bands the named indices read"""
+    return sorted({band for index in get_indices(names) for band in index.bands})
+
+
+def parse_index_names(value, required=()):
+    """Index names from a comma-separated setting, with `required` always first"""
+    names = list(required) + [name.strip().upper() for name in (value or '').split(',') if name.strip()]
+    names = list(dict.fromkeys(names))
+    get_indices(names)
+    return names
@@ -0,0 +1,151 @@
+# test_analysis_worker.py
+import json
+import threading
+import urllib.error
+import urllib.request
+from http.server import ThreadingHTTPServer
+
+import pytest
+
+from analysis_worker import AnalysisWorker, make_handler, parse_job_request
+from job_scheduler import SQLiteJobBroker
+from progress import publish
+from region_registry import RegionRegistry
+
+REGIONS = {'Mumbai': (72.7, 18.8, 73.1, 19.3), 'Chennai': (80.1, 12.9, 80.4, 13.3)}
+
+
+class FakeAnalyst:
+    """Stands in for CoastalAIAnalyst; records the options each run received"""
+
+    def __init__(self):
+        self.registry = RegionRegistry.from_bounds(REGIONS)
+        self.region_bounds = self.registry.bounds_by_name()
+        self.runs = []
+
+    def run_complete_analysis_pipeline(self, location, raise_errors=False, **options):
+        self.runs.append((location, options))
+        for month in ('2023-01', '2023-02', '2023-03'):
+            publish('month_extracted', location, month=month)
+        publish('analysis_complete', location)
+        return {'location': location, 'threat_level': 'LOW'}
+
+    def flush_results(self):
+        pass
+
+    def close(self):
+        pass
+
+
+@pytest.fixture
+def worker(tmp_path):
+    worker = AnalysisWorker(analyst=FakeAnalyst(), max_jobs=1,
+                            broker=SQLiteJobBroker(path=str(tmp_path / 'jobs.sqlite')))
+    worker.scheduler.poll_interval = 0.05
+    yield worker
+    worker.close()
+
+
+@pytest.fixture
+def server(worker):
+    server = ThreadingHTTPServer(('127.0.0.1', 0), make_handler(worker))
+    server.RequestHandlerClass.log_message = lambda *args: None
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield f'http://127.0.0.1:{server.server_address[1]}'
+    server.shutdown()
+    server.server_close()
+
+
+def request(url, body=None, raw=None):
+    data = raw if raw is not None else None if body is None else json.dumps(body).encode('utf-8')
+    try:
+        with urllib.request.urlopen(urllib.request.Request(url, data=data, method='POST' if data else 'GET'),
+                                    timeout=10) as response:
+            return response.status, json.loads(response.read())
+    except urllib.error.HTTPError as e:
+        return e.code, json.loads(e.read())
+
+
+@pytest.mark.parametrize('body', [
+    [], 'x', 3,
+    {'locations': 'Mumbai'},
+    {'locations': [1]},
+    {'priority': None},
+    {'priority': '1'},
+    {'timeout': 'soon', 'wait': True},
+    {'wait': 'yes'},
+    {'years': 0},
+    {'years': '2'},
+    {'years': True},
+    {'tile_size': -0.1},
+    {'tile_size': 'big'},
+    {'start_month': '2023-01'},
+    {'start_month': [2023, 13]},
+    {'end_month': [2023]},
+    {'start_month': [2023, 6], 'end_month': [2023, 1]},
+    {'batched': 'false'},
+    {'incremental': 1},
+])
+def test_invalid_bodies_are_rejected(body):
+    with pytest.raises(ValueError):
+        parse_job_request(body, ['Mumbai'])
+
+
+def test_valid_body_is_normalized():
+    locations, priority, options, wait, timeout = parse_job_request({
+        'locations': ['Mumbai'], 'priority': 3, 'years': 2, 'tile_size': 0.05,
+        'start_month': [2022, 1], 'end_month': (2023, 12), 'incremental': False, 'wait': True,
+        'timeout': 30, 'unknown': 'ignored'
+    }, ['Chennai'])
+    assert locations == ['Mumbai'] and priority == 3 and wait and timeout == 30
+    assert options == {'incremental': False, 'tile_size': 0.05, 'years': 2,
+                       'start_month': [2022, 1], 'end_month': [2023, 12]}
+    assert parse_job_request({}, ['Chennai']) == (['Chennai'], 0, {}, False, None)
+
+
+@pytest.mark.parametrize('raw', [b'[]', b'"x"', b'{"priority": null}', b'{"wait": true, "timeout": "x"}',
+                                 b'not json', b'{"locations": ["Atlantis"]}'])
+def test_bad_requests_get_400(server, worker, raw):
+    status, payload = request(f'{server}/jobs', raw=raw)
+    assert status == 400
+    assert payload['error']
+    assert worker.analyst.runs == []
+
+
+def test_job_runs_with_validated_options(server, worker):
+    status, payload = request(f'{server}/jobs', {'locations': ['Mumbai'], 'years': 2, 'wait': True,
+                                                 'timeout': 10})
+    assert status == 200
+    assert payload['status'] == 'completed'
+    assert payload['results']['Mumbai']['threat_level'] == 'LOW'
+    assert worker.analyst.runs == [('Mumbai', {'years': 2})]
+
+
+def test_job_events_are_filtered_by_seq(server, worker):
+    # Published outside any job, so never part of a job's events
+    publish('unrelated', 'Mumbai')
+    status, job = request(f'{server}/jobs', {'locations': ['Mumbai', 'Chennai'], 'wait': True, 'timeout': 10})
+    assert status == 200 and job['status'] == 'completed'
+
+    status, payload = request(f"{server}/jobs/{job['job_id']}/events")
+    assert status == 200 and payload['status'] == 'completed'
+    events = payload['events']
+    assert len(events) == 8
+    assert [event['seq'] for event in events] == sorted(event['seq'] for event in events)
+    assert payload['last_seq'] == events[-1]['seq']
+    location_jobs = {location: entry['job_id'] for location, entry in job['location_jobs'].items()}
+    assert all(event['job_id'] == location_jobs[event['location']] for event in events)
+    assert all(event['attempt'] == 1 for event in events)
+    assert [event.get('month') for event in events if event['location'] == 'Mumbai'] == [
+        '2023-01', '2023-02', '2023-03', None]
+    assert job['location_jobs']['Mumbai']['stage'] == 'analysis_complete'
+
+    after = events[2]['seq']
+    status, payload = request(f"{server}/jobs/{job['job_id']}/events?after={after}")
+    assert payload['events'] == events[3:]
+
+    status, payload = request(f"{server}/jobs/{job['job_id']}/events?after={events[-1]['seq']}")
+    assert payload['events'] == [] and payload['last_seq'] == events[-1]['seq']
+
+    assert request(f"{server}/jobs/{job['job_id']}/events?after=x")[0] == 400
+    assert request(f'{server}/jobs/unknown/events')[0] == 404
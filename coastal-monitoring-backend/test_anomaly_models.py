@@ -0,0 +1,161 @@
+# test_anomaly_models.py
+import os
+import pickle
+import time
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from anomaly_models import AnomalyModel, AnomalyModelStore, MongoAnomalyModelStore, RetrainPolicy
+
+FEATURES = ['NDWI', 'NDCI']
+
+
+def monthly_history(months=24, seed=0, shift=0.0):
+    rng = np.random.default_rng(seed)
+    rows = []
+    for step in range(months):
+        year, month = 2022 + step // 12, step % 12 + 1
+        rows.append({'year': year, 'month': month, 'date': f'{year}-{month:02d}',
+                     'NDWI': 0.3 + rng.normal(0, 0.05) + shift, 'NDCI': -0.1 + rng.normal(0, 0.02)})
+    return pd.DataFrame(rows)
+
+
+def append_months(df, rows):
+    return pd.concat([df, pd.DataFrame(rows)], ignore_index=True)
+
+
+@pytest.fixture
+def model():
+    return AnomalyModel.fit(monthly_history(), FEATURES)
+
+
+def test_new_months_do_not_change_old_scores(model):
+    history = monthly_history()
+    scores, flags = model.score(history)
+
+    extended = append_months(history, [{'year': 2024, 'month': 1, 'date': '2024-01', 'NDWI': 5.0, 'NDCI': 1.0}])
+    new_scores, new_flags = model.score(extended)
+    assert np.array_equal(new_scores[:len(history)], scores)
+    assert np.array_equal(new_flags[:len(history)], flags)
+    assert new_flags[-1]
+
+
+def test_pipeline_reuses_the_stored_model_for_new_months(analyst):
+    location = analyst.registry.names[0]
+    history = monthly_history()
+    first, model = analyst.score_environmental_anomalies(history.copy(), location)
+    assert model.version == 1
+
+    extended = append_months(history, [{'year': 2024, 'month': 1, 'date': '2024-01', 'NDWI': 0.31, 'NDCI': -0.1}])
+    second, reused = analyst.score_environmental_anomalies(extended, location)
+    assert reused.version == 1
+    assert np.array_equal(second['anomaly_score'].to_numpy()[:len(history)], first['anomaly_score'].to_numpy())
+    assert np.array_equal(second['is_anomaly'].to_numpy()[:len(history)], first['is_anomaly'].to_numpy())
+    assert analyst.anomaly_models.versions(location) == [1]
+
+
+def test_drift_is_measured_in_training_standard_deviations(model):
+    history = monthly_history()
+    assert model.drift(history) == 0.0
+    assert model.unseen_rows(history).empty
+
+    ndwi_mean, ndwi_sd = model.scaler.mean_[0], model.scaler.scale_[0]
+    shifted = append_months(history, [
+        {'year': 2024, 'month': month, 'date': f'2024-{month:02d}', 'NDWI': ndwi_mean + 3 * ndwi_sd,
+         'NDCI': model.scaler.mean_[1]}
+        for month in (1, 2)
+    ])
+    assert model.drift(shifted) == pytest.approx(3.0)
+    assert len(model.unseen_rows(shifted)) == 2
+
+
+def test_retrain_reasons(model):
+    policy = RetrainPolicy(max_age_days=90, drift_threshold=1.5, min_drift_rows=3)
+    history = monthly_history()
+
+    assert policy.reason(None, history, FEATURES, 0.1, 42) == 'no model'
+    assert policy.reason(model, history, ['NDWI'], 0.1, 42) == 'features changed'
+    assert policy.reason(model, history, FEATURES, 0.2, 42) == 'settings changed'
+    assert policy.reason(model, history, FEATURES, 0.1, 7) == 'settings changed'
+    assert policy.reason(model, history, FEATURES, 0.1, 42) is None
+
+    drifted = append_months(history, monthly_history(3, seed=1, shift=1.0).assign(
+        year=2024, date=[f'2024-{month:02d}' for month in (1, 2, 3)]))
+    assert policy.reason(model, drifted, FEATURES, 0.1, 42).startswith('drift ')
+    # Too few unseen months to judge drift
+    assert policy.reason(model, drifted.iloc[:-1], FEATURES, 0.1, 42) is None
+
+    model.trained_at = time.time() - 91 * 86400
+    assert policy.reason(model, history, FEATURES, 0.1, 42) == 'scheduled'
+    assert RetrainPolicy(max_age_days=0).reason(model, history, FEATURES, 0.1, 42) is None
+
+
+def test_store_versions_and_prunes(tmp_path, model):
+    store = AnomalyModelStore(path=str(tmp_path), keep_versions=2)
+    assert store.latest('Gulf of Mannar') is None
+
+    for expected in (1, 2, 3):
+        assert store.save('Gulf of Mannar', model) == expected
+    assert store.versions('Gulf of Mannar') == [2, 3]
+    assert sorted(os.listdir(tmp_path / 'Gulf_of_Mannar')) == ['v0002.pkl', 'v0003.pkl']
+
+    reloaded = AnomalyModelStore(path=str(tmp_path)).latest('Gulf of Mannar')
+    assert reloaded.version == 3
+    history = monthly_history()
+    assert np.array_equal(reloaded.score(history)[0], model.score(history)[0])
+
+
+def test_store_write_is_atomic(tmp_path, model, monkeypatch):
+    store = AnomalyModelStore(path=str(tmp_path))
+    store.save('Goa', model)
+
+    def interrupted(source, target):
+        raise OSError('disk full')
+    monkeypatch.setattr(os, 'replace', interrupted)
+    with pytest.raises(OSError):
+        store.save('Goa', model)
+    monkeypatch.undo()
+
+    # The half-written version is invisible and the last complete one still loads
+    assert store.versions('Goa') == [1]
+    assert AnomalyModelStore(path=str(tmp_path)).latest('Goa').version == 1
+
+
+@pytest.fixture
+def collection():
+    mongomock = pytest.importorskip('mongomock')
+    return mongomock.MongoClient().coastal.anomaly_models
+
+
+def test_mongo_store_round_trip_and_pruning(collection, model):
+    store = MongoAnomalyModelStore(collection, keep_versions=2, signing_key='secret')
+    for expected in (1, 2, 3):
+        assert store.save('Goa', model) == expected
+    assert sorted(doc['version'] for doc in collection.find({'location': 'Goa'})) == [2, 3]
+    assert MongoAnomalyModelStore(collection, signing_key='secret').latest('Goa').version == 3
+
+
+def test_mongo_store_refuses_unsigned_or_tampered_models(collection, model):
+    store = MongoAnomalyModelStore(collection, signing_key='secret')
+    store.save('Goa', model)
+
+    assert MongoAnomalyModelStore(collection, signing_key='other key').latest('Goa') is None
+
+    class Payload:
+        def __reduce__(self):
+            return (os.system, ('echo should never run',))
+    collection.insert_one({'location': 'Goa', 'version': 2, 'model': pickle.dumps(Payload()),
+                           'signature': 'forged'})
+    assert MongoAnomalyModelStore(collection, signing_key='secret').latest('Goa') is None
+    collection.update_one({'version': 2}, {'$unset': {'signature': ''}})
+    assert MongoAnomalyModelStore(collection, signing_key='secret').latest('Goa') is None
+
+
+def test_mongo_store_requires_a_signing_key(collection, monkeypatch):
+    monkeypatch.delenv('ANOMALY_MODEL_SIGNING_KEY', raising=False)
+    with pytest.raises(ValueError):
+        MongoAnomalyModelStore(collection)
+    monkeypatch.setenv('ANOMALY_MODEL_SIGNING_KEY', 'from-env')
+    assert MongoAnomalyModelStore(collection).signing_key == b'from-env'
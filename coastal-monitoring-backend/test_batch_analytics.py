@@ -0,0 +1,87 @@
+# test_batch_analytics.py
+import numpy as np
+import pandas as pd
+import pytest
+from sklearn.linear_model import LinearRegression
+
+from batch_analytics import add_time_index, analyze_groups, batch_anomalies, batch_trends, trends_to_dict
+
+
+def monthly_frame(locations, months=24, seed=0):
+    rng = np.random.default_rng(seed)
+    rows = []
+    for i, location in enumerate(locations):
+        for step in range(months):
+            year, month = 2022 + step // 12, step % 12 + 1
+            rows.append({
+                'location': location,
+                'year': year,
+                'month': month,
+                'date': f'{year}-{month:02d}',
+                'NDWI': 0.2 + 0.01 * i * step + rng.normal(0, 0.02),
+                'NDCI': -0.1 - 0.005 * step + rng.normal(0, 0.01)
+            })
+    return pd.DataFrame(rows)
+
+
+def test_trends_match_linear_regression():
+    df = monthly_frame(['Mumbai', 'Chennai', 'Kochi'])
+    df.loc[df.sample(frac=0.1, random_state=1).index, 'NDCI'] = np.nan
+    table = batch_trends(df)
+
+    for location, group in df.groupby('location'):
+        for feature in ('NDWI', 'NDCI'):
+            clean = group.dropna(subset=[feature])
+            model = LinearRegression().fit(add_time_index(clean).to_numpy().reshape(-1, 1), clean[feature])
+            row = table[(table['location'] == location) & (table['feature'] == feature)].iloc[0]
+            assert row['n_points'] == len(clean)
+            assert row['trend'] == pytest.approx(model.coef_[0], rel=1e-9, abs=1e-12)
+            assert row['intercept'] == pytest.approx(model.intercept_, rel=1e-9)
+            assert row['annual_change'] == pytest.approx(model.coef_[0] * 12, rel=1e-9, abs=1e-12)
+
+
+def test_groups_with_two_points_are_dropped():
+    df = pd.concat([monthly_frame(['Mumbai']), monthly_frame(['Goa'], months=2)], ignore_index=True)
+    table = batch_trends(df)
+    assert set(table['location']) == {'Mumbai'}
+
+
+def test_empty_and_missing_features():
+    assert batch_trends(pd.DataFrame()).empty
+    table = batch_trends(monthly_frame(['Mumbai']).drop(columns='NDCI'))
+    assert list(table['feature']) == ['NDWI']
+
+
+def test_trends_to_dict():
+    table = batch_trends(monthly_frame(['Mumbai', 'Chennai']))
+    trends = trends_to_dict(table, 'Chennai')
+    assert set(trends) == {'NDWI_trend', 'NDWI_annual_change', 'NDCI_trend', 'NDCI_annual_change'}
+    assert trends['NDWI_annual_change'] == pytest.approx(trends['NDWI_trend'] * 12)
+
+
+def test_anomalies_flag_outliers_per_group():
+    df = monthly_frame(['Mumbai', 'Chennai'])
+    outlier = df.index[(df['location'] == 'Chennai') & (df['date'] == '2023-06')][0]
+    df.loc[outlier, 'NDWI'] = 5.0
+    scored = batch_anomalies(df, contamination=0.05)
+
+    chennai = scored[scored['location'] == 'Chennai']
+    assert chennai['anomaly_score'].idxmin() == outlier
+    assert scored.loc[outlier, 'is_anomaly']
+    assert scored.groupby('location')['is_anomaly'].sum().max() <= 2
+
+
+def test_small_groups_are_not_scored():
+    scored = batch_anomalies(monthly_frame(['Goa'], months=4))
+    assert (scored['anomaly_score'] == 0).all()
+    assert not scored['is_anomaly'].any()
+
+
+def test_analyze_groups_summary():
+    df = monthly_frame(['Mumbai', 'Chennai'])
+    scored, summary = analyze_groups(df)
+    assert len(scored) == len(df)
+    assert list(summary['location']) == ['Chennai', 'Mumbai']
+    assert (summary['data_points'] == 24).all()
+    assert (summary['last_date'] == '2023-12').all()
+    assert {'NDWI_trend', 'NDCI_annual_change'} <= set(summary.columns)
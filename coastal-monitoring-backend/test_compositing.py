@@ -0,0 +1,93 @@
+# test_compositing.py
+import warnings
+
+import numpy as np
+import pytest
+
+from compositing import StreamingCompositor, block_size_for_budget
+from data_sources import LocalRasterDataSource, compute_indices, cloud_mask, write_scene
+
+SHAPE = (45, 70)
+INDICES = ['NDWI', 'NDCI']
+
+
+@pytest.fixture
+def scenes(tmp_path):
+    """Six noisy scenes with random cloud cover; returns (scene_bands, scene arrays)"""
+    rng = np.random.default_rng(7)
+    arrays = []
+    for day in range(6):
+        bands = {band: rng.integers(100, 4000, SHAPE, dtype=np.uint16) for band in ('B3', 'B4', 'B5', 'B8')}
+        bands['SCL'] = rng.choice(np.array([4, 6, 8, 9], dtype=np.uint8), SHAPE, p=[0.4, 0.3, 0.2, 0.1])
+        # A strip every scene has clouded over
+        bands['SCL'][:3, :5] = 9
+        write_scene(str(tmp_path), 'Goa', f'2023-03-{day + 1:02d}', bands)
+        arrays.append(bands)
+    source = LocalRasterDataSource(root=str(tmp_path), index_names=INDICES)
+    scene_bands, shape, _ = source.scene_stack(source.list_scenes('Goa', '2023-03-01', '2023-04-01'))
+    source.compositor.shutdown()
+    assert shape == SHAPE and len(scene_bands) == 6
+    return scene_bands, arrays
+
+
+def full_stack_median(arrays, index_name):
+    """np.nanmedian over the whole stack, the result block-wise compositing must reproduce"""
+    stack = np.stack([
+        compute_indices({band: values for band, values in bands.items() if band != 'SCL'}, [index_name],
+                        cloud_mask(bands['SCL']))[index_name]
+        for bands in arrays
+    ])
+    with warnings.catch_warnings():
+        warnings.simplefilter('ignore', RuntimeWarning)
+        return np.nanmedian(stack, axis=0)
+
+
+@pytest.mark.parametrize('max_workers,block_size', [(1, 16), (1, None), (2, 16)])
+def test_composite_matches_the_full_stack_median(scenes, max_workers, block_size):
+    scene_bands, arrays = scenes
+    compositor = StreamingCompositor(max_workers=max_workers, block_size=block_size)
+    try:
+        means = compositor.composite(scene_bands, (0, SHAPE[0], 0, SHAPE[1]), INDICES)
+    finally:
+        compositor.shutdown()
+    for name in INDICES:
+        assert means[name] == pytest.approx(float(np.nanmean(full_stack_median(arrays, name))), rel=1e-5)
+
+
+@pytest.mark.parametrize('max_workers,step', [(1, 1), (1, 3), (2, 4)])
+def test_composite_raster_matches_the_full_stack_median(scenes, max_workers, step):
+    scene_bands, arrays = scenes
+    compositor = StreamingCompositor(max_workers=max_workers, block_size=16)
+    window = (2, 41, 3, 67)
+    try:
+        raster = compositor.composite_raster(scene_bands, window, 'NDWI', step)
+    finally:
+        compositor.shutdown()
+
+    expected = full_stack_median(arrays, 'NDWI')[window[0]:window[1]:step, window[2]:window[3]:step]
+    assert raster.shape == expected.shape
+    np.testing.assert_array_equal(raster, expected.astype(np.float32))
+    # Pixels clouded in every scene stay NaN
+    assert np.isnan(raster[0, 0])
+
+
+def test_block_size_follows_the_budget():
+    # 3 indices over 10 scenes: 4 * (2 * 30 + 2 * 5) = 280 bytes per pixel
+    assert block_size_for_budget(10, 3, 5, 280 * 100 * 100) == 100
+    assert block_size_for_budget(10, 3, 5, 1) == 64
+    assert block_size_for_budget(10, 3, 5, 1 << 40) == 4096
+
+
+def test_blocks_cover_the_window_once():
+    compositor = StreamingCompositor(max_workers=1, block_size=16)
+    window = (5, 50, 7, 40)
+    covered = np.zeros((60, 60), dtype=int)
+    for row_start, row_stop, col_start, col_stop in compositor.plan_blocks(window, 6, INDICES):
+        covered[row_start:row_stop, col_start:col_stop] += 1
+    assert covered[5:50, 7:40].min() == 1 and covered.max() == 1
+    assert covered.sum() == 45 * 33
+
+    # The memory budget is shared between the workers
+    single = StreamingCompositor(memory_budget_mb=64, max_workers=1).plan_blocks((0, 4096, 0, 4096), 20, INDICES)
+    pooled = StreamingCompositor(memory_budget_mb=64, max_workers=4).plan_blocks((0, 4096, 0, 4096), 20, INDICES)
+    assert len(pooled) > len(single)
@@ -0,0 +1,142 @@
+# test_data_sources.py
+import numpy as np
+import pytest
+
+from compositing import StreamingCompositor
+from data_sources import (EarthEngineDataSource, LocalRasterDataSource, SatelliteDataSource, window_bounds,
+                          window_for_bounds, write_scene)
+
+# 64 x 64 pixels of one unit each, so window edges are exact
+SCENE_BOUNDS = (0.0, 0.0, 64.0, 64.0)
+SHAPE = (64, 64)
+MARCH = [(2023, 3, '2023-03-01', '2023-04-01')]
+
+
+def water_bands(shape=SHAPE, left=(3000, 1000), right=(1000, 3000)):
+    """B3/B8 with NDWI 0.5 in the left half and -0.5 in the right half"""
+    b3 = np.empty(shape, dtype=np.uint16)
+    b8 = np.empty(shape, dtype=np.uint16)
+    half = shape[1] // 2
+    b3[:, :half], b8[:, :half] = left
+    b3[:, half:], b8[:, half:] = right
+    return {'B3': b3, 'B8': b8}
+
+
+@pytest.fixture
+def source(tmp_path):
+    source = LocalRasterDataSource(root=str(tmp_path), index_names=['NDWI'],
+                                   compositor=StreamingCompositor(max_workers=1, block_size=16))
+    yield source
+    source.compositor.shutdown()
+
+
+def test_window_for_bounds():
+    assert window_for_bounds(SHAPE, SCENE_BOUNDS, (8, 16, 24, 48)) == (16, 48, 8, 24)
+    assert window_for_bounds(SHAPE, None, (8, 16, 24, 48)) == (0, 64, 0, 64)
+    # Regions reaching past the scene are clipped to it
+    assert window_for_bounds(SHAPE, SCENE_BOUNDS, (-10, -10, 10.5, 100)) == (0, 64, 0, 11)
+    # A region outside the scene gives an empty window
+    row_start, row_stop, col_start, col_stop = window_for_bounds(SHAPE, SCENE_BOUNDS, (100, 0, 120, 10))
+    assert row_stop > row_start and col_stop == col_start
+
+
+def test_window_bounds_round_trip_and_step():
+    window = window_for_bounds(SHAPE, SCENE_BOUNDS, (8, 16, 24, 48))
+    assert window_bounds(SHAPE, SCENE_BOUNDS, window) == (8, 16, 24, 48)
+    # A step of 5 covers 35 x 20 pixels: the last sample's pixel reaches past the window
+    assert window_bounds(SHAPE, SCENE_BOUNDS, window, step=5) == (8, 13, 28, 48)
+
+
+def test_base_class_is_abstract():
+    with pytest.raises(TypeError):
+        SatelliteDataSource()
+
+    class Partial(SatelliteDataSource):
+        pass
+    with pytest.raises(TypeError):
+        Partial()
+
+    class MonthsOnly(SatelliteDataSource):
+        def fetch_months(self, location, windows, batched=False, failures=None):
+            return {}
+    assert MonthsOnly().fetch_index_rasters('Goa', MARCH) is None
+    assert issubclass(EarthEngineDataSource, SatelliteDataSource)
+
+
+def test_region_mean_of_the_monthly_median(source, tmp_path):
+    write_scene(str(tmp_path), 'Goa Coast', '2023-03-05', water_bands(), SCENE_BOUNDS)
+    assert source.fetch_months('Goa Coast', MARCH) == {'2023-03-01': {'NDWI': pytest.approx(0.0)}}
+
+    # Only the left half of the scene
+    source.region_bounds = {'Goa Coast': (0, 0, 32, 64)}
+    assert source.fetch_months('Goa Coast', MARCH)['2023-03-01']['NDWI'] == pytest.approx(0.5)
+
+
+def test_scl_cloud_and_shadow_pixels_are_masked(source, tmp_path):
+    bands = water_bands()
+    scl = np.full(SHAPE, 6, dtype=np.uint8)
+    scl[:, 32:48] = 9
+    scl[:, 48:] = 3
+    bands['SCL'] = scl
+    write_scene(str(tmp_path), 'Goa', '2023-03-05', bands, SCENE_BOUNDS)
+    assert source.fetch_months('Goa', MARCH)['2023-03-01']['NDWI'] == pytest.approx(0.5)
+
+
+def test_cloudy_scenes_are_skipped(source, tmp_path):
+    write_scene(str(tmp_path), 'Goa', '2023-03-05', water_bands(), SCENE_BOUNDS, cloudy_pixel_percentage=10)
+    write_scene(str(tmp_path), 'Goa', '2023-03-10', water_bands(), SCENE_BOUNDS, cloudy_pixel_percentage=30)
+    write_scene(str(tmp_path), 'Goa', '2023-04-02', water_bands(), SCENE_BOUNDS)
+    scenes = source.list_scenes('Goa', '2023-03-01', '2023-04-01')
+    assert [scene['date'] for scene in scenes] == ['2023-03-05']
+
+    source.cloud_threshold = 5
+    assert source.fetch_months('Goa', MARCH) == {'2023-03-01': {}}
+
+
+def test_scenes_on_another_grid_are_skipped(source, tmp_path):
+    write_scene(str(tmp_path), 'Goa', '2023-03-05', water_bands(), SCENE_BOUNDS)
+    # Would pull the median to 0.5 everywhere if it were used
+    write_scene(str(tmp_path), 'Goa', '2023-03-10', water_bands((32, 32), right=(3000, 1000)), scene_id='a')
+    write_scene(str(tmp_path), 'Goa', '2023-03-12', water_bands(right=(3000, 1000)), SCENE_BOUNDS, scene_id='b')
+    missing_band = write_scene(str(tmp_path), 'Goa', '2023-03-15', {'B3': water_bands()['B3']}, SCENE_BOUNDS)
+
+    scenes = source.list_scenes('Goa', '2023-03-01', '2023-04-01')
+    assert len(scenes) == 4
+    scene_bands, shape, bounds = source.scene_stack(scenes)
+    assert shape == SHAPE and bounds == list(SCENE_BOUNDS)
+    assert [paths['B3'].split('/')[-2] for paths in scene_bands] == ['2023-03-05', '2023-03-12_b']
+    assert all(missing_band not in paths['B3'] for paths in scene_bands)
+
+    # Median of two scenes: 0.5 on the left, (0.5 - 0.5) / 2 on the right
+    assert source.fetch_months('Goa', MARCH)['2023-03-01']['NDWI'] == pytest.approx(0.25)
+
+
+def test_only_the_configured_bands_are_needed(tmp_path):
+    source = LocalRasterDataSource(root=str(tmp_path), index_names=['NDWI'],
+                                   compositor=StreamingCompositor(max_workers=1))
+    assert source.bands == ['B3', 'B8']
+    write_scene(str(tmp_path), 'Goa', '2023-03-05', water_bands(), SCENE_BOUNDS)
+    assert set(source.scene_band_paths(source.list_scenes('Goa', '2023-03-01', '2023-04-01')[0])) == {'B3', 'B8'}
+
+    # NDCI reads B4 and B5, which these scenes do not have
+    failures = {}
+    assert LocalRasterDataSource(root=str(tmp_path), index_names=['NDCI'], compositor=source.compositor) \
+        .fetch_months('Goa', MARCH, failures=failures) == {'2023-03-01': {}}
+    assert failures == {}
+
+
+def test_months_without_scenes_are_empty(source):
+    assert source.fetch_months('Nowhere', MARCH) == {'2023-03-01': {}}
+
+
+def test_index_rasters_are_subsampled_under_max_pixels(source, tmp_path):
+    write_scene(str(tmp_path), 'Goa', '2023-03-05', water_bands(), SCENE_BOUNDS)
+    write_scene(str(tmp_path), 'Goa', '2023-04-05', water_bands(), SCENE_BOUNDS)
+    windows = MARCH + [(2023, 4, '2023-04-01', '2023-05-01'), (2023, 5, '2023-05-01', '2023-06-01')]
+
+    result = source.fetch_index_rasters('Goa', windows, 'NDWI', max_pixels=256)
+    assert sorted(result['rasters']) == ['2023-03-01', '2023-04-01']
+    raster = result['rasters']['2023-03-01']
+    assert raster.shape == (16, 16) and raster.dtype == np.float32
+    assert np.all(raster[:, :8] == np.float32(0.5)) and np.all(raster[:, 8:] == np.float32(-0.5))
+    assert result['bounds'] == SCENE_BOUNDS
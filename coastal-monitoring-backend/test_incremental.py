@@ -0,0 +1,120 @@
+# test_incremental.py
+from datetime import datetime
+
+import pandas as pd
+import pytest
+
+import coastal_ai_analyst_fixed_1
+from conftest import FakeMonthSource
+
+
+class July2024(datetime):
+    @classmethod
+    def now(cls, tz=None):
+        return cls(2024, 7, 15, 12, 0)
+
+
+def month_rows(location, months):
+    return [{'location': location, 'year': year, 'month': month, 'date': f'{year}-{month:02d}',
+             'NDWI': 0.1, 'NDCI': -0.01} for year, month in months]
+
+
+def month_range(first, last):
+    months = []
+    year, month = first
+    while (year, month) <= last:
+        months.append((year, month))
+        year, month = (year, month + 1) if month < 12 else (year + 1, 1)
+    return months
+
+
+@pytest.fixture
+def incremental(analyst, monkeypatch):
+    """Analyst on mongomock with the clock at mid-July 2024; the last closed month is June"""
+    mongomock = pytest.importorskip('mongomock')
+    monkeypatch.setattr(coastal_ai_analyst_fixed_1, 'datetime', July2024)
+    db = mongomock.MongoClient().coastal
+    analyst._client = db.client
+    analyst.collection = db.ai_analysis
+    analyst.summary_collection = db.analysis_summary
+    return analyst
+
+
+def store_report(analyst, location, last_month, months):
+    analyst.collection.insert_one({'location': location, 'last_processed_month': last_month,
+                                   'timestamp': datetime(2024, 4, 2).isoformat(),
+                                   'time_series': month_rows(location, months)})
+    analyst.summary_collection.insert_one({'_id': location})
+
+
+def test_first_run_fetches_the_whole_window(incremental):
+    location = incremental.registry.names[0]
+    incremental.data_source = source = FakeMonthSource()
+
+    df, new_rows = incremental.extract_new_months(location, batched=False)
+    assert new_rows == 12
+    assert source.calls == [[f'{year}-{month:02d}-01' for year, month in month_range((2023, 7), (2024, 6))]]
+    assert df['date'].tolist()[0] == '2023-07' and df['date'].tolist()[-1] == '2024-06'
+
+
+def test_only_months_after_the_last_processed_one_are_fetched(incremental):
+    location = incremental.registry.names[0]
+    store_report(incremental, location, '2024-03', month_range((2023, 1), (2024, 3)))
+    incremental.data_source = source = FakeMonthSource()
+
+    df, new_rows = incremental.extract_new_months(location)
+    assert new_rows == 3
+    assert source.calls == [['2024-04-01', '2024-05-01', '2024-06-01']]
+    # The carried series is trimmed to one window, July 2023 through June 2024
+    assert df['date'].tolist() == [f'{year}-{month:02d}' for year, month in month_range((2023, 7), (2024, 6))]
+
+
+def test_months_without_imagery_are_not_asked_for_again(incremental):
+    location = incremental.registry.names[0]
+    store_report(incremental, location, '2024-03', month_range((2023, 7), (2024, 3)))
+    incremental.data_source = source = FakeMonthSource(stats={date: {} for date in
+                                                              ('2024-04-01', '2024-05-01', '2024-06-01')})
+
+    df, new_rows = incremental.extract_new_months(location)
+    assert new_rows == 0 and len(df) == 9
+    assert incremental.get_last_checked_month(location) == '2024-06'
+
+    df, new_rows = incremental.extract_new_months(location)
+    assert new_rows == 0 and len(df) == 9
+    assert len(source.calls) == 1
+
+
+def test_checked_month_stops_at_the_first_failed_month(incremental):
+    location = incremental.registry.names[0]
+    store_report(incremental, location, '2024-03', month_range((2023, 7), (2024, 3)))
+    incremental.data_source = FakeMonthSource(stats={'2024-04-01': {}, '2024-06-01': {}},
+                                              failing={'2024-05-01'})
+    incremental.extract_new_months(location)
+    assert incremental.get_last_checked_month(location) == '2024-04'
+
+    # May and June are looked at again; June's empty answer is cached, so only May is fetched
+    incremental.data_source = source = FakeMonthSource()
+    df, new_rows = incremental.extract_new_months(location)
+    assert source.calls == [['2024-05-01']]
+    assert new_rows == 1 and df['date'].tolist()[-1] == '2024-05'
+
+
+def test_checked_month_only_moves_forward(incremental):
+    location = incremental.registry.names[0]
+    incremental.summary_collection.insert_one({'_id': location})
+    incremental.record_checked_month(location, '2024-05')
+    incremental.record_checked_month(location, '2024-02')
+    assert incremental.get_last_checked_month(location) == '2024-05'
+    # No summary is created for a location without a stored report
+    incremental.record_checked_month('Elsewhere', '2024-05')
+    assert incremental.get_last_checked_month('Elsewhere') is None
+
+
+def test_trim_to_window():
+    df = pd.DataFrame(month_rows('Goa', month_range((2022, 11), (2024, 2))))
+    trimmed = coastal_ai_analyst_fixed_1.CoastalAIAnalyst.trim_to_window(df, (2023, 3))
+    assert trimmed['date'].tolist()[0] == '2023-03' and len(trimmed) == 12
+    assert trimmed.index.tolist() == list(range(12))
+
+    empty = pd.DataFrame()
+    assert coastal_ai_analyst_fixed_1.CoastalAIAnalyst.trim_to_window(empty, (2023, 3)) is empty
@@ -0,0 +1,106 @@
+# test_instrumentation.py
+import json
+import threading
+
+import pytest
+
+import instrumentation
+
+
+class FakeEEObject:
+    def __init__(self, value):
+        self.value = value
+        self.calls = 0
+
+    def getInfo(self):
+        self.calls += 1
+        return self.value
+
+
+@pytest.fixture(autouse=True)
+def metrics_path(tmp_path, monkeypatch):
+    path = tmp_path / 'runs.jsonl'
+    monkeypatch.setenv('PIPELINE_METRICS_PATH', str(path))
+    return path
+
+
+def test_ee_calls_are_counted_per_run_and_type(metrics_path):
+    with instrumentation.pipeline_run('Mumbai') as run:
+        assert instrumentation.ee_get_info(FakeEEObject(3), 'size') == 3
+        instrumentation.ee_get_info(FakeEEObject({}), 'stats')
+        instrumentation.ee_get_info(FakeEEObject({}), 'stats')
+        summary = run.summary()
+
+    assert summary['ee_calls'] == 3
+    assert summary['ee_calls_by_type'] == {'size': 1, 'stats': 2}
+    assert summary['calls']['ee.stats']['count'] == 2
+
+    record = json.loads(metrics_path.read_text().splitlines()[-1])
+    assert record['location'] == 'Mumbai'
+    assert record['status'] == 'completed'
+    assert record['ee_calls'] == 3
+
+
+def test_failed_run_is_recorded(metrics_path):
+    with pytest.raises(RuntimeError):
+        with instrumentation.pipeline_run('Chennai'):
+            raise RuntimeError('boom')
+    assert json.loads(metrics_path.read_text())['status'] == 'failed'
+    assert instrumentation.current_run() is None
+
+
+def test_memoize_is_scoped_to_the_run():
+    computed = []
+
+    def compute():
+        computed.append(1)
+        return len(computed)
+
+    with instrumentation.pipeline_run('Mumbai'):
+        assert instrumentation.memoize('centre', compute) == 1
+        assert instrumentation.memoize('centre', compute) == 1
+    with instrumentation.pipeline_run('Mumbai'):
+        assert instrumentation.memoize('centre', compute) == 2
+    # Outside a run nothing is cached
+    assert instrumentation.memoize('centre', compute) == 3
+    assert instrumentation.memoize('centre', compute) == 4
+
+
+def test_nested_runs_restore_the_outer_run():
+    with instrumentation.pipeline_run('outer') as outer:
+        with instrumentation.pipeline_run('inner') as inner:
+            instrumentation.count('ee_calls')
+        instrumentation.count('ee_calls', 2)
+    assert inner.summary()['ee_calls'] == 1
+    assert outer.summary()['ee_calls'] == 2
+
+
+def test_worker_threads_attach_to_the_run():
+    with instrumentation.pipeline_run('Mumbai') as run:
+        def work():
+            with instrumentation.attached_run(run):
+                instrumentation.ee_get_info(FakeEEObject(1), 'stats')
+            instrumentation.count('ee_calls')
+
+        threads = [threading.Thread(target=work) for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        summary = run.summary()
+
+    assert summary['ee_calls'] == 4
+    assert summary['ee_calls_by_type'] == {'stats': 4}
+
+
+def test_totals_include_work_outside_runs():
+    before = instrumentation.snapshot()['counters'].get('test.background', 0)
+    instrumentation.count('test.background')
+    assert instrumentation.snapshot()['counters']['test.background'] == before + 1
+
+
+def test_metrics_can_be_disabled(monkeypatch, metrics_path):
+    monkeypatch.setenv('PIPELINE_METRICS_PATH', 'off')
+    with instrumentation.pipeline_run('Mumbai'):
+        pass
+    assert not metrics_path.exists()
@@ -0,0 +1,138 @@
+# test_job_scheduler.py
+import threading
+
+import pytest
+
+from job_scheduler import JobScheduler, SQLiteJobBroker, make_dedup_key
+
+
+@pytest.fixture
+def broker(tmp_path):
+    return SQLiteJobBroker(path=str(tmp_path / 'jobs.sqlite'), max_attempts=2,
+                           base_retry_delay=0.0, max_retry_delay=0.0)
+
+
+def test_dedup_key_ignores_param_order():
+    assert make_dedup_key('Mumbai', {'a': 1, 'b': 2}) == make_dedup_key('Mumbai', {'b': 2, 'a': 1})
+    assert make_dedup_key('Mumbai', {'a': 1}) != make_dedup_key('Chennai', {'a': 1})
+    assert make_dedup_key('Mumbai', {'a': 1}) != make_dedup_key('Mumbai', {'a': 2})
+
+
+def test_identical_jobs_coalesce_while_active(broker):
+    job_id, coalesced = broker.enqueue('Mumbai', {'incremental': True})
+    assert not coalesced
+    assert broker.enqueue('Mumbai', {'incremental': True}) == (job_id, True)
+    assert broker.enqueue('Mumbai', {'incremental': False})[1] is False
+
+    broker.claim()
+    assert broker.enqueue('Mumbai', {'incremental': True}) == (job_id, True)
+
+    broker.complete(job_id, {'ok': True})
+    new_id, coalesced = broker.enqueue('Mumbai', {'incremental': True})
+    assert not coalesced and new_id != job_id
+
+
+def test_coalescing_raises_priority(broker):
+    low, _ = broker.enqueue('Mumbai', priority=0)
+    other, _ = broker.enqueue('Chennai', priority=5)
+    broker.enqueue('Mumbai', priority=10)
+
+    assert broker.get(low)['priority'] == 10
+    assert broker.claim()['job_id'] == low
+    assert broker.claim()['job_id'] == other
+    assert broker.claim() is None
+
+
+def test_failures_retry_then_fail(broker):
+    job_id, _ = broker.enqueue('Mumbai')
+    broker.claim()
+    assert broker.fail(job_id, 'boom') is not None
+    assert broker.get(job_id)['status'] == 'queued'
+
+    job = broker.claim()
+    assert job['attempts'] == 2
+    assert broker.fail(job_id, 'boom again') is None
+    failed = broker.get(job_id)
+    assert failed['status'] == 'failed'
+    assert failed['error'] == 'boom again'
+
+
+def test_stale_running_jobs_are_requeued(broker):
+    job_id, _ = broker.enqueue('Mumbai')
+    broker.claim()
+    assert broker.requeue_stale() == 1
+    assert broker.counts() == {'queued': 1}
+    assert broker.claim()['job_id'] == job_id
+
+
+def test_scheduler_runs_coalesced_requests_once(broker):
+    calls = []
+    release = threading.Event()
+
+    def run_job(location, **params):
+        calls.append((location, params))
+        release.wait(5)
+        return {'location': location}
+
+    scheduler = JobScheduler(run_job, broker=broker, max_concurrent=1, poll_interval=0.05)
+    scheduler.start()
+    try:
+        first = scheduler.submit('Mumbai', {'months': 3})
+        second = scheduler.submit('Mumbai', {'months': 3})
+        release.set()
+        jobs = scheduler.wait([first, second], timeout=5)
+    finally:
+        scheduler.stop()
+
+    assert first == second
+    assert calls == [('Mumbai', {'months': 3})]
+    assert jobs[first]['status'] == 'completed'
+    assert jobs[first]['result'] == {'location': 'Mumbai'}
+
+
+def run_until_finished(broker, run_job, job_ids):
+    scheduler = JobScheduler(run_job, broker=broker, max_concurrent=1, poll_interval=0.05)
+    scheduler.start()
+    try:
+        return scheduler.wait(job_ids, timeout=5)
+    finally:
+        scheduler.stop()
+
+
+def test_permanent_errors_fail_without_retrying(broker):
+    broker.max_attempts = 3
+    calls = []
+
+    def run_job(location, **params):
+        calls.append(location)
+        raise ValueError(f"Unknown location: {location}")
+
+    job_id = broker.enqueue('Atlantis')[0]
+    job = run_until_finished(broker, run_job, [job_id])[job_id]
+    assert calls == ['Atlantis']
+    assert job['status'] == 'failed'
+    assert job['attempts'] == 1
+    assert job['error'] == 'Unknown location: Atlantis'
+
+
+def test_transient_errors_are_retried(broker):
+    calls = []
+
+    def run_job(location, **params):
+        calls.append(location)
+        if len(calls) == 1:
+            raise TimeoutError('Computation timed out')
+        return {'ok': True}
+
+    job_id = broker.enqueue('Mumbai')[0]
+    job = run_until_finished(broker, run_job, [job_id])[job_id]
+    assert calls == ['Mumbai', 'Mumbai']
+    assert job['status'] == 'completed'
+    assert job['attempts'] == 2
+
+
+def test_fail_without_retry_marks_failed(broker):
+    job_id, _ = broker.enqueue('Mumbai')
+    broker.claim()
+    assert broker.fail(job_id, 'bad parameters', retry=False) is None
+    assert broker.get(job_id)['status'] == 'failed'
@@ -0,0 +1,157 @@
+# test_llm_insights.py
+import time
+
+import pytest
+
+pytest.importorskip('groq')
+
+from llm_insights import AsyncInsightClient, CircuitBreaker, PromptCache  # noqa: E402
+from llm_stub_server import StubCompletionHandler, start_stub_server  # noqa: E402
+
+
+@pytest.fixture
+def stub():
+    servers = []
+
+    def start(**options):
+        server, base_url = start_stub_server(**options)
+        servers.append(server)
+        return server, base_url
+
+    yield start
+    for server in servers:
+        server.shutdown()
+        server.server_close()
+
+
+@pytest.fixture
+def cache(tmp_path):
+    return PromptCache(path=str(tmp_path / 'llm.sqlite'))
+
+
+def requests_made(since):
+    return StubCompletionHandler.request_count - since
+
+
+def test_slow_model_is_skipped_within_its_timeout(stub):
+    _, base_url = stub(delays={'slow-model': 2.0})
+    client = AsyncInsightClient('stub', ['slow-model', 'fast-model'], base_url=base_url, timeout_seconds=0.3)
+
+    start = time.perf_counter()
+    model, response = client.generate('Assess Mumbai')
+    assert model == 'fast-model'
+    assert response.startswith('Stub assessment from fast-model')
+    assert time.perf_counter() - start < 1.5
+    assert client.breaker.is_open('slow-model')
+
+
+def test_failing_model_opens_the_breaker_and_recovers(stub):
+    server, base_url = stub(fail_models=['flaky-model'])
+    breaker = CircuitBreaker(cooldown_seconds=0.3)
+    client = AsyncInsightClient('stub', ['flaky-model', 'backup-model'], base_url=base_url,
+                                timeout_seconds=5, breaker=breaker)
+
+    assert client.generate('first')[0] == 'backup-model'
+    assert breaker.is_open('flaky-model')
+
+    # While open, the failing model is not called at all
+    before = StubCompletionHandler.request_count
+    assert client.generate('second')[0] == 'backup-model'
+    assert requests_made(before) == 1
+
+    # After the cooldown one probe goes through and closes the circuit again
+    server.RequestHandlerClass.fail_models = set()
+    time.sleep(0.35)
+    assert client.generate('third')[0] == 'flaky-model'
+    assert not breaker.is_open('flaky-model')
+
+
+def test_every_model_failing_returns_none(stub):
+    _, base_url = stub(fail_models=['a', 'b'])
+    client = AsyncInsightClient('stub', ['a', 'b'], base_url=base_url, timeout_seconds=5)
+    assert client.generate('prompt') == (None, None)
+    assert AsyncInsightClient(None, ['a']).generate('prompt') == (None, None)
+
+
+def test_repeated_prompt_is_served_from_the_cache(stub, cache):
+    _, base_url = stub()
+    client = AsyncInsightClient('stub', ['model-a'], base_url=base_url, timeout_seconds=5, cache=cache)
+
+    before = StubCompletionHandler.request_count
+    first = client.generate('Assess Chennai')
+    assert client.generate('Assess Chennai') == first
+    assert requests_made(before) == 1
+    assert cache.stats() == {'hits': 1, 'misses': 1}
+
+    # Generation parameters are part of the key
+    other = AsyncInsightClient('stub', ['model-a'], base_url=base_url, timeout_seconds=5, cache=cache,
+                               temperature=0.1)
+    other.generate('Assess Chennai')
+    assert requests_made(before) == 2
+
+
+def test_identical_in_flight_prompts_share_one_request(stub):
+    _, base_url = stub(delay=0.3)
+    client = AsyncInsightClient('stub', ['model-a'], base_url=base_url, timeout_seconds=5)
+
+    before = StubCompletionHandler.request_count
+    results = client.generate_many(['same prompt', 'same prompt', 'other prompt'])
+    assert results[0] == results[1]
+    assert requests_made(before) == 2
+
+
+def test_generate_with_does_not_fall_back(stub):
+    _, base_url = stub(fail_models=['a'])
+    client = AsyncInsightClient('stub', ['a', 'b'], base_url=base_url, timeout_seconds=5)
+    assert client.generate_with('prompt', 'a') is None
+    assert client.generate_with('prompt', 'b').startswith('Stub assessment from b')
+
+
+def test_cache_entries_expire_after_the_ttl(tmp_path):
+    cache = PromptCache(path=str(tmp_path / 'llm.sqlite'), ttl_seconds=0.1)
+    key = PromptCache.make_key('prompt', temperature=0.7)
+    cache.put(key, 'model-a', 'response')
+    assert cache.get(key) == ('model-a', 'response')
+    time.sleep(0.15)
+    assert cache.get(key) is None
+    assert cache.conn.execute("SELECT COUNT(*) FROM llm_responses").fetchone()[0] == 0
+
+
+def test_cache_evicts_the_least_recently_used(cache):
+    cache.max_entries = 2
+    for name in ('a', 'b'):
+        cache.put(name, 'model', name)
+        time.sleep(0.01)
+    cache.get('a')
+    time.sleep(0.01)
+    cache.put('c', 'model', 'c')
+    assert cache.get('b') is None
+    assert cache.get('a') == ('model', 'a')
+    assert cache.get('c') == ('model', 'c')
+
+
+def test_cache_key_is_a_content_hash():
+    key = PromptCache.make_key('prompt', models=['a'], temperature=0.7)
+    assert key == PromptCache.make_key('prompt', temperature=0.7, models=['a'])
+    assert key != PromptCache.make_key('prompt ', models=['a'], temperature=0.7)
+    assert len(key) == 64
+
+
+def test_breaker_threshold_and_half_open_probe():
+    breaker = CircuitBreaker(failure_threshold=2, cooldown_seconds=0.1)
+    breaker.record_failure('m')
+    assert not breaker.is_open('m')
+    breaker.record_failure('m')
+    assert breaker.is_open('m')
+
+    time.sleep(0.12)
+    assert not breaker.is_open('m')
+    # A failed probe reopens the circuit straight away
+    breaker.record_failure('m')
+    assert breaker.is_open('m')
+
+    time.sleep(0.12)
+    assert not breaker.is_open('m')
+    breaker.record_success('m')
+    breaker.record_failure('m')
+    assert not breaker.is_open('m')
@@ -0,0 +1,134 @@
+# test_map_tiles.py
+import json
+import os
+import struct
+
+import numpy as np
+import pytest
+
+from map_tiles import TileStore, tile_index
+
+BOUNDS = (72.7, 18.8, 73.1, 19.3)
+
+
+def ndwi_raster(shape=(40, 60), seed=0):
+    raster = np.random.default_rng(seed).uniform(-0.5, 0.5, shape).astype(np.float32)
+    raster[:5, :5] = np.nan
+    return raster
+
+
+def png_size(path):
+    with open(path, 'rb') as handle:
+        header = handle.read(24)
+    assert header[:8] == b'\x89PNG\r\n\x1a\n' and header[12:16] == b'IHDR'
+    return struct.unpack('>II', header[16:24])
+
+
+def tiles_in(bounds, min_zoom, max_zoom):
+    west, south, east, north = bounds
+    total = 0
+    for zoom in range(min_zoom, max_zoom + 1):
+        x0, y0 = tile_index(west, north, zoom)
+        x1, y1 = tile_index(east, south, zoom)
+        total += (x1 - x0 + 1) * (y1 - y0 + 1)
+    return total
+
+
+@pytest.fixture
+def store(tmp_path):
+    return TileStore(root=str(tmp_path), public_url='https://tiles.example/', thumbnail_size=120)
+
+
+def test_layer_key_is_a_hash_of_the_inputs():
+    raster = ndwi_raster()
+    key = TileStore.layer_key('Mumbai', '2023-03', 'NDWI', raster, BOUNDS)
+    assert key == TileStore.layer_key('Mumbai', '2023-03', 'NDWI', raster.copy(), list(BOUNDS))
+    changed = raster.copy()
+    changed[20, 20] += 0.01
+    assert len({key,
+                TileStore.layer_key('Mumbai', '2023-03', 'NDWI', changed, BOUNDS),
+                TileStore.layer_key('Mumbai', '2023-04', 'NDWI', raster, BOUNDS),
+                TileStore.layer_key('Mumbai', '2023-03', 'NDCI', raster, BOUNDS),
+                TileStore.layer_key('Chennai', '2023-03', 'NDWI', raster, BOUNDS)}) == 5
+
+
+def test_layer_is_rendered_once(store, tmp_path, monkeypatch):
+    raster = ndwi_raster()
+    layer = store.render_layer('Mumbai', '2023-03', 'NDWI', raster, BOUNDS)
+    assert not layer['cached']
+    directory = tmp_path / layer['key']
+    assert layer['thumbnail_url'] == f"https://tiles.example/{layer['key']}/thumbnail.png"
+    assert png_size(directory / 'thumbnail.png') == (120, 80)
+    assert json.loads((directory / 'layer.json').read_text())['tile_count'] == layer['tile_count']
+
+    tiles = [os.path.join(root, name) for root, _, names in os.walk(directory) for name in names
+             if name != 'thumbnail.png' and name.endswith('.png')]
+    assert store.max_tiles >= len(tiles) == layer['tile_count'] > 0
+    assert all(png_size(path) == (256, 256) for path in tiles)
+
+    def no_render(*args):
+        raise AssertionError('layer rendered again')
+    monkeypatch.setattr(store, 'write_layer', no_render)
+    # Same values as float64 give the same key
+    again = store.render_layer('Mumbai', '2023-03', 'NDWI', raster.astype(np.float64), BOUNDS)
+    assert again['cached'] and again['key'] == layer['key']
+    assert dict(again, cached=False) == layer
+
+
+def test_scratch_directory_is_renamed_into_place(store, tmp_path, monkeypatch):
+    renames = []
+    rename = os.rename
+
+    def recording_rename(source, target):
+        # The layer is complete before it appears under its key
+        assert os.path.exists(os.path.join(source, 'layer.json'))
+        assert not os.path.exists(target)
+        renames.append((source, target))
+        rename(source, target)
+    monkeypatch.setattr(os, 'rename', recording_rename)
+
+    layer = store.render_layer('Mumbai', '2023-03', 'NDWI', ndwi_raster(), BOUNDS)
+    [(source, target)] = renames
+    assert os.path.dirname(source) == str(tmp_path)
+    assert os.path.basename(source).startswith(f".{layer['key']}-")
+    assert target == str(tmp_path / layer['key'])
+    assert os.listdir(tmp_path) == [layer['key']]
+
+
+def test_failed_render_leaves_nothing_behind(store, tmp_path, monkeypatch):
+    def failing(*args):
+        raise OSError('disk full')
+    monkeypatch.setattr(store, 'write_layer', failing)
+    with pytest.raises(OSError):
+        store.render_layer('Mumbai', '2023-03', 'NDWI', ndwi_raster(), BOUNDS)
+    assert os.listdir(tmp_path) == []
+
+
+def test_concurrent_render_keeps_the_first_layer(store, tmp_path):
+    raster = ndwi_raster()
+    key = TileStore.layer_key('Mumbai', '2023-03', 'NDWI', raster, BOUNDS)
+    # Another run renamed its layer into place while this one was rendering
+    (tmp_path / key).mkdir()
+    (tmp_path / key / 'marker').write_text('theirs')
+
+    layer = store.render_layer('Mumbai', '2023-03', 'NDWI', raster, BOUNDS)
+    assert layer['key'] == key and not layer['cached']
+    assert os.listdir(tmp_path) == [key]
+    assert os.listdir(tmp_path / key) == ['marker']
+
+
+def test_zoom_range_is_capped_by_max_tiles(tmp_path):
+    # About 11 m pixels, which reach zoom 13 when there is no tile cap
+    shape = (5000, 4000)
+    assert TileStore(root=str(tmp_path), max_tiles=10 ** 6).zoom_range(BOUNDS, shape) == (9, 13)
+
+    zooms = []
+    for max_tiles in (256, 20, 3, 1):
+        min_zoom, max_zoom = TileStore(root=str(tmp_path), max_tiles=max_tiles).zoom_range(BOUNDS, shape)
+        assert min_zoom == max(0, max_zoom - 4)
+        assert tiles_in(BOUNDS, min_zoom, max_zoom) <= max_tiles or max_zoom == 0
+        zooms.append(max_zoom)
+    assert zooms == sorted(zooms, reverse=True) and zooms[0] > zooms[-1]
+
+    # Coarse rasters stop at their own resolution
+    assert TileStore(root=str(tmp_path)).zoom_range(BOUNDS, (40, 60))[1] == 6
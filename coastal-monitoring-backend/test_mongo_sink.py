@@ -0,0 +1,269 @@
+# test_mongo_sink.py
+from datetime import date, datetime, timedelta
+
+import numpy as np
+import pandas as pd
+import pytest
+
+mongomock = pytest.importorskip('mongomock')
+from bson import ObjectId  # noqa: E402
+from pymongo.errors import BulkWriteError, DuplicateKeyError, ServerSelectionTimeoutError  # noqa: E402
+
+from mongo_sink import (MONTHLY_COLLECTION, ROLLUP_COLLECTION, SUMMARY_COLLECTION,  # noqa: E402
+                        MongoWriteBehindSink, ReportRetention, to_bson)
+
+
+def bulk_write(self, operations, ordered=True):
+    """mongomock's bulk_write does not take pymongo UpdateOne; apply them one by one"""
+    errors = []
+    for index, operation in enumerate(operations):
+        try:
+            self.update_one(operation._filter, operation._doc, upsert=operation._upsert)
+        except DuplicateKeyError:
+            errors.append({'index': index, 'code': 11000})
+    if errors:
+        raise BulkWriteError({'writeErrors': errors})
+
+
+@pytest.fixture
+def db(monkeypatch):
+    monkeypatch.setattr(mongomock.Collection, 'bulk_write', bulk_write)
+    return mongomock.MongoClient().coastal
+
+
+@pytest.fixture
+def sink(db):
+    sink = MongoWriteBehindSink(db, flush_size=100)
+    yield sink
+    # Drop what a test left buffered so the exit-time flush has nothing to write
+    sink.pending_results, sink.pending_summaries = [], []
+    sink.pending_map_configs, sink.pending_monthly = {}, {}
+    sink.stop_event.set()
+
+
+class FlakyResults:
+    """Results collection whose insert_many fails the way a real server would"""
+
+    def __init__(self, collection, errors=None, exception=None):
+        self.collection = collection
+        self.errors = errors or []
+        self.exception = exception
+
+    def insert_many(self, documents, ordered=True):
+        # Like pymongo, every document gets its _id before anything is sent
+        for document in documents:
+            document.setdefault('_id', ObjectId())
+        if self.exception:
+            raise self.exception
+        failed = {error['index'] for error in self.errors}
+        stored = [document for index, document in enumerate(documents) if index not in failed]
+        if stored:
+            self.collection.insert_many(stored)
+        if self.errors:
+            raise BulkWriteError({'writeErrors': self.errors})
+
+    def __getattr__(self, name):
+        return getattr(self.collection, name)
+
+
+def report(location, day, **fields):
+    return dict({'location': location, 'timestamp': f'2026-06-{day:02d}T00:00:00', 'threat_level': 'LOW',
+                 'anomaly_count': 0}, **fields)
+
+
+def test_to_bson_converts_numpy_and_pandas():
+    converted = to_bson({
+        'count': np.int64(3),
+        'score': np.float32(0.5),
+        'missing': float('nan'),
+        'values': np.array([1, 2]),
+        'when': pd.Timestamp('2026-06-01'),
+        'day': date(2026, 6, 1),
+        'rows': pd.DataFrame({'a': [1]}),
+        1: (np.bool_(True),)
+    })
+    assert converted == {
+        'count': 3, 'score': 0.5, 'missing': None, 'values': [1, 2], 'when': datetime(2026, 6, 1),
+        'day': datetime(2026, 6, 1), 'rows': [{'a': 1}], '1': [True]
+    }
+    assert type(converted['count']) is int
+
+
+def test_flush_writes_reports_and_map_configs(db, sink):
+    sink.add_result(report('Mumbai', 1))
+    sink.add_map_config('Mumbai', {'layers': ['ndwi']})
+    sink.add_map_config('Mumbai', {'layers': ['ndci']})
+
+    assert sink.flush() == 3
+    assert db.ai_analysis.count_documents({}) == 1
+    assert db.map_configurations.find_one({'location': 'Mumbai'})['layers'] == ['ndci']
+    assert sink.flush() == 0
+
+
+def test_add_result_flushes_at_flush_size(db, sink):
+    sink.flush_size = 2
+    sink.add_result(report('Mumbai', 1))
+    assert db.ai_analysis.count_documents({}) == 0
+    sink.add_result(report('Mumbai', 2))
+    assert db.ai_analysis.count_documents({}) == 2
+
+
+def test_failed_insert_requeues_everything(db, sink):
+    sink.results = FlakyResults(db.ai_analysis, exception=ServerSelectionTimeoutError('down'))
+    sink.add_result(report('Mumbai', 1))
+    sink.add_result(report('Chennai', 1))
+
+    assert sink.flush() == 0
+    assert len(sink.pending_results) == 2
+
+    sink.results = db.ai_analysis
+    assert sink.flush() == 4
+    assert db.ai_analysis.count_documents({}) == 2
+    assert sink.pending_results == []
+
+
+def test_partial_insert_requeues_only_failed_reports(db, sink):
+    documents = [report('Mumbai', day) for day in (1, 2, 3)]
+    # Index 1 already landed in an earlier flush; index 2 failed validation
+    sink.results = FlakyResults(db.ai_analysis, errors=[{'index': 1, 'code': 11000}, {'index': 2, 'code': 121}])
+
+    stored = sink.insert_results(documents)
+    assert [document['timestamp'] for document in stored] == [documents[0]['timestamp'], documents[1]['timestamp']]
+    assert sink.pending_results == [documents[2]]
+
+
+def test_requeued_reports_keep_their_ids(db, sink):
+    documents = [report('Mumbai', day) for day in (1, 2)]
+    sink.results = FlakyResults(db.ai_analysis, errors=[{'index': 1, 'code': 121}])
+    sink.insert_results(documents)
+    retried_id = sink.pending_results[0]['_id']
+
+    # The retry reuses the _id insert_many assigned, so a report can not be stored twice
+    sink.results = db.ai_analysis
+    sink.flush()
+    assert db.ai_analysis.count_documents({}) == 2
+    assert db.ai_analysis.find_one({'_id': retried_id}) is not None
+
+
+def test_summary_follows_the_newest_report(db, sink):
+    sink.add_result(report('Mumbai', 2, threat_level='HIGH', insights='x' * 600,
+                           map_configuration={'layer_tiles': {'ndwi': {'thumbnail_url': '/t/ndwi.png'}}}))
+    sink.flush()
+    # A report that lands late must not replace the newer summary
+    sink.add_result(report('Mumbai', 1, threat_level='LOW'))
+    sink.flush()
+
+    summary = db[SUMMARY_COLLECTION].find_one({'_id': 'Mumbai'})
+    newest = db.ai_analysis.find_one({'timestamp': '2026-06-02T00:00:00'})
+    assert summary['threat_level'] == 'HIGH'
+    assert summary['report_id'] == newest['_id']
+    assert summary['analysis_count'] == 1
+    assert len(summary['insights']) == 500 and summary['insights_truncated']
+    assert summary['thumbnails'] == {'ndwi': '/t/ndwi.png'}
+
+    sink.add_result(report('Mumbai', 3, threat_level='MEDIUM'))
+    sink.flush()
+    summary = db[SUMMARY_COLLECTION].find_one({'_id': 'Mumbai'})
+    assert summary['threat_level'] == 'MEDIUM'
+    assert summary['analysis_count'] == 2
+
+
+def test_monthly_metrics_replace_reanalysed_months(db, sink):
+    sink.add_monthly_metrics('Mumbai', [{'year': 2026, 'month': 5, 'NDWI': np.float64(0.1)},
+                                        {'year': 2026, 'month': 6, 'NDWI': 0.2}])
+    sink.flush()
+    sink.add_monthly_metrics('Mumbai', [{'year': 2026, 'month': 6, 'NDWI': 0.3, 'date': '2026-06'}])
+    sink.flush()
+
+    months = {doc['month']: doc for doc in db[MONTHLY_COLLECTION].find({'location': 'Mumbai'})}
+    assert sorted(months) == ['2026-05', '2026-06']
+    assert months['2026-06']['metrics'] == {'NDWI': 0.3}
+    assert months['2026-06']['date'] == datetime(2026, 6, 1)
+
+
+def old_report(location, month, day, **fields):
+    return dict({'location': location, 'timestamp': f'2025-{month:02d}-{day:02d}T00:00:00',
+                 'threat_level': 'HIGH', 'anomaly_count': day}, **fields)
+
+
+def rollups(db, location):
+    return {doc['month']: doc for doc in db[ROLLUP_COLLECTION].find({'location': location})}
+
+
+def test_retention_rolls_up_expired_reports(db):
+    db.ai_analysis.insert_many([old_report('Mumbai', 1, day) for day in (1, 2, 3)]
+                               + [old_report('Mumbai', 2, 1, threat_level='LOW')]
+                               + [report('Mumbai', 1), old_report('Chennai', 1, 1)])
+    retention = ReportRetention(db.ai_analysis, db[ROLLUP_COLLECTION], keep_reports=2, max_age_days=90)
+
+    assert retention.apply('Mumbai') == 3
+    remaining = sorted(doc['timestamp'] for doc in db.ai_analysis.find({'location': 'Mumbai'}))
+    assert remaining == ['2025-02-01T00:00:00', '2026-06-01T00:00:00']
+
+    january = rollups(db, 'Mumbai')['2025-01']
+    assert january['reports'] == 3
+    assert january['anomaly_total'] == 6
+    assert january['max_anomaly_count'] == 3
+    assert january['threat_levels'] == {'HIGH': 3}
+    assert january['first_report_at'] == '2025-01-01T00:00:00'
+    assert january['last_report_at'] == '2025-01-03T00:00:00'
+    assert db.ai_analysis.count_documents({'location': 'Chennai'}) == 1
+
+
+def test_retention_keeps_recent_reports_and_can_be_disabled(db):
+    db.ai_analysis.insert_many([
+        {'location': 'Mumbai', 'timestamp': (datetime.now() - timedelta(days=days)).isoformat()}
+        for days in (1, 10, 30)
+    ])
+    assert ReportRetention(db.ai_analysis, db[ROLLUP_COLLECTION], keep_reports=1).apply('Mumbai') == 0
+    db.ai_analysis.insert_one(old_report('Mumbai', 1, 1))
+    assert ReportRetention(db.ai_analysis, db[ROLLUP_COLLECTION], max_age_days=0).apply('Mumbai') == 0
+    assert ReportRetention(db.ai_analysis, db[ROLLUP_COLLECTION], keep_reports=0).apply('Mumbai') == 1
+
+
+class FailingDelete:
+    """Results collection whose first delete_many fails after the rollup was written"""
+
+    def __init__(self, collection):
+        self.collection = collection
+        self.failed = False
+
+    def delete_many(self, query):
+        if not self.failed:
+            self.failed = True
+            raise ServerSelectionTimeoutError('down')
+        return self.collection.delete_many(query)
+
+    def __getattr__(self, name):
+        return getattr(self.collection, name)
+
+
+def test_retention_retry_does_not_count_reports_twice(db):
+    db.ai_analysis.insert_many([old_report('Mumbai', 1, day) for day in (1, 2)] + [report('Mumbai', 1)])
+    retention = ReportRetention(FailingDelete(db.ai_analysis), db[ROLLUP_COLLECTION], keep_reports=1)
+    with pytest.raises(ServerSelectionTimeoutError):
+        retention.apply('Mumbai')
+    assert rollups(db, 'Mumbai')['2025-01']['reports'] == 2
+
+    # Another report of the same month expires before the retry
+    db.ai_analysis.insert_one(old_report('Mumbai', 1, 3))
+    assert retention.apply('Mumbai') == 3
+    assert retention.apply('Mumbai') == 0
+
+    january = rollups(db, 'Mumbai')['2025-01']
+    assert january['reports'] == 3
+    assert january['anomaly_total'] == 6
+    assert len(january['report_ids']) == 3
+    assert db.ai_analysis.count_documents({'location': 'Mumbai'}) == 1
+
+
+def test_flush_applies_retention_to_locations_with_new_reports(db):
+    db.ai_analysis.insert_many([old_report('Mumbai', 1, 1), old_report('Chennai', 1, 1)])
+    sink = MongoWriteBehindSink(db, retention=ReportRetention(db.ai_analysis, db[ROLLUP_COLLECTION],
+                                                              keep_reports=1))
+    sink.add_result(report('Mumbai', 1))
+    sink.close()
+
+    assert db.ai_analysis.count_documents({'location': 'Mumbai'}) == 1
+    assert db.ai_analysis.count_documents({'location': 'Chennai'}) == 1
+    assert list(rollups(db, 'Mumbai')) == ['2025-01']
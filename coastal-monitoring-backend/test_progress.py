@@ -0,0 +1,81 @@
+# test_progress.py
+import json
+import threading
+
+import pytest
+
+import progress
+from progress import add_listener, progress_context, publish, remove_listener
+
+
+@pytest.fixture
+def received():
+    events = []
+    add_listener(events.append)
+    yield events
+    remove_listener(events.append)
+
+
+def test_events_are_delivered_in_order_with_increasing_seq(received):
+    published = [publish('month_extracted', 'Goa', month=f'2023-{month:02d}') for month in range(1, 6)]
+    assert received == published
+    seqs = [event['seq'] for event in received]
+    assert seqs == sorted(seqs) and len(set(seqs)) == 5
+    assert received[0]['type'] == 'month_extracted' and received[0]['location'] == 'Goa'
+    assert received[0]['month'] == '2023-01' and 'timestamp' in received[0]
+
+
+def test_seq_is_unique_across_threads(received):
+    threads = [threading.Thread(target=lambda: [publish('tick') for _ in range(50)]) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert len({event['seq'] for event in received}) == 200
+
+
+def test_progress_context_tags_events_on_its_thread(received):
+    with progress_context(job_id='job-1', attempt=1):
+        publish('stage_started', 'Goa')
+        with progress_context(attempt=2):
+            publish('stage_started', 'Goa')
+        # Other threads are not tagged
+        thread = threading.Thread(target=publish, args=('elsewhere',))
+        thread.start()
+        thread.join()
+        publish('stage_finished', 'Goa', job_id='explicit')
+    publish('after')
+
+    tags = {event['type']: (event.get('job_id'), event.get('attempt')) for event in received}
+    assert [(event.get('job_id'), event.get('attempt')) for event in received[:2]] == [('job-1', 1), ('job-1', 2)]
+    assert tags['elsewhere'] == (None, None)
+    # Explicit fields win over the context
+    assert tags['stage_finished'] == ('explicit', 1)
+    assert tags['after'] == (None, None)
+
+
+def test_failing_listener_does_not_stop_the_others(received):
+    def broken(event):
+        raise RuntimeError('listener down')
+    add_listener(broken)
+    try:
+        publish('still_delivered')
+    finally:
+        remove_listener(broken)
+    assert [event['type'] for event in received] == ['still_delivered']
+
+
+def test_events_are_appended_to_the_ndjson_file(tmp_path, monkeypatch):
+    path = tmp_path / 'progress' / 'events.ndjson'
+    monkeypatch.setenv('ANALYSIS_PROGRESS_PATH', str(path))
+    monkeypatch.delenv('ANALYSIS_PROGRESS_FD', raising=False)
+    monkeypatch.setattr(progress, '_stream', None)
+    monkeypatch.setattr(progress, '_stream_opened', False)
+    try:
+        first = publish('region_started', 'Goa')
+        second = publish('region_finished', 'Goa', threat_level='LOW')
+    finally:
+        progress._stream.close()
+
+    lines = [json.loads(line) for line in path.read_text().splitlines()]
+    assert lines == [first, second]
@@ -0,0 +1,101 @@
+# test_region_registry.py
+import json
+
+import numpy as np
+import pytest
+
+from region_registry import (RegionRegistry, STRTree, geometry_centroid, geometry_contains,
+                             rectangle_geometry)
+
+
+def random_boxes(n, seed=0):
+    rng = np.random.default_rng(seed)
+    west = rng.uniform(60, 100, n)
+    south = rng.uniform(5, 30, n)
+    return np.column_stack([west, south, west + rng.uniform(0, 1, n), south + rng.uniform(0, 1, n)])
+
+
+@pytest.mark.parametrize('n', [0, 1, 15, 16, 17, 500])
+def test_str_tree_matches_brute_force(n):
+    boxes = random_boxes(n)
+    tree = STRTree(boxes, node_capacity=16)
+    rng = np.random.default_rng(1)
+    for _ in range(50):
+        west, south = rng.uniform(58, 100), rng.uniform(3, 30)
+        bbox = (west, south, west + rng.uniform(0, 5), south + rng.uniform(0, 5))
+        expected = np.flatnonzero(STRTree.intersects(boxes, bbox)) if n else []
+        assert sorted(tree.query(bbox)) == list(expected)
+
+
+def test_str_tree_touching_edges_intersect():
+    tree = STRTree([[0, 0, 1, 1], [2, 2, 3, 3]])
+    assert list(tree.query((1, 1, 1, 1))) == [0]
+    assert list(tree.query((1.5, 1.5, 1.6, 1.6))) == []
+
+
+def test_centroid_of_polygon_with_hole():
+    geometry = {'type': 'Polygon', 'coordinates': [
+        [[0, 0], [4, 0], [4, 2], [0, 2], [0, 0]],
+        [[2, 0.5], [3, 0.5], [3, 1.5], [2, 1.5], [2, 0.5]],
+    ]}
+    lon, lat = geometry_centroid(geometry)
+    # 8 - 1 area units: (8 * 2 - 1 * 2.5) / 7
+    assert lon == pytest.approx(13.5 / 7)
+    assert lat == pytest.approx(1.0)
+    assert not geometry_contains(geometry, 2.5, 1.0)
+    assert geometry_contains(geometry, 1.0, 1.0)
+
+
+def test_multipolygon_contains_either_part():
+    geometry = {'type': 'MultiPolygon', 'coordinates': [
+        rectangle_geometry((0, 0, 1, 1))['coordinates'],
+        rectangle_geometry((5, 5, 6, 6))['coordinates'],
+    ]}
+    assert geometry_contains(geometry, 0.5, 0.5)
+    assert geometry_contains(geometry, 5.5, 5.5)
+    assert not geometry_contains(geometry, 3, 3)
+
+
+def test_unsupported_geometry():
+    with pytest.raises(ValueError):
+        geometry_centroid({'type': 'Point', 'coordinates': [0, 0]})
+
+
+def test_registry_lookups():
+    triangle = {'type': 'Polygon', 'coordinates': [[[80, 13], [81, 13], [80, 14], [80, 13]]]}
+    registry = RegionRegistry([
+        {'name': 'Chennai', 'geometry': triangle, 'properties': {'state': 'Tamil Nadu'}},
+        {'name': 'Mumbai', 'geometry': rectangle_geometry((72.7, 18.8, 73.1, 19.3))},
+    ])
+
+    assert len(registry) == 2 and 'Mumbai' in registry
+    assert registry.bounds('Chennai') == (80.0, 13.0, 81.0, 14.0)
+    assert registry.query_bbox((72, 13, 81, 20)) == ['Chennai', 'Mumbai']
+    assert registry.query_bbox((75, 13, 79, 20)) == []
+    assert registry.query_point(72.9, 19.0) == ['Mumbai']
+    # Inside Chennai's bounds but outside the triangle
+    assert registry.query_point(80.9, 13.9) == []
+    assert registry.query_point(80.2, 13.2) == ['Chennai']
+
+    summary = registry.summary('Mumbai')
+    assert summary['center'] == [pytest.approx(19.05), pytest.approx(72.9)]
+
+
+def test_feature_collection_round_trip(tmp_path):
+    registry = RegionRegistry.from_bounds({'Goa': (73.6, 14.9, 74.1, 15.8), 'Kochi': (76.1, 9.8, 76.4, 10.1)})
+    path = tmp_path / 'regions.geojson'
+    path.write_text(json.dumps(registry.to_feature_collection()))
+
+    loaded = RegionRegistry.from_geojson(str(path))
+    assert list(loaded) == ['Goa', 'Kochi']
+    assert loaded.bounds_by_name() == registry.bounds_by_name()
+    assert loaded['Goa']['properties'] == {'name': 'Goa'}
+
+
+def test_shipped_registry_loads():
+    registry = RegionRegistry.from_geojson()
+    assert len(registry) > 0
+    for name in registry:
+        west, south, east, north = registry.bounds(name)
+        lon, lat = registry.centroid(name)
+        assert west <= lon <= east and south <= lat <= north
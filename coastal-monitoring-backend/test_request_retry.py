@@ -0,0 +1,183 @@
+# test_request_retry.py
+import threading
+import time
+
+import pytest
+
+from conftest import FakeMonthSource
+from request_retry import (AdaptiveLimiter, RequestFailed, RetryPolicy, call_with_retry, classify_error,
+                           http_status)
+
+
+class HttpError(Exception):
+    """Shaped like googleapiclient's HttpError (resp.status)"""
+
+    def __init__(self, status, message='error'):
+        super().__init__(message)
+        self.resp = type('Response', (), {'status': status})()
+
+
+class RequestsError(Exception):
+    """Shaped like requests' HTTPError (response.status_code)"""
+
+    def __init__(self, status_code):
+        super().__init__('error')
+        self.response = type('Response', (), {'status_code': status_code})()
+
+
+@pytest.mark.parametrize('error,kind', [
+    (Exception('Too many concurrent aggregations.'), 'rate_limit'),
+    (Exception('Quota exceeded for quota metric'), 'rate_limit'),
+    (Exception('RESOURCE_EXHAUSTED: try again later'), 'rate_limit'),
+    (Exception('HTTP Error 429: Too Many Requests'), 'rate_limit'),
+    (HttpError(429), 'rate_limit'),
+    (RequestsError(429), 'rate_limit'),
+    (Exception('Computation timed out.'), 'transient'),
+    (Exception('Deadline exceeded'), 'transient'),
+    (Exception('503 Service Unavailable'), 'transient'),
+    (Exception('Connection reset by peer'), 'transient'),
+    (TimeoutError(), 'transient'),
+    (ConnectionResetError(), 'transient'),
+    (HttpError(502), 'transient'),
+    (RequestsError(500), 'transient'),
+    (Exception('Image.select: Pattern "B99" did not match any bands.'), 'permanent'),
+    (HttpError(400, 'Bad Request'), 'permanent'),
+    (RequestsError(404), 'permanent'),
+    (ValueError('Unknown location: Atlantis'), 'permanent'),
+    (RequestFailed('gave up', 'transient', 5), 'transient'),
+])
+def test_classify_error(error, kind):
+    assert classify_error(error) == kind
+
+
+@pytest.mark.parametrize('message', [
+    'Collection query aborted after accumulating over 5000 elements.',
+    'Found 1429 images in the collection',
+    'User memory limit exceeded at 15002 bytes',
+    'Connection settings are invalid',
+])
+def test_status_codes_only_match_as_whole_numbers(message):
+    assert classify_error(Exception(message)) == 'permanent'
+
+
+def test_http_status():
+    assert http_status(HttpError(503)) == 503
+    assert http_status(HttpError('429')) == 429
+    assert http_status(RequestsError(404)) == 404
+    assert http_status(HttpError('n/a')) is None
+    assert http_status(Exception('429')) is None
+
+
+def test_retry_delay_bounds():
+    policy = RetryPolicy(base_delay=1.0, rate_limit_delay=5.0, max_delay=20.0)
+    for attempt, (transient, rate_limit) in enumerate([(1, 5), (2, 10), (4, 20), (8, 20), (16, 20)], start=1):
+        for _ in range(50):
+            assert transient / 2 <= policy.delay(attempt, 'transient') <= transient
+            assert rate_limit / 2 <= policy.delay(attempt, 'rate_limit') <= rate_limit
+    assert RetryPolicy(max_attempts=0).max_attempts == 1
+
+
+def test_limiter_halves_on_rate_limits_and_grows_back():
+    limiter = AdaptiveLimiter(max_limit=8, increase_after=3)
+    for expected in (4, 2, 1, 1):
+        limiter.on_rate_limit()
+        assert limiter.limit == expected
+
+    for expected in (2, 3):
+        for _ in range(3):
+            limiter.on_success()
+        assert limiter.limit == expected
+
+    # A rate limit resets the run of successes
+    limiter.on_success()
+    limiter.on_rate_limit()
+    limiter.on_success()
+    limiter.on_success()
+    assert limiter.limit == 1
+
+
+def test_limiter_blocks_beyond_the_limit():
+    limiter = AdaptiveLimiter(max_limit=1)
+    entered = threading.Event()
+
+    def second():
+        with limiter:
+            entered.set()
+
+    with limiter:
+        thread = threading.Thread(target=second)
+        thread.start()
+        assert not entered.wait(0.1)
+    assert entered.wait(1)
+    thread.join()
+
+
+def flaky(errors, result='ok'):
+    calls = []
+
+    def request():
+        calls.append(time.perf_counter())
+        if len(calls) <= len(errors):
+            raise errors[len(calls) - 1]
+        return result
+    return request, calls
+
+
+def test_call_with_retry_recovers_from_transient_errors():
+    limiter = AdaptiveLimiter(max_limit=4)
+    request, calls = flaky([TimeoutError('timed out'), Exception('Too many concurrent aggregations')])
+    assert call_with_retry(request, 'test', RetryPolicy(base_delay=0, rate_limit_delay=0), limiter) == 'ok'
+    assert len(calls) == 3
+    assert limiter.limit == 2
+
+
+def test_call_with_retry_gives_up_on_permanent_errors():
+    request, calls = flaky([ValueError('bad band')])
+    with pytest.raises(RequestFailed) as failure:
+        call_with_retry(request, 'test', RetryPolicy(base_delay=0), AdaptiveLimiter())
+    assert len(calls) == 1
+    assert failure.value.kind == 'permanent'
+    assert failure.value.attempts == 1
+    assert isinstance(failure.value.__cause__, ValueError)
+
+
+def test_call_with_retry_stops_after_max_attempts():
+    request, calls = flaky([TimeoutError('timed out')] * 5)
+    with pytest.raises(RequestFailed) as failure:
+        call_with_retry(request, 'test', RetryPolicy(max_attempts=3, base_delay=0), AdaptiveLimiter())
+    assert len(calls) == 3
+    assert failure.value.kind == 'transient'
+    assert failure.value.attempts == 3
+
+
+def test_only_failed_months_are_recorded_and_backfilled(analyst):
+    location = analyst.registry.names[0]
+    windows = analyst.get_month_windows(1)
+    failing = {'2023-03-01', '2023-07-01'}
+    analyst.data_source = FakeMonthSource(failing=failing)
+
+    df = analyst.extract_time_series_data(location, windows=windows)
+    assert len(df) == 10
+    failed = analyst.stats_cache.failed_months(location)
+    assert {failure['start_date'] for failure in failed} == failing
+    assert all(failure['kind'] == 'transient' and failure['attempts'] == 5 for failure in failed)
+
+    analyst.data_source = source = FakeMonthSource()
+    assert analyst.backfill_failed_months() == {location: sorted(failing)}
+    assert [sorted(call) for call in source.calls] == [sorted(failing)]
+    assert analyst.stats_cache.failed_months() == []
+
+    # Everything now comes from the cache
+    assert len(analyst.extract_time_series_data(location, windows=windows)) == 12
+    assert len(source.calls) == 1
+
+
+def test_months_that_fail_again_stay_recorded(analyst):
+    location = analyst.registry.names[0]
+    analyst.data_source = FakeMonthSource(failing={'2023-03-01'})
+    analyst.extract_time_series_data(location, windows=analyst.get_month_windows(1))
+
+    assert analyst.backfill_failed_months([location]) == {location: []}
+    failed = analyst.stats_cache.failed_months(location)
+    assert [failure['start_date'] for failure in failed] == ['2023-03-01']
+    assert failed[0]['attempts'] == 10
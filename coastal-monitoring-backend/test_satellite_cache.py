@@ -0,0 +1,85 @@
+# test_satellite_cache.py
+import time
+
+import pytest
+
+from satellite_cache import MonthlyStatsCache
+
+REGION = {'type': 'Polygon', 'coordinates': [[[72.8, 18.9], [73.0, 18.9], [73.0, 19.1], [72.8, 18.9]]]}
+
+
+@pytest.fixture
+def cache(tmp_path):
+    cache = MonthlyStatsCache(path=str(tmp_path / 'stats.sqlite'))
+    yield cache
+    cache.close()
+
+
+def test_key_depends_on_reduction_parameters():
+    key = MonthlyStatsCache.make_key(REGION, '2024-01-01', 20, 30, ['NDWI', 'NDCI'])
+    assert key == MonthlyStatsCache.make_key(REGION, '2024-01-01', 20, 30, ['NDCI', 'NDWI'])
+    assert key != MonthlyStatsCache.make_key(REGION, '2024-02-01', 20, 30, ['NDWI', 'NDCI'])
+    assert key != MonthlyStatsCache.make_key(REGION, '2024-01-01', 10, 30, ['NDWI', 'NDCI'])
+    assert key != MonthlyStatsCache.make_key(REGION, '2024-01-01', 20, 60, ['NDWI', 'NDCI'])
+    assert key != MonthlyStatsCache.make_key(REGION, '2024-01-01', 20, 30, ['NDWI'])
+
+
+def test_round_trip_and_hit_counters(cache):
+    key = MonthlyStatsCache.make_key(REGION, '2024-01-01', 20, 30, ['NDWI'])
+    assert cache.get(key) is None
+
+    cache.put(key, 'Mumbai', '2024-01', {'NDWI': 0.25}, closed=True)
+    assert cache.get(key) == {'NDWI': 0.25}
+    assert cache.stats() == {'hits': 1, 'misses': 1, 'hit_rate': 0.5}
+
+
+def test_empty_month_is_a_hit(cache):
+    key = MonthlyStatsCache.make_key(REGION, '2024-01-01', 20, 30, ['NDWI'])
+    cache.put(key, 'Mumbai', '2024-01', {}, closed=True)
+    assert cache.get(key) == {}
+    assert cache.latest_month('Mumbai') is None
+
+
+def test_open_month_expires(tmp_path):
+    cache = MonthlyStatsCache(path=str(tmp_path / 'stats.sqlite'), open_month_ttl_seconds=0)
+    key = MonthlyStatsCache.make_key(REGION, '2024-01-01', 20, 30, ['NDWI'])
+    cache.put(key, 'Mumbai', '2024-01', {'NDWI': 0.25}, closed=False)
+    time.sleep(0.01)
+    assert cache.get(key) is None
+    cache.close()
+
+
+def test_closed_month_without_ttl_never_expires(cache):
+    cache.open_month_ttl_seconds = 0
+    key = MonthlyStatsCache.make_key(REGION, '2024-01-01', 20, 30, ['NDWI'])
+    cache.put(key, 'Mumbai', '2024-01', {'NDWI': 0.25}, closed=True)
+    time.sleep(0.01)
+    assert cache.get(key) == {'NDWI': 0.25}
+
+
+def test_latest_month_and_invalidate(cache):
+    for month in ('2024-01', '2024-03', '2024-02'):
+        key = MonthlyStatsCache.make_key(REGION, f'{month}-01', 20, 30, ['NDWI'])
+        cache.put(key, 'Mumbai', month, {'NDWI': 0.1}, closed=True)
+    cache.put('open', 'Mumbai', '2024-04', {'NDWI': 0.1}, closed=False)
+    cache.put('other', 'Chennai', '2024-05', {'NDWI': 0.1}, closed=True)
+
+    assert cache.latest_month('Mumbai') == '2024-03'
+    assert cache.invalidate(open_only=True) == 1
+    assert cache.invalidate(location='Chennai') == 1
+    assert cache.latest_month('Chennai') is None
+    assert cache.clear() == 3
+
+
+def test_failures_accumulate_until_cleared(cache):
+    cache.record_failure('Mumbai', '2024-02-01', '2024-03-01', 'timeout', 'transient')
+    cache.record_failure('Mumbai', '2024-02-01', '2024-03-01', 'quota', 'rate_limit', attempts=2)
+    cache.record_failure('Mumbai', '2024-01-01', '2024-02-01', 'timeout', 'transient')
+
+    failed = cache.failed_months('Mumbai')
+    assert [row['start_date'] for row in failed] == ['2024-01-01', '2024-02-01']
+    assert failed[1]['attempts'] == 3
+    assert failed[1]['reason'] == 'quota'
+
+    cache.clear_failure('Mumbai', '2024-02-01')
+    assert [row['start_date'] for row in cache.failed_months()] == ['2024-01-01']
@@ -0,0 +1,135 @@
+# test_shoreline.py
+import numpy as np
+import pytest
+
+from shoreline import (METRES_PER_DEGREE, NODATA, ShorelineEngine, decimal_years, linear_rates,
+                       otsu_threshold, water_masks)
+
+
+def synthetic_coast(pixel_m, rate, months=24, size=200, slope=0.3):
+    """NDWI stack with sea to the west of a shoreline moving `rate` m/yr seaward"""
+    deg = pixel_m / METRES_PER_DEGREE
+    bounds = (0.0, 0.0, size * deg, size * deg)
+    centres = (np.arange(size) + 0.5) * pixel_m
+    rasters, dates = [], []
+    for month in range(months):
+        # A retreating (negative rate) shoreline moves east, away from the sea
+        shore = size * pixel_m / 2 + slope * centres[:, None] - rate * month / 12
+        rasters.append(np.where(centres[None, :] < shore, 0.4, -0.4).astype(np.float32))
+        dates.append(f'{2024 + month // 12}-{month % 12 + 1:02d}-01')
+    return np.array(rasters), bounds, dates
+
+
+@pytest.mark.parametrize('pixel_m,slope,tolerance', [
+    (10, 0.0, 0.05), (30, 0.0, 0.05),
+    # Slanted coasts are pixel staircases, so their normals and positions are coarser
+    (10, 0.3, 0.1), (30, 0.3, 0.1),
+])
+def test_retreating_coast_is_eroding(pixel_m, slope, tolerance):
+    summary = ShorelineEngine().analyze(*synthetic_coast(pixel_m, rate=-100.0, slope=slope))['summary']
+
+    assert summary['months'] == 24
+    assert summary['first_month'] == '2024-01' and summary['last_month'] == '2025-12'
+    assert summary['measured_transects'] > 0.9 * summary['transects']
+    # Transects are shore-normal, so a slanted coast retreats at rate * cos(atan(slope))
+    expected = -100.0 * np.cos(np.arctan(slope))
+    assert summary['median_rate_m_per_year'] == pytest.approx(expected, rel=tolerance)
+    assert summary['eroding_share'] > 0.9
+    assert summary['accreting_share'] == 0
+    assert summary['reliable']
+    assert summary['hotspots'] and all(h['rate_m_per_year'] < 0 for h in summary['hotspots'])
+
+
+def test_advancing_coast_is_accreting():
+    summary = ShorelineEngine().analyze(*synthetic_coast(20, rate=40.0))['summary']
+    assert summary['median_rate_m_per_year'] > 30
+    assert summary['accreting_share'] > 0.9
+    assert summary['eroding_share'] == 0
+
+
+def test_stable_coast_on_coarse_pixels_is_not_eroding():
+    summary = ShorelineEngine().analyze(*synthetic_coast(262, rate=0.0))['summary']
+    assert summary['eroding_share'] == 0
+    assert summary['erosion_threshold_m_per_year'] >= 262 / 2
+    assert summary['transect_length_m'] >= 2 * 10 * 262
+    assert not summary['reliable']
+
+
+def test_coarse_pixels_still_measure_fast_retreat():
+    summary = ShorelineEngine().analyze(*synthetic_coast(262, rate=-400.0))['summary']
+    assert summary['measured_transects'] > 0
+    assert summary['median_rate_m_per_year'] < -200
+
+
+def test_transects_are_packed_per_month():
+    result = ShorelineEngine().analyze(*synthetic_coast(20, rate=-50.0, months=6))
+    transects = result['transects']
+    count = result['summary']['transects']
+    assert transects['months'][0] == '2024-01'
+    assert transects['position_dm']['shape'] == [6, count]
+    assert transects['origin_lonlat']['shape'] == [count, 2]
+    assert len(transects['rate_m_per_year']['data']) == 4 * count
+    assert transects['position_dm']['dtype'] == 'i2'
+    assert transects['observations']['dtype'] == 'u2'
+
+
+def unpack(packed):
+    return np.frombuffer(packed['data'], dtype='<' + packed['dtype']).reshape(packed['shape'])
+
+
+def test_long_transects_do_not_wrap_positions():
+    # 400 m pixels and 8 km transects put positions far beyond int16 decimetres
+    engine = ShorelineEngine(min_transect_pixels=20)
+    rasters, bounds, dates = synthetic_coast(400, rate=-4000.0, slope=0.0)
+    result = engine.analyze(rasters, bounds, dates)
+    packed = result['transects']['position_dm']
+    assert packed['dtype'] == 'i4'
+
+    positions = unpack(packed).astype(float)
+    positions[positions == packed['missing']] = np.nan
+    assert np.nanmax(np.abs(positions)) > np.iinfo(np.int16).max
+
+    # Rates recomputed from the stored decimetres match the summary up to rounding
+    rates, _ = linear_rates(decimal_years(dates), positions / 10)
+    assert np.nanmedian(rates) == pytest.approx(result['summary']['median_rate_m_per_year'], abs=0.1)
+
+
+def test_months_without_data_are_skipped():
+    rasters, bounds, dates = synthetic_coast(20, rate=-50.0, months=6)
+    rasters[2] = np.nan
+    result = ShorelineEngine().analyze(rasters, bounds, dates)
+    assert result['summary']['months'] == 5
+    assert '2024-03' not in result['transects']['months']
+
+
+def test_too_little_data_returns_none():
+    rasters, bounds, dates = synthetic_coast(20, rate=-50.0, months=1)
+    assert ShorelineEngine().analyze(rasters, bounds, dates) is None
+    all_water = np.full((3, 50, 50), 0.5, dtype=np.float32)
+    assert ShorelineEngine().analyze(all_water, (0, 0, 0.01, 0.01), ['2024-01', '2024-02', '2024-03']) is None
+
+
+def test_scale_aware_thresholds():
+    engine = ShorelineEngine(transect_length_m=500.0, erosion_rate=2.0, min_transect_pixels=10)
+    assert engine.transect_length(10) == 500.0
+    assert engine.transect_length(100) == 2000.0
+    assert engine.erosion_threshold(10, 2.0) == 5.0
+    assert engine.erosion_threshold(2, 2.0) == 2.0
+    assert engine.erosion_threshold(100, 0) == 2.0
+
+
+def test_water_masks_and_otsu():
+    raster = np.array([[-0.5, -0.4, np.nan], [0.3, 0.5, 0.6]], dtype=np.float32)
+    masks = water_masks(raster[None], threshold=0.0)
+    assert masks[0].tolist() == [[0, 0, NODATA], [1, 1, 1]]
+    assert -0.4 < otsu_threshold(raster) < 0.3
+    assert (water_masks(raster[None], threshold='otsu') == masks).all()
+
+
+def test_linear_rates_ignore_missing_months():
+    times = decimal_years(['2024-01', '2024-02', '2024-03', '2024-04'])
+    positions = np.array([[0.0, 1.0], [1.0, np.nan], [2.0, np.nan], [3.0, 4.0]])
+    rates, observations = linear_rates(times, positions, min_observations=3)
+    assert rates[0] == pytest.approx(12.0)
+    assert np.isnan(rates[1])
+    assert observations.tolist() == [4, 2]
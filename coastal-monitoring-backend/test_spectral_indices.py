@@ -0,0 +1,62 @@
+# test_spectral_indices.py
+import numpy as np
+import pytest
+
+from spectral_indices import SPECTRAL_INDICES, get_indices, parse_index_names, source_bands
+
+BANDS = {
+    'B3': np.array([3000, 1000, 0], dtype=np.uint16),
+    'B4': np.array([1000, 1000, 0], dtype=np.uint16),
+    'B5': np.array([2000, 1000, 0], dtype=np.uint16),
+    'B8': np.array([1000, 3000, 0], dtype=np.uint16),
+    'B11': np.array([500, 2000, 0], dtype=np.uint16),
+}
+
+
+@pytest.mark.parametrize('name,expected', [
+    ('NDWI', [0.5, -0.5]),
+    ('MNDWI', [5 / 7, -1 / 3]),
+    ('NDCI', [1 / 3, 0.0]),
+    ('NDVI', [0.0, 0.5]),
+    ('NDTI', [-0.5, 0.0]),
+])
+def test_normalized_differences(name, expected):
+    values = SPECTRAL_INDICES[name].compute(BANDS)
+    assert values.dtype == np.float32
+    np.testing.assert_allclose(values[:2], expected, rtol=1e-6)
+    # 0 / 0 is undefined rather than an error or infinity
+    assert np.isnan(values[2])
+
+
+def test_floating_algae_index():
+    values = SPECTRAL_INDICES['FAI'].compute(BANDS)
+    # B8 above the B4-B11 line at 833 nm, in reflectance
+    weight = (833 - 665) / (1610 - 665)
+    expected = [(1000 - (1000 + (500 - 1000) * weight)) * 1e-4,
+                (3000 - (1000 + (2000 - 1000) * weight)) * 1e-4]
+    np.testing.assert_allclose(values[:2], expected, rtol=1e-5)
+    assert values[2] == 0
+
+
+def test_source_bands_are_only_the_bands_needed():
+    assert source_bands(['NDWI']) == ['B3', 'B8']
+    assert source_bands(['NDWI', 'NDCI']) == ['B3', 'B4', 'B5', 'B8']
+    assert source_bands(['NDWI', 'FAI', 'MNDWI']) == ['B11', 'B3', 'B4', 'B8']
+    assert source_bands([]) == []
+    # Computing needs nothing beyond them
+    needed = {band: BANDS[band] for band in source_bands(['NDCI'])}
+    assert SPECTRAL_INDICES['NDCI'].compute(needed)[0] == pytest.approx(1 / 3)
+
+
+def test_parse_index_names():
+    assert parse_index_names(' ndvi, FAI ,,NDWI', required=('NDWI', 'NDCI')) == ['NDWI', 'NDCI', 'NDVI', 'FAI']
+    assert parse_index_names(None, required=('NDWI',)) == ['NDWI']
+    assert parse_index_names('') == []
+
+
+@pytest.mark.parametrize('value', ['NDWI,EVI', 'ndwi;ndci', 'B3'])
+def test_unknown_index_names_are_rejected(value):
+    with pytest.raises(ValueError, match='Unknown spectral indices'):
+        parse_index_names(value)
+    with pytest.raises(ValueError):
+        get_indices(value.split(','))
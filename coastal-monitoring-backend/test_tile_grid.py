@@ -0,0 +1,43 @@
+# test_tile_grid.py
+import pytest
+
+from tile_grid import build_tile_grid, chunked
+
+
+def test_grid_covers_bounds_row_major_from_south():
+    tiles = build_tile_grid([72.0, 18.0, 72.25, 18.1], 0.1)
+    assert len(tiles) == 3 * 1
+    assert [tile['tile_id'] for tile in tiles] == ['r000c000', 'r000c001', 'r000c002']
+    assert tiles[0]['bounds'] == [72.0, 18.0, 72.1, 18.1]
+
+    # Edge tiles are clipped to the bounding box
+    last = tiles[-1]
+    assert last['bounds'][0] == pytest.approx(72.2)
+    assert last['bounds'][2] == 72.25
+    assert last['center'] == [pytest.approx(18.05), pytest.approx(72.225)]
+
+
+def test_exact_multiples_do_not_add_slivers():
+    tiles = build_tile_grid([0.0, 0.0, 0.3, 0.2], 0.1)
+    assert len(tiles) == 6
+    assert max(tile['row'] for tile in tiles) == 1
+    assert max(tile['col'] for tile in tiles) == 2
+
+
+def test_tiles_partition_the_area():
+    bounds = [80.1, 13.2, 80.37, 13.61]
+    tiles = build_tile_grid(bounds, 0.05)
+    area = sum((east - west) * (north - south) for west, south, east, north in (t['bounds'] for t in tiles))
+    assert area == pytest.approx((bounds[2] - bounds[0]) * (bounds[3] - bounds[1]))
+    assert len({tile['tile_id'] for tile in tiles}) == len(tiles)
+
+
+def test_box_smaller_than_a_tile_is_one_tile():
+    tiles = build_tile_grid([72.0, 18.0, 72.01, 18.01], 0.1)
+    assert len(tiles) == 1
+    assert tiles[0]['bounds'] == [72.0, 18.0, 72.01, 18.01]
+
+
+def test_chunked():
+    assert list(chunked(list(range(5)), 2)) == [[0, 1], [2, 3], [4]]
+    assert list(chunked([], 3)) == []
@@ -0,0 +1,88 @@
+# test_visualization.py
+import json
+import struct
+import xml.etree.ElementTree as ET
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from visualization import RENDER_PRESETS, VisualizationRenderer, render_svg, series_payload
+
+SVG = '{http://www.w3.org/2000/svg}'
+
+
+def monthly_frame():
+    return pd.DataFrame({
+        'date': [f'2023-{month:02d}' for month in range(1, 7)],
+        'NDWI': [0.1, 0.12, np.nan, 0.3, 0.11, 0.1],
+        'NDCI': [0.05, 0.04, 0.06, 0.2, 0.05, 0.05],
+        'is_anomaly': [False, False, None, True, False, False],
+    })
+
+
+def png_size(path):
+    with open(path, 'rb') as handle:
+        header = handle.read(24)
+    assert header[:8] == b'\x89PNG\r\n\x1a\n'
+    return struct.unpack('>II', header[16:24])
+
+
+def test_series_payload():
+    payload = series_payload(monthly_frame(), 'Goa Coast')
+    assert payload['dates'][0] == '2023-01'
+    assert payload['series']['NDWI'][2] is None
+    assert payload['series']['NDCI'][3] == 0.2
+    assert payload['anomalies'] == [3]
+    # Only the indices present in the frame
+    assert list(series_payload(monthly_frame().drop(columns='NDCI'), 'Goa')['series']) == ['NDWI']
+
+
+def test_svg_has_a_line_per_index_and_a_marker_per_anomaly():
+    svg = ET.fromstring(render_svg(series_payload(monthly_frame(), 'Goa')))
+    lines = svg.findall(f'{SVG}polyline')
+    assert [line.get('stroke') for line in lines] == ['#1f4fd1', '#1a8a3a']
+    # The missing NDWI month has no point
+    assert [len(line.get('points').split()) for line in lines] == [5, 6]
+    assert len(svg.findall(f'{SVG}circle')) == 2
+    assert [text.text for text in svg.findall(f'{SVG}text')] == ['Water Index (NDWI)', 'Chlorophyll Index (NDCI)']
+
+
+def test_unknown_preset_is_rejected():
+    with pytest.raises(ValueError):
+        VisualizationRenderer(preset='poster')
+
+
+@pytest.mark.parametrize('preset', list(RENDER_PRESETS))
+def test_renderer_writes_every_format_in_a_worker_process(tmp_path, preset):
+    pytest.importorskip('matplotlib')
+    renderer = VisualizationRenderer(output_dir=str(tmp_path / 'charts'), preset=preset, max_workers=1)
+    try:
+        outputs = renderer.submit(monthly_frame(), 'Goa Coast').result(timeout=120)
+    finally:
+        renderer.shutdown()
+
+    basename = str(tmp_path / 'charts' / 'Goa_Coast_analysis')
+    assert {key: outputs[key] for key in ('png', 'json', 'svg')} == {
+        'png': f'{basename}.png', 'json': f'{basename}.json', 'svg': f'{basename}.svg'}
+    assert outputs['render_seconds'] >= 0
+
+    with open(outputs['json']) as handle:
+        assert json.load(handle) == series_payload(monthly_frame(), 'Goa Coast')
+    assert len(ET.parse(outputs['svg']).getroot().findall(f'{SVG}polyline')) == 2
+
+    # bbox_inches='tight' trims the margins, so the PNG is at most the preset's size
+    width, height = png_size(outputs['png'])
+    settings = RENDER_PRESETS[preset]
+    assert 0.5 < width / (settings['figsize'][0] * settings['dpi']) <= 1.05
+    assert 0.5 < height / (settings['figsize'][1] * settings['dpi']) <= 1.05
+
+
+def test_renderer_can_skip_formats(tmp_path):
+    renderer = VisualizationRenderer(output_dir=str(tmp_path), formats=('json', 'svg'), max_workers=1)
+    try:
+        outputs = renderer.submit(monthly_frame(), 'Kochi').result(timeout=60)
+    finally:
+        renderer.shutdown()
+    assert 'png' not in outputs
+    assert sorted(path.name for path in tmp_path.iterdir()) == ['Kochi_analysis.json', 'Kochi_analysis.svg']
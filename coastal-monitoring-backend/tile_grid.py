@@ -0,0 +1,30 @@
+# tile_grid.py
+import math
+
+
+def build_tile_grid(bounds, tile_size):
+    """Split a bounding box into tile_size-degree cells, row 0 at the south edge"""
+    min_lon, min_lat, max_lon, max_lat = bounds
+    cols = max(1, math.ceil(round((max_lon - min_lon) / tile_size, 9)))
+    rows = max(1, math.ceil(round((max_lat - min_lat) / tile_size, 9)))
+
+    tiles = []
+    for row in range(rows):
+        for col in range(cols):
+            west = min_lon + col * tile_size
+            south = min_lat + row * tile_size
+            east = min(west + tile_size, max_lon)
+            north = min(south + tile_size, max_lat)
+            tiles.append({
+                'tile_id': f'r{row:03d}c{col:03d}',
+                'row': row,
+                'col': col,
+                'bounds': [west, south, east, north],
+                'center': [(south + north) / 2, (west + east) / 2]
+            })
+    return tiles
+
+
+def chunked(items, size):
+    for start in range(0, len(items), size):
+        yield items[start:start + size]
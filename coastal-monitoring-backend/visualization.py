@@ -0,0 +1,157 @@
+# visualization.py
+import json
+import multiprocessing
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from xml.sax.saxutils import escape
+
+# Size/DPI presets; "report" matches the original 15x10 inch, 300 dpi PNGs
+RENDER_PRESETS = {
+    'report': {'figsize': (15, 10), 'dpi': 300},
+    'web': {'figsize': (10, 5), 'dpi': 100},
+    'thumbnail': {'figsize': (6, 3), 'dpi': 72},
+}
+
+SERIES_STYLES = {
+    'NDWI': {'color': 'b', 'svg_color': '#1f4fd1', 'title': 'Water Index (NDWI)'},
+    'NDCI': {'color': 'g', 'svg_color': '#1a8a3a', 'title': 'Chlorophyll Index (NDCI)'},
+}
+
+
+def series_payload(df, location, indices=('NDWI', 'NDCI')):
+    """Compact, picklable/JSON-ready form of the series a chart needs"""
+    anomalies = df['is_anomaly'].fillna(False).astype(bool).tolist() if 'is_anomaly' in df.columns else []
+    return {
+        'location': location,
+        'dates': df['date'].astype(str).tolist(),
+        'series': {
+            name: [None if value != value else round(float(value), 4) for value in df[name]]
+            for name in indices if name in df.columns
+        },
+        'anomalies': [i for i, flag in enumerate(anomalies) if flag],
+    }
+
+
+def render_png(payload, path, preset='web'):
+    """Render the two-panel chart with the Agg backend; safe to run in a worker process"""
+    import matplotlib
+    matplotlib.use('Agg')
+    from matplotlib.figure import Figure
+
+    settings = RENDER_PRESETS[preset]
+    # A bare Figure avoids pyplot's global state entirely
+    fig = Figure(figsize=settings['figsize'])
+    axes = fig.subplots(1, 2)
+    fig.suptitle(f"Coastal AI Analysis - {payload['location']}", fontsize=16, fontweight='bold')
+
+    dates = payload['dates']
+    for ax, name in zip(axes, ('NDWI', 'NDCI')):
+        values = payload['series'].get(name)
+        if values is None:
+            continue
+        style = SERIES_STYLES[name]
+        ax.plot(dates, values, f"{style['color']}-", linewidth=2, label=name)
+        if payload['anomalies']:
+            ax.scatter([dates[i] for i in payload['anomalies']],
+                       [values[i] for i in payload['anomalies']],
+                       color='red', s=100, label='Anomalies')
+        ax.set_title(style['title'])
+        ax.set_ylabel(f'{name} Value')
+        ax.tick_params(axis='x', rotation=45)
+        ax.legend()
+        ax.grid(True, alpha=0.3)
+
+    fig.tight_layout()
+    fig.savefig(path, dpi=settings['dpi'], bbox_inches='tight')
+    return path
+
+
+def render_svg(payload, width=640, height=240):
+    """Small hand-built SVG with one polyline per index, for the web frontend"""
+    names = [name for name in ('NDWI', 'NDCI') if name in payload['series']]
+    panel_width = width / max(1, len(names))
+    pad = 24
+    parts = [f'<svg xmlns="http://www.w3.org/2000/svg" width="{width}" height="{height}" '
+             f'viewBox="0 0 {width} {height}" font-family="sans-serif" font-size="11">']
+
+    for panel, name in enumerate(names):
+        values = payload['series'][name]
+        points = [(i, v) for i, v in enumerate(values) if v is not None]
+        x0 = panel * panel_width
+        parts.append(f'<text x="{x0 + pad:.0f}" y="14">{escape(SERIES_STYLES[name]["title"])}</text>')
+        if not points:
+            continue
+        low = min(v for _, v in points)
+        high = max(v for _, v in points)
+        span = (high - low) or 1.0
+        steps = max(1, len(values) - 1)
+
+        def xy(i, v):
+            x = x0 + pad + i * (panel_width - 2 * pad) / steps
+            y = height - pad - (v - low) * (height - 2 * pad) / span
+            return f'{x:.1f},{y:.1f}'
+
+        parts.append(f'<polyline fill="none" stroke="{SERIES_STYLES[name]["svg_color"]}" stroke-width="2" '
+                     f'points="{" ".join(xy(i, v) for i, v in points)}"/>')
+        for i in payload['anomalies']:
+            if values[i] is not None:
+                x, y = xy(i, values[i]).split(',')
+                parts.append(f'<circle cx="{x}" cy="{y}" r="4" fill="red"/>')
+
+    parts.append('</svg>')
+    return ''.join(parts)
+
+
+def render_outputs(payload, basename, preset='web', formats=('png', 'json', 'svg')):
+    """Write the requested formats; returns {format: path} plus render timing"""
+    start = time.perf_counter()
+    outputs = {}
+    if 'png' in formats:
+        outputs['png'] = render_png(payload, f'{basename}.png', preset)
+    if 'json' in formats:
+        with open(f'{basename}.json', 'w') as handle:
+            json.dump(payload, handle, separators=(',', ':'))
+        outputs['json'] = f'{basename}.json'
+    if 'svg' in formats:
+        with open(f'{basename}.svg', 'w') as handle:
+            handle.write(render_svg(payload))
+        outputs['svg'] = f'{basename}.svg'
+    outputs['render_seconds'] = round(time.perf_counter() - start, 3)
+    return outputs
+
+
+class VisualizationRenderer:
+    """Renders charts in a process pool so plotting never blocks the pipeline threads"""
+
+    def __init__(self, output_dir='.', preset='web', formats=('png', 'json', 'svg'), max_workers=None):
+        if preset not in RENDER_PRESETS:
+            raise ValueError(f"Unknown visualization preset: {preset}")
+        self.output_dir = output_dir
+        self.preset = preset
+        self.formats = tuple(formats)
+        self.max_workers = max_workers
+        self.executor = None
+
+    def get_executor(self):
+        if self.executor is None:
+            # spawn keeps worker processes clear of the parent's threads and locks
+            self.executor = ProcessPoolExecutor(
+                max_workers=self.max_workers,
+                mp_context=multiprocessing.get_context('spawn')
+            )
+        return self.executor
+
+    def submit(self, df, location):
+        """Queue rendering for a location; returns a future of the output paths"""
+        if self.output_dir:
+            os.makedirs(self.output_dir, exist_ok=True)
+        basename = os.path.join(self.output_dir, f"{location.replace(' ', '_')}_analysis")
+        return self.get_executor().submit(
+            render_outputs, series_payload(df, location), basename, self.preset, self.formats
+        )
+
+    def shutdown(self):
+        if self.executor is not None:
+            self.executor.shutdown(wait=True)
+            self.executor = None